@@ -0,0 +1,656 @@
+""" In-process benchmarks of training-step throughput.
+
+A *scenario* specifies a config (env, updater, etc.) and the kind of step to time: updater steps
+("update"), evaluation steps ("evaluate"), iteration through the env's training dataset ("dataset"),
+or an arbitrary step function built by `cfg.build_benchmark_step` ("custom").
+For each scenario, batch size and thread configuration, a fresh graph and session are created,
+the step is run `n_warmup` times without being timed, and then `n_steps` times with the latency
+of each step recorded.
+
+Results are emitted as JSON, and can be compared against a stored baseline; any configuration whose
+step latency has increased by more than `tolerance` (relative) is reported as a regression.
+
+Example usage:
+
+    dps-benchmark sl_update rl_update --batch-sizes 16 64 --intra 1 4 --inter 1 2 \
+        --output results.json --baseline baseline.json --tolerance 0.1
+
+    dps-benchmark replay_rank replay_rank_lazy replay_proportional --batch-sizes 32 256
+
+    dps-benchmark trpo_update trpo_update_in_graph --batch-sizes 16 64
+
+    dps-benchmark summary_writes summary_writes_buffered summary_writes_downsampled
+
+    dps-benchmark object_game_entities object_game_entities_large object_game_step_large --batch-sizes 1 16
+
+    dps-benchmark tf_env_grid tf_env_room tf_env_path_discovery tf_env_grid_bandit tf_env_cliff_walk --batch-sizes 16 256
+
+    dps-benchmark tf_env_grid_bandit tf_env_grid_bandit_unroll tf_env_cliff_walk tf_env_cliff_walk_unroll \
+        --batch-sizes 16 256 4096 65536
+
+Results include the number of ops in the graph once the step has been built (`n_graph_ops`), and for
+scenarios that step an env, the number of env steps (summed over the batch) per second (`env_steps_per_sec`).
+
+"""
+import argparse
+import json
+import shutil
+import sys
+import time
+import warnings
+from itertools import product
+
+import numpy as np
+import tensorflow as tf
+
+from dps import cfg
+from dps.config import DEFAULT_CONFIG
+from dps.datasets.base import Dataset, ArrayFeature
+from dps.updater import DataManager, DifferentiableUpdater
+from dps.utils import Config, Param, NumpySeed
+from dps.utils.tf import MLP, uninitialized_variables_initializer, unrolled_while_loop
+
+
+class Scenario(object):
+    """ A benchmarking scenario.
+
+    Parameters
+    ----------
+    name: str
+        Name of the scenario.
+    build_config: callable
+        Returns the Config that the scenario is run under. Called lazily so that
+        scenarios can be registered without importing their dependencies.
+    kind: str
+        One of "update", "evaluate", "dataset", "custom". For "custom" scenarios, the config must
+        contain a callable `build_benchmark_step`, which accepts a batch size and returns a pair
+        (env or None, step function).
+    n_steps: int
+        Default number of timed steps.
+    n_warmup: int
+        Default number of un-timed warm-up steps.
+
+    """
+    kinds = "update evaluate dataset custom".split()
+
+    def __init__(self, name, build_config, kind="update", n_steps=100, n_warmup=10):
+        if kind not in self.kinds:
+            raise Exception("Unknown scenario kind {}, must be one of {}.".format(kind, self.kinds))
+
+        self.name = name
+        self.build_config = build_config
+        self.kind = kind
+        self.n_steps = n_steps
+        self.n_warmup = n_warmup
+
+    def __str__(self):
+        return "Scenario(name={}, kind={})".format(self.name, self.kind)
+
+    def __repr__(self):
+        return str(self)
+
+
+scenarios = {}
+
+
+def register_scenario(name, build_config, kind="update", n_steps=100, n_warmup=10):
+    if name in scenarios:
+        raise Exception("Scenario with name {} already registered.".format(name))
+    scenario = Scenario(name, build_config, kind, n_steps, n_warmup)
+    scenarios[name] = scenario
+    return scenario
+
+
+def latency_stats(latencies, batch_size):
+    """ Summary statistics (in seconds) for a list of per-step latencies. """
+    latencies = np.array(latencies, dtype='d')
+    mean = float(latencies.mean())
+    return dict(
+        n_steps=len(latencies),
+        mean=mean,
+        std=float(latencies.std()),
+        min=float(latencies.min()),
+        max=float(latencies.max()),
+        p50=float(np.percentile(latencies, 50)),
+        p99=float(np.percentile(latencies, 99)),
+        steps_per_sec=1. / mean if mean > 0 else np.inf,
+        examples_per_sec=batch_size / mean if mean > 0 else np.inf,
+    )
+
+
+def _build_step(kind, batch_size):
+    if kind == "custom":
+        return cfg.build_benchmark_step(batch_size)
+
+    env = cfg.build_env()
+
+    if kind == "dataset":
+        data_manager = env.data_manager
+        get_next = data_manager.iterator.get_next()
+
+        def step():
+            tf.get_default_session().run(get_next, feed_dict=data_manager.do_train())
+
+        return env, step
+
+    updater = cfg.get_updater(env)
+    updater.stage_idx = 0
+    updater.exp_dir = None
+    updater.build_graph()
+
+    if kind == "update":
+        def step():
+            updater.update(batch_size)
+    else:
+        def step():
+            updater.evaluate(batch_size, mode="val")
+
+    return env, step
+
+
+def run_scenario(scenario, batch_size=None, intra_op_threads=0, inter_op_threads=0, n_steps=None, n_warmup=None):
+    """ Run a single scenario with a single setting of batch size and thread counts.
+
+    Returns a dictionary containing the settings and summary statistics of step latency.
+
+    """
+    if isinstance(scenario, str):
+        scenario = scenarios[scenario]
+
+    n_steps = scenario.n_steps if n_steps is None else n_steps
+    n_warmup = scenario.n_warmup if n_warmup is None else n_warmup
+
+    config = DEFAULT_CONFIG.copy()
+    config.update(scenario.build_config())
+    config.update(
+        start_tensorboard=False,
+        use_gpu=False,
+        hooks=[],
+        render_hook=None,
+        intra_op_parallelism_threads=intra_op_threads,
+        inter_op_parallelism_threads=inter_op_threads,
+    )
+    if batch_size is not None:
+        config.batch_size = batch_size
+
+    if config.seed is None or config.seed < 0:
+        config.seed = 0
+
+    with config, NumpySeed(config.seed):
+        session_config = tf.ConfigProto()
+        session_config.intra_op_parallelism_threads = intra_op_threads
+        session_config.inter_op_parallelism_threads = inter_op_threads
+
+        graph = tf.Graph()
+        sess = tf.Session(graph=graph, config=session_config)
+
+        with graph.as_default(), graph.device("/cpu:0"), sess, sess.as_default():
+            tf.set_random_seed(config.seed)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('once')
+                build_start = time.time()
+                env, step = _build_step(scenario.kind, cfg.batch_size)
+
+            tf.train.get_or_create_global_step()
+            sess.run(uninitialized_variables_initializer())
+            build_duration = time.time() - build_start
+
+            for i in range(n_warmup):
+                step()
+
+            latencies = []
+            for i in range(n_steps):
+                start = time.time()
+                step()
+                latencies.append(time.time() - start)
+
+            close = getattr(env, "close", None)
+            if callable(close):
+                close()
+
+        result = dict(
+            scenario=scenario.name,
+            kind=scenario.kind,
+            batch_size=cfg.batch_size,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            n_warmup=n_warmup,
+            build_duration=build_duration,
+            n_graph_ops=len(graph.get_operations()),
+        )
+        result.update(latency_stats(latencies, cfg.batch_size))
+
+        n_env_steps = getattr(step, "n_env_steps", None)
+        if n_env_steps is not None:
+            result.update(env_steps_per_sec=n_env_steps / result['mean'] if result['mean'] > 0 else np.inf)
+
+    return result
+
+
+def run_benchmarks(names=None, batch_sizes=None, intra_op_threads=(0,), inter_op_threads=(0,),
+                   n_steps=None, n_warmup=None, verbose=True):
+    """ Run every combination of scenario, batch size, and thread counts. """
+    names = names or sorted(scenarios)
+    batch_sizes = batch_sizes or [None]
+
+    results = []
+    for name, batch_size, intra, inter in product(names, batch_sizes, intra_op_threads, inter_op_threads):
+        result = run_scenario(name, batch_size, intra, inter, n_steps=n_steps, n_warmup=n_warmup)
+        results.append(result)
+
+        if verbose:
+            print("{scenario} (batch_size={batch_size}, intra={intra_op_threads}, inter={inter_op_threads}): "
+                  "mean={mean:.5f}s, p50={p50:.5f}s, p99={p99:.5f}s".format(**result))
+
+    return results
+
+
+def _result_key(result):
+    return (result['scenario'], result['batch_size'], result['intra_op_threads'], result['inter_op_threads'])
+
+
+def compare_to_baseline(results, baseline, tolerance=0.1, stats=("p50",)):
+    """ Compare benchmark results against baseline results.
+
+    Parameters
+    ----------
+    results: list of dict
+        Output of `run_benchmarks`.
+    baseline: list of dict
+        Output of a previous call to `run_benchmarks`.
+    tolerance: float
+        Maximum allowed relative increase in each statistic.
+    stats: list of str
+        Latency statistics to compare.
+
+    Returns
+    -------
+    A list of strings, one for each regression found. Results with no matching
+    configuration in `baseline` are ignored.
+
+    """
+    baseline = {_result_key(b): b for b in baseline}
+    regressions = []
+
+    for result in results:
+        key = _result_key(result)
+        if key not in baseline:
+            continue
+
+        for stat in stats:
+            old, new = baseline[key][stat], result[stat]
+            if new > old * (1 + tolerance):
+                regressions.append(
+                    "{} (batch_size={}, intra={}, inter={}): {} increased from {:.5f}s "
+                    "to {:.5f}s ({:+.1f}%, tolerance is {:.1f}%).".format(
+                        *key, stat, old, new, 100 * (new / old - 1), 100 * tolerance))
+
+    return regressions
+
+
+def benchmark_cl():
+    parser = argparse.ArgumentParser(description="Run in-process training-step benchmarks.")
+    parser.add_argument('scenarios', nargs='*', help="Scenarios to run; runs all registered scenarios by default.")
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=None)
+    parser.add_argument('--intra', nargs='+', type=int, default=[0], help="intra_op_parallelism_threads values.")
+    parser.add_argument('--inter', nargs='+', type=int, default=[0], help="inter_op_parallelism_threads values.")
+    parser.add_argument('--n-steps', type=int, default=None)
+    parser.add_argument('--n-warmup', type=int, default=None)
+    parser.add_argument('--output', default=None, help="Path to write JSON results to; stdout if not supplied.")
+    parser.add_argument('--baseline', default=None, help="Path to JSON results to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--stats', nargs='+', default=["p50"])
+    parser.add_argument('--list', action='store_true', help="List registered scenarios and exit.")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in sorted(scenarios.items()):
+            print(scenario)
+        return
+
+    unknown = [s for s in args.scenarios if s not in scenarios]
+    if unknown:
+        raise Exception("Unknown scenarios: {}. Registered scenarios are: {}.".format(unknown, sorted(scenarios)))
+
+    results = run_benchmarks(
+        args.scenarios, args.batch_sizes, args.intra, args.inter,
+        n_steps=args.n_steps, n_warmup=args.n_warmup, verbose=args.output is not None)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=4, sort_keys=True)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.stats)
+
+        if regressions:
+            print("Found {} regression(s) relative to baseline {}:".format(len(regressions), args.baseline))
+            for r in regressions:
+                print(r)
+            sys.exit(1)
+        else:
+            print("No regressions relative to baseline {}.".format(args.baseline))
+
+
+# ----- Built-in scenarios -----
+
+
+class SyntheticRegressionDataset(Dataset):
+    """ Random linear regression problem, used as a cheap stand-in for real datasets when benchmarking. """
+    x_dim = Param(32)
+    y_dim = Param(4)
+
+    @property
+    def features(self):
+        return [ArrayFeature("x", (self.x_dim,)), ArrayFeature("y", (self.y_dim,))]
+
+    def _make(self):
+        weights = np.random.randn(self.x_dim, self.y_dim)
+        for i in range(self.n_examples):
+            x = np.random.randn(self.x_dim)
+            self._write_example(x=x, y=x @ weights)
+
+
+class SyntheticRegressionEnv(object):
+    def __init__(self):
+        self.dataset = SyntheticRegressionDataset(n_examples=cfg.n_train, seed=0)
+        self.data_manager = DataManager(train_dataset=self.dataset, val_dataset=self.dataset, batch_size=cfg.batch_size)
+        self.data_manager.build_graph()
+
+    def build(self, f):
+        data = self.data_manager.iterator.get_next()
+        prediction = f(data['x'], self.dataset.y_dim, self.data_manager.is_training)
+        return dict(loss=tf.reduce_mean((prediction - data['y'])**2))
+
+    def close(self):
+        pass
+
+
+def _sl_config():
+    return Config(
+        build_env=SyntheticRegressionEnv,
+        get_updater=lambda env: DifferentiableUpdater(env, MLP(n_units=[128, 128], scope="benchmark_mlp")),
+        n_train=10000,
+        batch_size=64,
+        optimizer_spec="adam",
+        lr_schedule=1e-4,
+        noise_schedule=None,
+        max_grad_norm=None,
+    )
+
+
+def _rl_config():
+    from dps.env.basic import collect
+    from dps.rl.algorithms import a2c
+
+    config = collect.config.copy()
+    config.update(a2c.config)
+    config.update(n_collectables=5, n_obstacles=5, T=20, batch_size=16)
+    return config
+
+
+def _rl_host_sampler_config():
+    config = _rl_config()
+    config.update(rollout_sampler="host")
+    return config
+
+
+def _acer_config():
+    from dps.rl.algorithms import acer
+
+    config = _rl_config()
+    config.update(acer.config)
+    return config
+
+
+def _trpo_config(in_graph):
+    from dps.env.basic import collect
+    from dps.rl.algorithms import trpo
+
+    config = collect.config.copy()
+    config.update(trpo.config)
+    config.update(n_collectables=5, n_obstacles=5, T=20, batch_size=16, trpo_in_graph=in_graph)
+    return config
+
+
+def build_rollout_batch_step(batch_size):
+    """ Exercises the RolloutBatch operations performed on the update path of `RLUpdater`: building rollouts
+        one step at a time, splitting them into a replay buffer, re-joining sampled experiences, and
+        extracting arrays to feed to the graph. Does not use tensorflow. """
+    from dps.rl import RolloutBatch, RLContext
+
+    T, obs_shape, action_shape = cfg.T, (cfg.obs_dim,), (1,)
+
+    def step():
+        rollouts = RolloutBatch(capacity=T)
+        for t in range(T):
+            rollouts.append(
+                np.zeros((batch_size,) + obs_shape, dtype='f'),
+                np.zeros((batch_size,) + action_shape, dtype='f'),
+                np.zeros((batch_size, 1), dtype='f'),
+                done=np.zeros((batch_size, 1), dtype='f'),
+                log_probs=np.zeros((batch_size, 1), dtype='f'),
+                utils=np.zeros((batch_size, 3), dtype='f'))
+
+        experiences = rollouts.split()
+        indices = np.random.randint(len(experiences), size=batch_size)
+        replayed = RolloutBatch.join([experiences[i] for i in indices])
+
+        for r in [rollouts, replayed]:
+            for k in "obs actions rewards done log_probs utils".split():
+                RLContext.at_least_3d(r[k])
+
+    return None, step
+
+
+def _rollout_batch_config():
+    return Config(build_benchmark_step=build_rollout_batch_step, T=20, obs_dim=100, batch_size=16)
+
+
+def build_replay_step(batch_size):
+    """ Exercises a prioritized replay buffer the way `RLUpdater` does on each update: add a batch of rollouts,
+        sample a batch of experiences, then update the priorities of the sampled experiences. The
+        variant is selected by `cfg.prioritization`, either "rank" or "proportional". """
+    from dps.rl import RolloutBatch, RLContext, PrioritizedReplayBuffer, ProportionalPrioritizedReplayBuffer
+
+    with RLContext(1.0):
+        if cfg.prioritization == "rank":
+            replay_buffer = PrioritizedReplayBuffer(
+                cfg.replay_size, cfg.replay_n_partitions, None, cfg.alpha, cfg.beta_schedule,
+                resort_interval=cfg.get('replay_resort_interval', None))
+
+            # Normally built by the RLContext.
+            replay_buffer.beta = tf.constant(cfg.beta_schedule, tf.float32)
+        elif cfg.prioritization == "proportional":
+            replay_buffer = ProportionalPrioritizedReplayBuffer(
+                cfg.replay_size, None, cfg.alpha, cfg.beta_schedule)
+        else:
+            raise Exception("Unknown prioritization: {}".format(cfg.prioritization))
+
+    T, obs_shape = cfg.T, (cfg.obs_dim,)
+
+    def make_rollouts():
+        return RolloutBatch(
+            np.random.randn(T, cfg.rollouts_per_step, *obs_shape).astype('f'),
+            np.zeros((T, cfg.rollouts_per_step, 1), dtype='f'),
+            np.zeros((T, cfg.rollouts_per_step, 1), dtype='f'),
+            done=np.zeros((T, cfg.rollouts_per_step, 1), dtype='f'))
+
+    while replay_buffer.n_experiences < replay_buffer.size:
+        replay_buffer.add_rollouts(make_rollouts())
+
+    def step():
+        replay_buffer.add_rollouts(make_rollouts())
+        replay_buffer.get_batch(batch_size)
+        replay_buffer.update_priority(np.random.rand(batch_size))
+
+    return None, step
+
+
+def _replay_config(prioritization, resort_interval=None):
+    return Config(
+        build_benchmark_step=build_replay_step, prioritization=prioritization,
+        replay_resort_interval=resort_interval,
+        replay_size=20000, replay_n_partitions=100, alpha=0.7, beta_schedule=0.5,
+        T=10, obs_dim=16, rollouts_per_step=8, batch_size=64)
+
+
+def build_summary_step(batch_size):
+    """ Writes a record of `cfg.n_summary_scalars` scalars to a tensorboard FileWriter through a
+        ScalarSummaryBuffer, `batch_size` times per step. The writer's own time is included, so
+        comparing `summary_flush_step` = 1 (no buffering) with larger values measures what buffering saves. """
+    import tempfile
+    from dps.train import ScalarSummaryBuffer
+
+    directory = tempfile.mkdtemp()
+    writer = tf.summary.FileWriter(directory)
+    buf = ScalarSummaryBuffer(writer, flush_step=cfg.summary_flush_step, downsample=cfg.summary_downsample)
+    record = {"scalar_{}".format(i): float(i) for i in range(cfg.n_summary_scalars)}
+    counter = [0]
+
+    def step():
+        for i in range(batch_size):
+            buf.add(record, counter[0])
+            counter[0] += 1
+
+    class SummaryEnv(object):
+        def close(self):
+            buf.flush()
+            writer.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return SummaryEnv(), step
+
+
+def _summary_config(flush_step, downsample=False):
+    return Config(
+        build_benchmark_step=build_summary_step, summary_flush_step=flush_step,
+        summary_downsample=downsample, n_summary_scalars=20, batch_size=100)
+
+
+def build_object_game_step(batch_size):
+    """ Steps `batch_size` separate CollectA games with random actions (`cfg.object_game_call` = "step"),
+        or only computes their entity observations (`cfg.object_game_call` = "get_entities"). Does not use tensorflow. """
+    from dps.env.basic import collect
+
+    games = [collect.CollectA() for i in range(batch_size)]
+    for game in games:
+        game.reset()
+
+    if cfg.object_game_call == "get_entities":
+        def step():
+            for game in games:
+                game.get_entities()
+    elif cfg.object_game_call == "step":
+        def step():
+            for game in games:
+                game.step((np.random.randint(8), np.random.randint(3)))
+    else:
+        raise Exception("Unknown object_game_call: {}".format(cfg.object_game_call))
+
+    return None, step
+
+
+def _object_game_config(n_entities, call):
+    from dps.env.basic import collect
+
+    # Entities are 10x10; make the field large enough that they are not crammed together.
+    size = int(10 * np.ceil(np.sqrt(4 * n_entities)))
+
+    config = collect.config.copy()
+    config.update(
+        build_benchmark_step=build_object_game_step, object_game_call=call,
+        n_collectables=n_entities // 2, n_obstacles=n_entities // 2, max_overlap=1.0,
+        image_shape=(size, size), max_episode_length=0, batch_size=16)
+    return config
+
+
+def build_tensorflow_env_step(batch_size):
+    """ Runs a `cfg.T`-step tf.while_loop which steps the TensorFlowEnv `cfg.tf_env_class` with random actions,
+        by calling its `build_init` and `build_step` methods directly (no policy is built). Each iteration
+        of the loop takes `cfg.tf_env_unroll_steps` steps. """
+    # These envs implement `build_init` rather than `build_reset`, which TensorFlowEnv declares abstract.
+    env_class = type(cfg.tf_env_class.__name__, (cfg.tf_env_class,), dict(build_reset=lambda self, r: self.build_init(r)))
+    env = env_class()
+    env._build_placeholders()
+
+    n_actions = len(env.action_names)
+    registers = env.build_init(env.rb.new_array(batch_size, lib='tf'))
+
+    def body(t, registers, total_reward):
+        if cfg.tf_env_continuous_actions:
+            actions = tf.random_normal((batch_size, n_actions))
+        else:
+            actions = tf.one_hot(tf.random_uniform((batch_size,), maxval=n_actions, dtype=tf.int32), n_actions)
+        _, reward, registers = env.build_step(t, registers, actions)
+        return t + 1, registers, total_reward + reward
+
+    unroll = cfg.tf_env_unroll_steps
+    _, _, total_reward = unrolled_while_loop(
+        lambda t, *_: t < cfg.T, body, [tf.constant(0), registers, tf.zeros((batch_size, 1))],
+        unroll=unroll, guard=cfg.T % unroll != 0, parallel_iterations=cfg.tf_env_parallel_iterations,
+        shape_invariants=[tf.TensorShape([]), tf.TensorShape([None, env.rb.width]), tf.TensorShape([None, 1])])
+
+    feed_dict = env._make_feed_dict(batch_size, cfg.T, 'train')
+
+    def step():
+        tf.get_default_session().run(total_reward, feed_dict=feed_dict)
+
+    step.n_env_steps = batch_size * cfg.T
+
+    return env, step
+
+
+def _tensorflow_env_config(env_name, env_class, continuous_actions=False, unroll_steps=1, parallel_iterations=1, **kwargs):
+    from importlib import import_module
+    module = import_module("dps.env.basic." + env_name)
+
+    config = module.config.copy()
+    config.update(
+        build_benchmark_step=build_tensorflow_env_step, tf_env_class=getattr(module, env_class),
+        tf_env_continuous_actions=continuous_actions, tf_env_unroll_steps=unroll_steps,
+        tf_env_parallel_iterations=parallel_iterations, n_val=16, batch_size=16)
+    config.update(kwargs)
+    return config
+
+
+register_scenario("sl_update", _sl_config, kind="update")
+register_scenario("sl_evaluate", _sl_config, kind="evaluate", n_steps=20, n_warmup=2)
+register_scenario("dataset", _sl_config, kind="dataset")
+register_scenario("rl_update", _rl_config, kind="update", n_steps=20, n_warmup=2)
+register_scenario("rl_evaluate", _rl_config, kind="evaluate", n_steps=10, n_warmup=1)
+register_scenario("rl_update_host", _rl_host_sampler_config, kind="update", n_steps=20, n_warmup=2)
+register_scenario("rl_evaluate_host", _rl_host_sampler_config, kind="evaluate", n_steps=10, n_warmup=1)
+register_scenario("rl_update_replay", _acer_config, kind="update", n_steps=20, n_warmup=2)
+register_scenario("trpo_update", lambda: _trpo_config(False), kind="update", n_steps=20, n_warmup=2)
+register_scenario("trpo_update_in_graph", lambda: _trpo_config(True), kind="update", n_steps=20, n_warmup=2)
+register_scenario("rollout_batch", _rollout_batch_config, kind="custom", n_steps=100, n_warmup=5)
+register_scenario("replay_rank", lambda: _replay_config("rank"), kind="custom", n_steps=200, n_warmup=10)
+register_scenario("replay_rank_lazy", lambda: _replay_config("rank", 10), kind="custom", n_steps=200, n_warmup=10)
+register_scenario("replay_proportional", lambda: _replay_config("proportional"), kind="custom", n_steps=200, n_warmup=10)
+register_scenario("summary_writes", lambda: _summary_config(1), kind="custom", n_steps=50, n_warmup=2)
+register_scenario("summary_writes_buffered", lambda: _summary_config(100), kind="custom", n_steps=50, n_warmup=2)
+register_scenario(
+    "summary_writes_downsampled", lambda: _summary_config(100, True), kind="custom", n_steps=50, n_warmup=2)
+register_scenario("object_game_entities", lambda: _object_game_config(20, "get_entities"), kind="custom", n_steps=200, n_warmup=10)
+register_scenario(
+    "object_game_entities_large", lambda: _object_game_config(500, "get_entities"), kind="custom", n_steps=100, n_warmup=5)
+register_scenario("object_game_step_large", lambda: _object_game_config(500, "step"), kind="custom", n_steps=20, n_warmup=2)
+register_scenario("tf_env_grid", lambda: _tensorflow_env_config("grid", "Grid"), kind="custom")
+register_scenario("tf_env_room", lambda: _tensorflow_env_config("room", "Room", continuous_actions=True), kind="custom")
+register_scenario("tf_env_path_discovery", lambda: _tensorflow_env_config("path_discovery", "PathDiscovery"), kind="custom")
+register_scenario("tf_env_grid_bandit", lambda: _tensorflow_env_config("grid_bandit", "GridBandit"), kind="custom")
+register_scenario("tf_env_cliff_walk", lambda: _tensorflow_env_config("cliff_walk", "CliffWalk"), kind="custom")
+register_scenario(
+    "tf_env_grid_bandit_unroll",
+    lambda: _tensorflow_env_config("grid_bandit", "GridBandit", unroll_steps=5, parallel_iterations=10), kind="custom")
+register_scenario(
+    "tf_env_cliff_walk_unroll",
+    lambda: _tensorflow_env_config("cliff_walk", "CliffWalk", unroll_steps=5, parallel_iterations=10), kind="custom")
@@ -55,8 +55,34 @@ DEFAULT_CONFIG = SYSTEM_CONFIG.copy(
     readme="",
     hooks=[],
     overwrite_plots=True,
+
+    # Number of MPI processes. With n_procs > 1, updaters that support it (e.g. A2C) train data-parallel:
+    # every process collects its own rollouts, and gradients are averaged over processes before being applied.
     n_procs=1,
     profile=False,
+
+    # Full tensorflow tracing of update steps. Steps `trace_start` to `trace_start + trace_n_steps - 1`
+    # are traced; if `trace_every` > 0, the window repeats every `trace_every` steps.
+    # Disabled when `trace_start` is negative.
+    trace_start=-1,
+    trace_n_steps=1,
+    trace_every=0,
+    trace_top_k=20,
+
+    # Scalar summaries are buffered and passed to tensorboard writers every `summary_flush_step` steps.
+    # If `summary_downsample` is True, each flush writes only the mean of the buffered values.
+    summary_flush_step=1,
+    summary_downsample=False,
+
+    # Resource usage is sampled in a background thread every `resource_monitor_interval` seconds.
+    # If physical memory use exceeds `memory_ceiling_mb`, the current stage is checkpointed
+    # and training stops.
+    resource_monitor_interval=1.0,
+    memory_ceiling_mb=None,
+
+    # Runs with the same `environment_key` (e.g. all runs in a hyper-parameter search) on the same host
+    # share a single recording of the host environment (git summary, pip freeze, etc.).
+    environment_key=None,
 )
 
 
@@ -71,10 +97,25 @@ RL_EXPERIMENT_CONFIG = DEFAULT_CONFIG.copy(
     gamma=1.0,
     opt_steps_per_update=1,
 
+    # If True, each update transfers its batch into the graph once, and the optimizer selects
+    # minibatches (and repeats epochs) in the graph instead of re-feeding slices of the batch.
+    in_graph_batching=False,
+
+    # If > 0, off-policy learners (those with a replay buffer) are fed by `n_actors` actor processes which
+    # generate rollouts concurrently with learning, using parameters published every `param_broadcast_interval` updates.
+    n_actors=0,
+    param_broadcast_interval=1,
+
     display_step=100,
     eval_step=100,
     patience=np.inf,
     max_steps=1000000,
+
+    # Evaluation rollouts are generated in batches of at most `eval_batch_size` (None: all in one batch).
+    # Independent evaluation jobs (e.g. one per learner in RolloutsHook) run in `n_eval_threads` threads.
+    eval_batch_size=None,
+    n_eval_threads=1,
+
     power_through=False,
 )
 
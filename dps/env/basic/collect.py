@@ -1,16 +1,20 @@
 import numpy as np
 import gym
 import copy
-import matplotlib.pyplot as plt
 from matplotlib import animation
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from dps import cfg
 from dps.env.basic import game
 from dps.env.env import BatchGymEnv
-from dps.utils import Param, square_subplots, create_maze
+from dps.utils import Param, create_maze
 from dps.train import Hook
 from dps.utils.tf import FeedforwardCell, MLP, ScopedFunction
+from dps.rl import EvaluationScheduler, EvaluationPool
 from dps.rl.policy import Policy, ProductDist, SigmoidNormal, Softmax
 
 
@@ -60,7 +64,7 @@ class CollectBase(game.ObjectGame):
             y = self.step_size * magnitude * np.sin(angle)
             x = self.step_size * magnitude * np.cos(angle)
         else:
-            y, x, magnitude = action
+            y, x, magnitude = np.asarray(action, dtype='d')
             y = np.clip(y, -1, 1)
             x = np.clip(x, -1, 1)
             magnitude = np.clip(magnitude, 0, 1)
@@ -74,6 +78,17 @@ class CollectBase(game.ObjectGame):
 
         return self._move_entity(self.entities[0], y, x)
 
+    def batch_action_to_step(self, actions):
+        if self.discrete_actions:
+            actions = np.asarray(actions)
+            angle = actions[:, 0] * 2 * np.pi / 8
+            magnitude = np.array([0.1, 0.5, 1.0])[actions[:, 1].astype('i')]
+            y = self.step_size * magnitude * np.sin(angle)
+            x = self.step_size * magnitude * np.cos(angle)
+            return y, x
+        else:
+            return game.continuous_action_to_step(actions, self.step_size)
+
     def resolve_collision(self, mover, other):
         """ Return (kill, stop, reward) """
         if isinstance(other, str):  # wall
@@ -96,6 +111,14 @@ class CollectBase(game.ObjectGame):
         else:
             return 0.0
 
+    def batch_compute_reward(self, batch_game):
+        if self.time_reward:
+            collectable = batch_game.entity_attr("collectable", False).astype(bool)
+            n_alive = (collectable & batch_game.alive).sum(axis=1)
+            return -n_alive / (self.n_collectables * cfg.T)
+        else:
+            return np.zeros(batch_game.n_games)
+
 
 class CollectA(CollectBase):
     n_collectables = Param()
@@ -240,69 +263,180 @@ class CollectD(CollectBase):
         return entities
 
 
+def _build_rollouts_env(env_class, env_kwargs):
+    return BatchGymEnv(gym_env=env_class(**env_kwargs))
+
+
+def save_animation(frames, path):
+    """ Save an animated gif of a batch of rollouts. `frames` has shape (T, batch_size, *image_shape).
+
+    Does not use pyplot, so may be called from a thread other than the main thread.
+
+    """
+    batch_size = frames.shape[1]
+    n_cols = int(np.ceil(np.sqrt(batch_size)))
+    n_rows = int(np.ceil(batch_size / n_cols))
+
+    fig = Figure(figsize=(5, 5))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(n_rows, n_cols, squeeze=False)
+    fig.subplots_adjust(top=0.95, bottom=0, left=0, right=1, wspace=0.1, hspace=0.1)
+
+    images = []
+    for i, ax in enumerate(axes.flatten()):
+        ax.set_aspect("equal")
+        ax.set_axis_off()
+        image = ax.imshow(np.zeros(frames.shape[2:]))
+        images.append(image)
+
+    def animate(t):
+        for i in range(batch_size):
+            images[i].set_array(frames[t, i, :, :, :])
+
+    anim = animation.FuncAnimation(fig, animate, frames=len(frames), interval=500)
+    anim.save(path, writer='imagemagick')
+
+
 class RolloutsHook(Hook):
-    def __init__(self, env_class, plot_step=None, env_kwargs=None, **kwargs):
+    """ Evaluate the learners on an instance of `env_class`, and periodically save an animation of the rollouts.
+
+    If `n_workers` is 0, rollouts are generated in the training process. Otherwise, they are generated in the
+    background by a pool of `n_workers` processes (shared by all RolloutsHooks with the same value of `n_workers`)
+    against a snapshot of the learners' parameters taken when the hook runs. Training continues in the meantime,
+    and results are recorded the next time the hook runs after they become available, along with the step at which
+    the snapshot was taken (`<name>-eval_step`). When the hook runs at the end of a stage, it waits for its results.
+
+    Animations are encoded in a background thread in either case.
+
+    """
+    _pools = {}
+
+    def __init__(self, env_class, plot_step=None, env_kwargs=None, n_workers=0, **kwargs):
         self.env_class = env_class
         self.env_kwargs = env_kwargs or {}
         kwarg_string = "_".join("{}={}".format(k, v) for k, v in self.env_kwargs.items())
         name = env_class.__name__ + ("_" + kwarg_string if kwarg_string else "")
         self.name = name.replace(" ", "_")
         self.plot_step = plot_step
+        self.n_workers = n_workers
         super(RolloutsHook, self).__init__(final=True, **kwargs)
 
-    def start_stage(self, training_loop, updater, stage_idx):
-        gym_env = self.env_class(**self.env_kwargs)
-        self.env = BatchGymEnv(gym_env=gym_env)
-
-    def plot(self, updater, rollouts):
-        plt.ion()
+    def _attrs(self):
+        return super(RolloutsHook, self)._attrs() + "env_class env_kwargs plot_step n_workers".split()
 
-        if updater.env.gym_env.image_obs:
-            obs = rollouts.obs
+    def start_stage(self, training_loop, updater, stage_idx):
+        self.scheduler = EvaluationScheduler()
+        self.animation_executor = ThreadPoolExecutor(1)
+        self.pending = []
+
+        if self.n_workers > 0:
+            pool = RolloutsHook._pools.get(self.n_workers)
+            if pool is None or pool.closed:
+                pool = RolloutsHook._pools[self.n_workers] = EvaluationPool(updater, self.n_workers)
+            self.pool = pool
         else:
-            obs = rollouts.image
+            self.pool = None
 
-        fig, axes = square_subplots(rollouts.batch_size, figsize=(5, 5))
-        plt.subplots_adjust(top=0.95, bottom=0, left=0, right=1, wspace=0.1, hspace=0.1)
+            # One env per learner, so that learners can be evaluated concurrently.
+            self.envs = [_build_rollouts_env(self.env_class, self.env_kwargs) for learner in updater.learners]
+            self.env = self.envs[0]
 
-        images = []
-        for i, ax in enumerate(axes.flatten()):
-            ax.set_aspect("equal")
-            ax.set_axis_off()
-            image = ax.imshow(np.zeros(obs.shape[2:]))
-            images.append(image)
+    def end_stage(self, training_loop, stage_idx):
+        self.scheduler.close()
 
-        def animate(t):
-            for i in range(rollouts.batch_size):
-                images[i].set_array(obs[t, i, :, :, :])
+        if self.pool is not None:
+            # The pool is rebuilt for each stage, since the config may change between stages.
+            self.pool.close()
+            self.pool = None
 
-        anim = animation.FuncAnimation(fig, animate, frames=len(rollouts), interval=500)
+        # Animations that are still being encoded are finished in the background.
+        self.animation_executor.shutdown(wait=False)
 
+    def plot(self, updater, frames):
         path = updater.exp_dir.path_for('plots', '{}_animation.gif'.format(self.name))
-        anim.save(path, writer='imagemagick')
+        future = self.animation_executor.submit(save_animation, frames, path)
+        future.add_done_callback(self._check_animation)
+        return future
 
-        plt.close(fig)
+    def _check_animation(self, future):
+        exception = future.exception()
+        if exception is not None:
+            self._print("Exception occurred while saving animation: {}".format(exception))
 
-    def step(self, training_loop, updater, step_idx=None):
+    def _evaluate_in_process(self, updater, plot):
         n_rollouts = cfg.n_val_rollouts
-        batch_size = cfg.batch_size
+        T = cfg.T
         record = defaultdict(float)
-        n_iters = int(np.ceil(n_rollouts / batch_size))
 
-        for it in range(n_iters):
-            n_remaining = n_rollouts - it * batch_size
-            _batch_size = min(batch_size, n_remaining)
+        for env, learner in zip(self.envs, updater.learners):
+            with learner:
+                env.maybe_build_rollouts(learner.pi)
+
+        self.scheduler.reset_stats()
+        results = self.scheduler.map(
+            lambda job: self.scheduler.do_rollouts(job[0], job[1].pi, n_rollouts, T, 'val'),
+            zip(self.envs, updater.learners))
+
+        key = "{}-reward_per_ep".format(self.name)
+        for batches in results:
+            for rollouts in batches:
+                record[key] += rollouts.batch_size * rollouts.rewards.sum(0).mean()
+
+        if plot:
+            rollouts = results[-1][0]
+            self.plot(updater, rollouts.obs if self.envs[-1].gym_env.image_obs else rollouts.image)
+
+        record = {k: v / n_rollouts for k, v in record.items()}
+        record["{}-rollouts_per_sec".format(self.name)] = self.scheduler.rollouts_per_sec
+
+        return record
+
+    def _evaluate_in_pool(self, updater, step_idx, plot):
+        build_env = partial(_build_rollouts_env, self.env_class, self.env_kwargs)
+        eval_id = self.pool.submit(build_env, cfg.n_val_rollouts, cfg.T, env_key=self.name, mode='val', frames=plot)
 
-            for learner in updater.learners:
-                with learner:
-                    rollouts = self.env.do_rollouts(policy=learner.pi, n_rollouts=_batch_size, T=cfg.T, mode='val')
-                    key = "{}-reward_per_ep".format(self.name)
-                    record[key] += _batch_size * rollouts.rewards.sum(0).mean()
+        if step_idx is None:
+            # End of stage: results for the best hypothesis are required now, earlier ones are no longer of interest.
+            self.pending = [(eval_id, step_idx)]
+            evaluations = self.pool.get([eval_id], block=True)
+        else:
+            self.pending.append((eval_id, step_idx))
+            evaluations = self.pool.get([i for i, _ in self.pending])
+
+        if not evaluations:
+            return None
+
+        steps = dict(self.pending)
+        completed = set(e.id for e in evaluations)
+        self.pending = [(i, s) for i, s in self.pending if i not in completed]
+
+        for evaluation in evaluations:
+            if evaluation.frames is not None:
+                self.plot(updater, evaluation.frames)
+
+        evaluation = evaluations[-1]
+        n_rollouts = evaluation.n_rollouts * len(evaluation.reward_per_ep)
+        record = {
+            "{}-reward_per_ep".format(self.name): sum(evaluation.reward_per_ep),
+            "{}-rollouts_per_sec".format(self.name): n_rollouts / evaluation.duration if evaluation.duration > 0 else 0.0,
+        }
+        if steps[evaluation.id] is not None:
+            record["{}-eval_step".format(self.name)] = steps[evaluation.id]
+
+        return record
+
+    def step(self, training_loop, updater, step_idx=None):
+        plot = bool(self.plot_step) and (step_idx is None or step_idx % self.plot_step == 0)
+
+        if self.pool is None:
+            record = self._evaluate_in_process(updater, plot)
+        else:
+            record = self._evaluate_in_pool(updater, step_idx, plot)
 
-            if it == 0 and self.plot_step and (step_idx is None or step_idx % self.plot_step == 0):
-                self.plot(updater, rollouts)
+        if record is None:
+            return None
 
-        return dict(val={k: v / n_rollouts for k, v in record.items()})
+        return dict(val=record)
 
 
 colors = "red green blue"
@@ -327,7 +461,7 @@ for es in collectable_specs + obstacle_specs:
 
 
 hook_step = 1000
-hook_kwargs = dict(n=hook_step, plot_step=hook_step, initial=True)
+hook_kwargs = dict(n=hook_step, plot_step=hook_step, initial=True, n_workers=4)
 
 # env config
 config = game.config.copy(
@@ -341,6 +475,7 @@ config = game.config.copy(
     obstacle_specs=obstacle_specs,
 
     build_env=build_env,
+    batch_game=True,
     image_shape=(48, 48), background_colour="white", max_overlap=0.25, step_size=14,
     hooks=[
         RolloutsHook(env_class=CollectB, env_kwargs=dict(n_dirs=4), **hook_kwargs),
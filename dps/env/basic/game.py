@@ -1,6 +1,7 @@
 import gym
 from gym.utils import seeding
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from matplotlib import pyplot as plt
 from matplotlib.colors import to_rgb
 from matplotlib import animation
@@ -8,6 +9,9 @@ import os
 import imageio
 import warnings
 import copy
+import math
+import time
+from collections import defaultdict
 
 import dps
 from dps import cfg
@@ -20,6 +24,9 @@ class Entity(object):
     masks = {}
     images = {}
 
+    # An EntityFeatureBuffer holding this entity's observation features, kept up to date by the property setters.
+    _feature_buffer = None
+
     def __init__(self, appearance="plus", color="white", shape=(1, 1), position=(0, 0), z=None, reward=0, **kwargs):
         self.appearance = appearance
 
@@ -44,6 +51,60 @@ class Entity(object):
     def reset(self):
         self.alive = True
 
+    def _attach(self, feature_buffer, row):
+        self._feature_buffer = feature_buffer
+        self._row = row
+
+    @property
+    def top(self):
+        return self._top
+
+    @top.setter
+    def top(self, _top):
+        self._top = _top
+        if self._feature_buffer is not None:
+            self._feature_buffer.features[self._row, 1] = _top / self._feature_buffer.height
+
+    @property
+    def left(self):
+        return self._left
+
+    @left.setter
+    def left(self, _left):
+        self._left = _left
+        if self._feature_buffer is not None:
+            self._feature_buffer.features[self._row, 2] = _left / self._feature_buffer.width
+
+    @property
+    def h(self):
+        return self._h
+
+    @h.setter
+    def h(self, _h):
+        self._h = _h
+        if self._feature_buffer is not None:
+            self._feature_buffer.features[self._row, 3] = _h
+
+    @property
+    def w(self):
+        return self._w
+
+    @w.setter
+    def w(self, _w):
+        self._w = _w
+        if self._feature_buffer is not None:
+            self._feature_buffer.features[self._row, 4] = _w
+
+    @property
+    def alive(self):
+        return self._alive
+
+    @alive.setter
+    def alive(self, _alive):
+        self._alive = _alive
+        if self._feature_buffer is not None:
+            self._feature_buffer.alive[self._row] = _alive
+
     def get_appearance(self):
         key = (self.color, self.h, self.w)
         image = Entity.images.get(key, None)
@@ -145,6 +206,29 @@ class Entity(object):
         pass
 
 
+class EntityFeatureBuffer(object):
+    """ The observation features of a list of entities, as used by `ObjectGame.get_entities`: one row per entity,
+        (1, top/height, left/width, h, w, *game-specific features). Entities are attached to the buffer, and their
+        property setters write changes to position, size and `alive` directly into it. Game-specific features
+        are computed once; if they change, the buffer must be rebuilt (see `ObjectGame.entity_features_changed`).
+
+    """
+    def __init__(self, entities, image_shape, get_entity_features, n_features):
+        self.entities = entities
+        self.n_entities = len(entities)
+        self.height, self.width = image_shape
+
+        self.features = np.zeros((self.n_entities, 5 + n_features))
+        self.alive = np.zeros(self.n_entities, dtype=bool)
+
+        for i, entity in enumerate(entities):
+            self.features[i, :] = (
+                (1.0, entity.top/self.height, entity.left/self.width, entity.h, entity.w,) +
+                tuple(get_entity_features(entity)))
+            self.alive[i] = entity.alive
+            entity._attach(self, i)
+
+
 def liang_barsky(bottom, top, left, right, y0, x0, y1, x1):
     assert bottom < top
     assert left < right
@@ -250,6 +334,142 @@ class Ellipse(object):
         return (t1, t2)
 
 
+class SpatialHash(object):
+    """ Uniform grid over axis-aligned boxes, used as a broad phase for collision detection.
+
+    Each item is registered in every cell that its box overlaps. Boxes are closed, so boxes that
+    merely touch share a cell. Querying a box returns every item whose box may overlap it
+    (a superset of the items whose box actually overlaps it).
+
+    Parameters
+    ----------
+    cell_size: float
+        Side length of the (square) cells. Works best when comparable to the size of the boxes.
+
+    """
+    def __init__(self, cell_size):
+        assert cell_size > 0
+        self.cell_size = float(cell_size)
+        self.cells = defaultdict(set)
+        self.item_cells = {}
+
+    def __len__(self):
+        return len(self.item_cells)
+
+    def _cell_range(self, top, bottom, left, right):
+        c = self.cell_size
+        return (math.floor(top / c), math.floor(bottom / c), math.floor(left / c), math.floor(right / c))
+
+    def insert(self, item, top, bottom, left, right):
+        cell_range = self._cell_range(top, bottom, left, right)
+        self.item_cells[item] = cell_range
+
+        i0, i1, j0, j1 = cell_range
+        for i in range(i0, i1+1):
+            for j in range(j0, j1+1):
+                self.cells[i, j].add(item)
+
+    def remove(self, item):
+        i0, i1, j0, j1 = self.item_cells.pop(item)
+        for i in range(i0, i1+1):
+            for j in range(j0, j1+1):
+                cell = self.cells[i, j]
+                cell.discard(item)
+                if not cell:
+                    del self.cells[i, j]
+
+    def update(self, item, top, bottom, left, right):
+        """ Move an item's box. Cheap if the set of cells it overlaps does not change. """
+        if self.item_cells.get(item, None) == self._cell_range(top, bottom, left, right):
+            return
+
+        if item in self.item_cells:
+            self.remove(item)
+        self.insert(item, top, bottom, left, right)
+
+    def query(self, top, bottom, left, right):
+        i0, i1, j0, j1 = self._cell_range(top, bottom, left, right)
+
+        items = set()
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # Query covers more cells than are occupied, so scan the occupied cells instead.
+            for (i, j), cell in self.cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    items |= cell
+        else:
+            for i in range(i0, i1+1):
+                for j in range(j0, j1+1):
+                    cell = self.cells.get((i, j), None)
+                    if cell:
+                        items |= cell
+        return items
+
+
+class IncrementalRenderer(object):
+    """ Renders a list of entities, composited in order of increasing z over a uniform background.
+
+    The background layer is computed once. After the first frame, only the rectangles covered by entities whose
+    position, size, appearance or `alive` flag changed since the previous frame (before and after the change)
+    are re-composited. Compositing is per pixel, so frames are identical to those obtained by compositing
+    all entities from scratch. Entities with noisy appearances (`noise_res`) look different every time
+    they are drawn, so if any are present every frame is composited from scratch.
+
+    """
+    def __init__(self, image_shape, background_colour, entities):
+        self.background = np.ones((*image_shape, 3)) * background_colour
+        self.entities = entities
+        self.image = None
+        self.states = None
+
+    @staticmethod
+    def _state(entity):
+        top, left = int(entity.top), int(entity.left)
+        return (
+            top, top + int(entity.h), left, left + int(entity.w), bool(entity.alive),
+            entity.appearance, entity.color, entity.z)
+
+    def _composite(self, top, bottom, left, right):
+        """ Re-composite the entities within a rectangle of the image. """
+        region = self.background[top:bottom, left:right, ...].copy()
+
+        for entity in sorted(self.entities, key=lambda x: x.z):
+            if not entity.alive:
+                continue
+
+            e_top, e_bottom, e_left, e_right = self._state(entity)[:4]
+            _top, _bottom = max(top, e_top), min(bottom, e_bottom)
+            _left, _right = max(left, e_left), min(right, e_right)
+            if _top >= _bottom or _left >= _right:
+                continue
+
+            _image, _alpha = entity.get_appearance()
+            _image = _image[_top-e_top:_bottom-e_top, _left-e_left:_right-e_left, ...]
+            _alpha = _alpha[_top-e_top:_bottom-e_top, _left-e_left:_right-e_left, ...]
+
+            target = region[_top-top:_bottom-top, _left-left:_right-left, ...]
+            region[_top-top:_bottom-top, _left-left:_right-left, ...] = _alpha * _image + (1 - _alpha) * target
+
+        self.image[top:bottom, left:right, ...] = region
+
+    def render(self):
+        states = [self._state(entity) for entity in self.entities]
+        noisy = any(getattr(entity, "noise_res", None) is not None for entity in self.entities)
+
+        if self.image is None or noisy:
+            self.image = self.background.copy()
+            height, width = self.image.shape[:2]
+            self._composite(0, height, 0, width)
+        else:
+            for old, new in zip(self.states, states):
+                if old != new:
+                    for top, bottom, left, right, alive, *_ in (old, new):
+                        if alive:
+                            self._composite(max(top, 0), bottom, max(left, 0), right)
+
+        self.states = states
+        return self.image.copy()
+
+
 class ObjectGame(Parameterized, gym.Env):
     """
 
@@ -266,6 +486,9 @@ class ObjectGame(Parameterized, gym.Env):
 
     compute_reward
 
+    Entities must only be moved (after `setup_field`) by calling `_move_entity`, which keeps the
+    spatial hash used for collision detection up to date.
+
     """
     metadata = {'render.modes': ['human']}
 
@@ -274,6 +497,8 @@ class ObjectGame(Parameterized, gym.Env):
     max_episode_length = Param()
     image_obs = Param()
     max_entities = Param()
+    use_spatial_hash = Param(
+        True, help="If True, only entities in nearby cells of a SpatialHash are tested for collision with a moving entity.")
 
     def __init__(
             self, action_space=None, reward_range=None, entity_feature_dim=None, **kwargs):
@@ -321,48 +546,92 @@ class ObjectGame(Parameterized, gym.Env):
         """ Compute an additional reward based on final location of entities. """
         return 0.0
 
-    def get_image(self):
-        image = np.ones((*self.image_shape, 3)) * self.background_colour
-
-        sorted_entities = sorted(self.entities, key=lambda x: x.z)
-
-        for entity in sorted_entities:
-            if not entity.alive:
-                continue
+    def batch_action_to_step(self, actions):
+        """ Vectorized version of `move_entities` for use by `BatchObjectGame`. Given actions for
+            a batch of games, return arrays (y_step, x_step) giving the step taken by the first entity
+            of each game. """
+        raise Exception("NotImplemented")
 
-            _image, _alpha = entity.get_appearance()
+    def batch_compute_reward(self, batch_game):
+        """ Vectorized version of `compute_reward` for use by `BatchObjectGame`. """
+        return np.zeros(batch_game.n_games)
 
-            top = int(entity.top)
-            bottom = top + int(entity.h)
+    def make_batch(self, n_games):
+        """ Return a `BatchObjectGame` which steps `n_games` copies of this game in lockstep. """
+        return BatchObjectGame(self, n_games)
 
-            left = int(entity.left)
-            right = left + int(entity.w)
+    def get_image(self):
+        start = time.time()
 
-            image[top:bottom, left:right, ...] = (
-                _alpha * _image + (1 - _alpha) * image[top:bottom, left:right, ...])
+        renderer = getattr(self, "_renderer", None)
+        if renderer is None or renderer.entities is not self.entities:
+            renderer = self._renderer = IncrementalRenderer(self.image_shape, self.background_colour, self.entities)
+        image = renderer.render()
 
+        self.render_duration = time.time() - start
         return image
 
+    def entity_features_changed(self):
+        """ Must be called when the value returned by `get_entity_features` changes for an entity that is already
+            in play, so that it is recomputed. Position, size and `alive` are kept up to date automatically. """
+        self._feature_buffer = None
+
     def get_entities(self):
-        height, width = self.image_shape
+        """ Observation features of the entities that are alive, in a random order, padded with zeros
+            to `max_entities` rows. Features are read from an EntityFeatureBuffer, built when the list of
+            entities is replaced and updated in place as entities change. """
+        buffer = getattr(self, "_feature_buffer", None)
+        stale = buffer is None or buffer.entities is not self.entities or buffer.n_entities != len(self.entities)
+        if stale:
+            buffer = self._feature_buffer = EntityFeatureBuffer(
+                self.entities, self.image_shape, self.get_entity_features, self.entity_feature_dim)
+
         representation = np.zeros((self.max_entities, 5 + self.entity_feature_dim))
 
-        entities = np.random.permutation(self.entities)
+        order = np.random.permutation(buffer.n_entities)
+        order = order[buffer.alive[order]]
+        representation[:len(order)] = buffer.features[order]
 
-        i = 0
-        for entity in entities:
-            if not entity.alive:
-                continue
+        return representation
 
-            features = self.get_entity_features(entity)
+    def _build_spatial_hash(self):
+        """ Index the bounding boxes of all entities, using cells as large as the largest entity. """
+        cell_size = max([max(e.h, e.w) for e in self.entities] + [1])
+        self._spatial_hash = SpatialHash(cell_size)
+        self._hashed_entities = self.entities
+        self._n_hashed_entities = len(self.entities)
+        self._entity_indices = {id(entity): idx for idx, entity in enumerate(self.entities)}
 
-            representation[i, :] = (
-                (1.0, entity.top/height, entity.left/width, entity.h, entity.w,) + tuple(features)
-            )
+        for idx, entity in enumerate(self.entities):
+            self._spatial_hash.insert(idx, entity.top, entity.bottom, entity.left, entity.right)
 
-            i += 1
+    def _collision_candidates(self, entity, y_step, x_step):
+        """ Entities (in the order they appear in `self.entities`) which the moving entity might collide with.
 
-        return representation
+        The moving entity collides with another if the path of its center intersects an ellipse centered at the other's
+        center with the mover's half-extents as radii, which can only happen if the other's center (and therefore
+        its bounding box) lies within the mover's swept bounding box.
+
+        """
+        if not self.use_spatial_hash:
+            return self.entities
+
+        stale = (
+            getattr(self, "_spatial_hash", None) is None or
+            self._hashed_entities is not self.entities or
+            self._n_hashed_entities != len(self.entities))
+        if stale:
+            self._build_spatial_hash()
+
+        y, x = entity.y, entity.x
+
+        # Pad slightly so that rounding can't exclude entities touching the boundary of the swept box.
+        half_h, half_w = entity.h / 2 + 1e-6, entity.w / 2 + 1e-6
+        indices = self._spatial_hash.query(
+            min(y, y + y_step) - half_h, max(y, y + y_step) + half_h,
+            min(x, x + x_step) - half_w, max(x, x + x_step) + half_w)
+
+        return [self.entities[idx] for idx in sorted(indices)]
 
     def _move_entity(self, entity, y_step, x_step):
         # For each entity, compute the time of intercept.
@@ -370,7 +639,7 @@ class ObjectGame(Parameterized, gym.Env):
         h, w = entity.h, entity.w
 
         obstacles = []
-        for other in self.entities:
+        for other in self._collision_candidates(entity, y_step, x_step):
             y, x = other.center
 
             shape = Ellipse(y, x, h/2, w/2)
@@ -424,6 +693,10 @@ class ObjectGame(Parameterized, gym.Env):
             entity.y = y + y_step
             entity.x = x + x_step
 
+        if self.use_spatial_hash:
+            idx = self._entity_indices[id(entity)]
+            self._spatial_hash.update(idx, entity.top, entity.bottom, entity.left, entity.right)
+
         return total_reward
 
     def step(self, action):
@@ -439,6 +712,7 @@ class ObjectGame(Parameterized, gym.Env):
         else:
             obs = self.get_entities()
             info['image'] = self.get_image()
+        info['render_duration'] = self.render_duration
 
         done = bool(self.max_episode_length) and self._step >= self.max_episode_length
 
@@ -447,6 +721,7 @@ class ObjectGame(Parameterized, gym.Env):
     def reset(self):
         '''Clear entities and state, call setup_field()'''
         self.entities = self.setup_field()
+        self._spatial_hash = None
         self._step = 0
         if self.image_obs:
             obs = self.get_image()
@@ -469,6 +744,355 @@ class ObjectGame(Parameterized, gym.Env):
         return [seed]
 
 
+def batch_liang_barsky(bottom, top, left, right, y0, x0, y1, x1):
+    """ Vectorized version of `liang_barsky`. Returns (out_in, in_out, valid), where `valid` is False
+        wherever `liang_barsky` would return None. """
+    dx = x1 - x0
+    dy = y1 - y0
+
+    checks = ((-dx, -(left - x0)),
+              (dx, right - x0),
+              (-dy, -(bottom - y0)),
+              (dy, top - y0))
+
+    shape = np.broadcast(bottom, top, left, right, y0, x0, y1, x1).shape
+    out_in = np.zeros(shape)
+    in_out = np.ones(shape)
+    valid = np.ones(shape, dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in checks:
+            valid &= ~((p == 0) & (q < 0))
+            ratio = q / p
+            out_in = np.where(p < 0, np.maximum(out_in, ratio), out_in)
+            in_out = np.where(p > 0, np.minimum(in_out, ratio), in_out)
+
+    valid &= out_in < in_out
+    return out_in, in_out, valid
+
+
+class BatchObjectGame(object):
+    """ Steps a batch of copies of an ObjectGame in lockstep, with the state of the entities of all games
+        held in arrays of shape (n_games, n_entities), so that movement, collision detection and collision
+        resolution are carried out for all games at once.
+
+    Gives the same trajectories as stepping `n_games` copies of `game` one after the other (given the same
+    state of numpy's global random number generator). Fields are created by the game's own `setup_field`,
+    and must not create more than `game.max_entities` entities. Supports games in which, as in the
+    `CollectionGame` variants, only the first entity moves, and the outcome of a collision (`resolve_collision`)
+    depends only on the entity being collided with. Such games must implement `batch_action_to_step`,
+    and `batch_compute_reward` if they implement `compute_reward`.
+
+    Parameters
+    ----------
+    game: ObjectGame
+        Provides the rules of the game; its own entities are overwritten.
+    n_games: int
+
+    """
+    walls = ["top", "bottom", "left", "right"]
+
+    def __init__(self, game, n_games):
+        self.game = game
+        self.n_games = n_games
+
+        self.action_space = game.action_space
+        self.observation_space = game.observation_space
+        self.reward_range = game.reward_range
+
+        self.entities = []
+        self._step = 0
+
+    def entity_attr(self, name, default=0):
+        """ Array (n_games, n_entities) giving the value of an attribute of each entity, `default` for padding. """
+        values = self._attrs.get(name, None)
+        if values is None:
+            values = np.array([
+                [getattr(e, name, default) for e in entities] + [default] * (self.n_entities - len(entities))
+                for entities in self.entities])
+            self._attrs[name] = values
+        return values
+
+    def reset(self):
+        # Games are reset one after the other so that random numbers are drawn in the same order as for separate games.
+        obs = []
+        self.entities = []
+        for b in range(self.n_games):
+            obs.append(self.game.reset())
+            self.entities.append(self.game.entities)
+
+        self.n_entities = max(len(entities) for entities in self.entities)
+        self._attrs = {}
+        self._step = 0
+
+        self.present = np.zeros((self.n_games, self.n_entities), dtype=bool)
+        for b, entities in enumerate(self.entities):
+            self.present[b, :len(entities)] = True
+
+        self.top = self.entity_attr("top").astype('d')
+        self.left = self.entity_attr("left").astype('d')
+        self.h = self.entity_attr("h").astype('d')
+        self.w = self.entity_attr("w").astype('d')
+        self.alive = self.entity_attr("alive", False).astype(bool)
+
+        n_features = 5 + self.game.entity_feature_dim
+        self.features = np.zeros((self.n_games, self.n_entities, n_features - 5))
+
+        # Outcomes of the first entity colliding with each other entity, followed by each wall.
+        n_obstacles = self.n_entities + len(self.walls)
+        self.kill = np.zeros((self.n_games, n_obstacles), dtype=bool)
+        self.stop = np.zeros((self.n_games, n_obstacles), dtype=bool)
+        self.collision_reward = np.zeros((self.n_games, n_obstacles))
+
+        for b, entities in enumerate(self.entities):
+            mover = entities[0]
+            for i, entity in enumerate(entities):
+                self.features[b, i] = self.game.get_entity_features(entity)
+            others = entities[1:] + [None] * (self.n_entities - len(entities)) + self.walls
+            for i, other in enumerate(others):
+                if other is not None:
+                    self.kill[b, i+1], self.stop[b, i+1], self.collision_reward[b, i+1] = (
+                        self.game.resolve_collision(mover, other))
+
+        self._build_appearances()
+
+        return np.array(obs)
+
+    def _build_appearances(self):
+        """ Gather the appearances of all entities into arrays padded to the size of the largest entity. """
+        self.noisy = any(
+            getattr(e, "noise_res", None) is not None for entities in self.entities for e in entities)
+        if self.noisy:
+            return
+
+        self.max_h = int(self.h.max())
+        self.max_w = int(self.w.max())
+
+        shape = (self.n_games, self.n_entities, self.max_h, self.max_w)
+        self.appearance = np.zeros(shape + (3,))
+        self.alpha = np.zeros(shape + (1,))
+
+        for b, entities in enumerate(self.entities):
+            for i, entity in enumerate(entities):
+                image, alpha = entity.get_appearance()
+                self.appearance[b, i, :image.shape[0], :image.shape[1]] = image
+                self.alpha[b, i, :alpha.shape[0], :alpha.shape[1]] = alpha
+
+        # Entities of each game in order of increasing z (ties broken by position in the entity list), padding last.
+        z = np.where(self.present, self.entity_attr("z", 0.0), np.inf)
+        self.z_order = np.argsort(z, axis=1, kind='stable')
+        self.appearance = np.take_along_axis(self.appearance, self.z_order[:, :, None, None, None], axis=1)
+        self.alpha = np.take_along_axis(self.alpha, self.z_order[:, :, None, None, None], axis=1)
+
+        height, width = self.game.image_shape
+        self.pad = max(self.max_h, self.max_w)
+        self.canvas = np.zeros((self.n_games, height + 2*self.pad, width + 2*self.pad, 3))
+        self.background = np.ones((height, width, 3)) * self.game.background_colour
+
+        # windows[b, i, j] is a writeable view of the (max_h, max_w) window of game b's canvas with top-left corner (i, j).
+        _, canvas_h, canvas_w, _ = self.canvas.shape
+        s = self.canvas.strides
+        self.windows = as_strided(
+            self.canvas,
+            shape=(self.n_games, canvas_h - self.max_h + 1, canvas_w - self.max_w + 1, self.max_h, self.max_w, 3),
+            strides=(s[0], s[1], s[2], s[1], s[2], s[3]), writeable=True)
+
+    def _move(self, y_step, x_step):
+        top, left, h, w = self.top, self.left, self.h, self.w
+        mover_h, mover_w = h[:, 0], w[:, 0]
+
+        y = top[:, 0] + mover_h / 2
+        x = left[:, 0] + mover_w / 2
+        y1 = y + y_step
+        x1 = x + x_step
+
+        # Entities, mirroring `Ellipse.collision`. Same operations as the scalar version, so results are identical.
+        y_radius_2 = np.power(mover_h / 2, 2)[:, None]
+        x_radius_2 = np.power(mover_w / 2, 2)[:, None]
+
+        _y0 = y[:, None] - (top + h / 2)
+        _y1 = y1[:, None] - (top + h / 2)
+        _x0 = x[:, None] - (left + w / 2)
+        _x1 = x1[:, None] - (left + w / 2)
+
+        a = np.power(_y1 - _y0, 2) / y_radius_2 + np.power(_x1 - _x0, 2) / x_radius_2
+        b = 2 * ((_y1 - _y0) * _y0 / y_radius_2 + (_x1 - _x0) * _x0 / x_radius_2)
+        c = np.power(_y0, 2) / y_radius_2 + np.power(_x0, 2) / x_radius_2 - 1
+
+        disc = np.power(b, 2) - 4 * a * c
+        hit = disc > 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sqrt_disc = np.sqrt(np.where(hit, disc, 0.0))
+            t1 = (-b - sqrt_disc) / (2*a)
+            t2 = (-b + sqrt_disc) / (2*a)
+
+        start_inside = t2 * t1 < 0
+        t1 = np.where(start_inside, 0.0, t1)
+        hit &= start_inside | ((t1 >= 0) & (t1 <= 1))
+        t2 = np.minimum(1, t2)
+
+        hit &= self.alive & self.present
+        hit[:, 0] = False
+
+        # Walls, mirroring the Rectangles in `ObjectGame._move_entity`.
+        height, width = self.game.image_shape
+        inf = np.full(self.n_games, np.inf)
+        bottom = np.stack([-inf, height - np.ceil(mover_h)/2, -inf, -inf], axis=1)
+        _top = np.stack([np.ceil(mover_h / 2), inf, inf, inf], axis=1)
+        _left = np.stack([-inf, -inf, -inf, width - np.ceil(mover_w)/2], axis=1)
+        right = np.stack([inf, inf, np.ceil(mover_w)/2, inf], axis=1)
+
+        wall_t1, wall_t2, wall_hit = batch_liang_barsky(
+            bottom, _top, _left, right, y[:, None], x[:, None], y1[:, None], x1[:, None])
+
+        hit = np.concatenate([hit, wall_hit], axis=1)
+        t1 = np.where(hit, np.concatenate([t1, wall_t1], axis=1), np.inf)
+        t2 = np.where(hit, np.concatenate([t2, wall_t2], axis=1), np.inf)
+
+        # Process collisions in order of (t1, t2), ties broken by the order in which obstacles are
+        # checked in `_move_entity`, stopping after the first collision that stops the mover.
+        obstacle_idx = np.broadcast_to(np.arange(hit.shape[1]), hit.shape)
+        order = np.lexsort((obstacle_idx, t2, t1), axis=-1)
+
+        hit = np.take_along_axis(hit, order, axis=1)
+        stop = np.take_along_axis(self.stop, order, axis=1) & hit
+
+        any_stop = stop.any(axis=1)
+        first_stop = np.argmax(stop, axis=1)
+        resolved = hit & (~any_stop[:, None] | (np.arange(hit.shape[1]) <= first_stop[:, None]))
+
+        rewards = np.where(resolved, np.take_along_axis(self.collision_reward, order, axis=1), 0.0)
+        total_reward = np.cumsum(rewards, axis=1)[:, -1]
+
+        killed = np.zeros_like(resolved)
+        np.put_along_axis(killed, order, resolved & np.take_along_axis(self.kill, order, axis=1), axis=1)
+        self.alive &= ~killed[:, :self.n_entities]
+
+        start = np.take_along_axis(np.take_along_axis(t1, order, axis=1), first_stop[:, None], axis=1)[:, 0]
+        with np.errstate(invalid='ignore'):
+            new_y = np.where(any_stop, y + (start-1e-6) * y_step, y + y_step)
+            new_x = np.where(any_stop, x + (start-1e-6) * x_step, x + x_step)
+
+        self.top[:, 0] = new_y - mover_h / 2
+        self.left[:, 0] = new_x - mover_w / 2
+
+        return total_reward
+
+    def get_entities(self):
+        """ Batched version of `ObjectGame.get_entities`. """
+        height, width = self.game.image_shape
+        n_features = 5 + self.game.entity_feature_dim
+
+        table = np.concatenate(
+            [np.ones_like(self.top)[..., None], (self.top/height)[..., None], (self.left/width)[..., None],
+             self.h[..., None], self.w[..., None], self.features],
+            axis=2)
+
+        # Entities of each game in a random order, with dead entities (and padding) moved to the end.
+        order = np.tile(np.arange(self.n_entities), (self.n_games, 1))
+        for b, entities in enumerate(self.entities):
+            order[b, :len(entities)] = np.random.permutation(len(entities))
+        alive = np.take_along_axis(self.alive & self.present, order, axis=1)
+        packed = np.argsort(~alive, axis=1, kind='stable')
+        order = np.take_along_axis(order, packed, axis=1)
+        alive = np.take_along_axis(alive, packed, axis=1)
+
+        table = np.where(alive[..., None], np.take_along_axis(table, order[..., None], axis=1), 0.0)
+
+        representation = np.zeros((self.n_games, self.game.max_entities, n_features))
+        n = min(self.n_entities, self.game.max_entities)
+        representation[:, :n] = table[:, :n]
+        return representation
+
+    def _sync_entities(self):
+        """ Copy the state of the entities from the arrays to the Entity objects. """
+        for b, entities in enumerate(self.entities):
+            for i, entity in enumerate(entities):
+                entity.top = self.top[b, i]
+                entity.left = self.left[b, i]
+                entity.alive = self.alive[b, i]
+
+    def get_image(self, b):
+        self.game.entities = self.entities[b]
+        return self.game.get_image()
+
+    def get_images(self):
+        """ Render all games at once. Entities are composited in order of increasing z as in `ObjectGame.get_image`,
+            with the k-th entity of every game blended in a single vectorized operation. Windows are padded to the size
+            of the largest entity with fully transparent pixels, which leave the image unchanged. """
+        start = time.time()
+
+        if self.noisy:
+            self._sync_entities()
+            images = np.array([self.get_image(b) for b in range(self.n_games)])
+            self.render_duration = time.time() - start
+            return images
+
+        height, width = self.game.image_shape
+        pad = self.pad
+        self.canvas[:, pad:pad+height, pad:pad+width] = self.background
+
+        # Positions and visibility of entities in z order.
+        b = np.arange(self.n_games)
+        tops = np.take_along_axis(self.top.astype('i') + pad, self.z_order, axis=1)
+        lefts = np.take_along_axis(self.left.astype('i') + pad, self.z_order, axis=1)
+        visible = np.take_along_axis(self.alive & self.present, self.z_order, axis=1)
+
+        for k in range(self.n_entities):
+            if not visible[:, k].any():
+                continue
+
+            alpha = np.where(visible[:, k, None, None, None], self.alpha[:, k], 0.0)
+            window = self.windows[b, tops[:, k], lefts[:, k]]
+            self.windows[b, tops[:, k], lefts[:, k]] = alpha * self.appearance[:, k] + (1 - alpha) * window
+
+        images = self.canvas[:, pad:pad+height, pad:pad+width].copy()
+        self.render_duration = time.time() - start
+        return images
+
+    def step(self, actions):
+        """ Step all games.
+
+        Returns
+        -------
+        obs: (n_games, *obs_shape)
+        rewards: (n_games,)
+        done: (n_games,) bool
+        info: dict of arrays with leading dimension n_games
+
+        """
+        y_step, x_step = self.game.batch_action_to_step(actions)
+        reward = self._move(y_step, x_step)
+        reward = reward + self.game.batch_compute_reward(self)
+
+        info = {}
+        self._step += 1
+
+        if self.game.image_obs:
+            info['entities'] = self.get_entities()
+            obs = self.get_images()
+        else:
+            obs = self.get_entities()
+            info['image'] = self.get_images()
+
+        # Share of the time spent rendering the batch attributable to each game.
+        info['render_duration'] = np.full(self.n_games, self.render_duration / self.n_games)
+
+        max_episode_length = self.game.max_episode_length
+        done = bool(max_episode_length) and self._step >= max_episode_length
+
+        return obs, reward, np.full(self.n_games, done), info
+
+    def render(self, mode='human'):
+        self._sync_entities()
+        self.game.entities = self.entities[0]
+        self.game.render(mode=mode)
+
+    def close(self):
+        pass
+
+
 def sample_entities(image_shape, patch_shapes, max_overlap=None, size_std=None, masks=None):
     if len(patch_shapes) == 0:
         return []
@@ -528,6 +1152,23 @@ def sample_entities(image_shape, patch_shapes, max_overlap=None, size_std=None,
     return rects
 
 
+def continuous_action_to_step(actions, step_size):
+    """ Vectorized conversion of actions (y, x, magnitude) into steps (y_step, x_step),
+        as performed by `CollectionGame.move_entities`. """
+    actions = np.asarray(actions, dtype='d')
+    y = np.clip(actions[:, 0], -1, 1)
+    x = np.clip(actions[:, 1], -1, 1)
+    magnitude = np.clip(actions[:, 2], 0, 1)
+
+    norm = np.sqrt(np.power(x, 2) + np.power(y, 2))
+    moving = norm > 1e-6
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.where(moving, step_size * magnitude * y / norm, 0.0)
+        x = np.where(moving, step_size * magnitude * x / norm, 0.0)
+    return y, x
+
+
 class CollectionGame(ObjectGame):
     agent_spec = Param()
     entity_specs = Param()
@@ -615,7 +1256,7 @@ class CollectionGame(ObjectGame):
         return entities
 
     def move_entities(self, action):
-        y, x, magnitude = action
+        y, x, magnitude = np.asarray(action, dtype='d')
         y = np.clip(y, -1, 1)
         x = np.clip(x, -1, 1)
         magnitude = np.clip(magnitude, 0, 1)
@@ -629,6 +1270,9 @@ class CollectionGame(ObjectGame):
 
         return self._move_entity(self.entities[0], y, x)
 
+    def batch_action_to_step(self, actions):
+        return continuous_action_to_step(actions, self.step_size)
+
     def resolve_collision(self, mover, other):
         """ Return (kill, stop, reward) """
         if isinstance(other, str):  # wall
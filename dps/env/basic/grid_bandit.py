@@ -73,37 +73,29 @@ class GridBandit(TensorFlowEnv):
         return {self.input: inp}
 
     def build_init(self, r):
-        return self.rb.wrap(
-            x=self.input[:, 0:1], y=self.input[:, 1:2],
-            vision=r[:, 2:3], action=r[:, 3:4], arm=r[:, 4:5])
+        return self.rb.update(r, x=self.input[:, 0:1], y=self.input[:, 1:2])
 
     def build_step(self, t, r, actions):
         x, y, vision, action, current_arm = self.rb.as_tuple(r)
-        up, right, down, left, look, *arms = tf.split(actions, 5+self.n_arms, axis=1)
+        up, right, down, left, look = tf.split(actions[:, :5], 5, axis=1)
+        arms = actions[:, 5:]
 
-        new_y = (1 - down - up) * y + down * (y+1) + up * (y-1)
-        new_x = (1 - right - left) * x + right * (x+1) + left * (x-1)
-
-        new_y = tf.clip_by_value(new_y, 0.0, self.shape[0]-1)
-        new_x = tf.clip_by_value(new_x, 0.0, self.shape[1]-1)
+        new_y = tf.clip_by_value(y + down - up, 0.0, self.shape[0]-1)
+        new_x = tf.clip_by_value(x + right - left, 0.0, self.shape[1]-1)
 
         idx = tf.cast(y * self.shape[1] + x, tf.int32)
         new_vision = tf.reduce_sum(
-            tf.one_hot(tf.reshape(idx, (-1,)), np.product(self.shape)) * self.input[:, 2:],
+            tf.one_hot(idx[:, 0], np.product(self.shape)) * self.input[:, 2:],
             axis=1, keepdims=True)
-        vision = (1 - look) * vision + look * new_vision
-        action = tf.cast(tf.reshape(tf.argmax(actions, axis=1), (-1, 1)), tf.float32)
+        vision = vision + look * (new_vision - vision)
+        action = tf.to_float(tf.argmax(actions, axis=1))[:, None]
 
-        arm_chosen = tf.reduce_sum(tf.concat(arms, axis=1), axis=1, keepdims=True) > 0.5
-        chosen_arm = tf.reshape(tf.argmax(arms), (-1, 1))
-        current_arm = tf.cast(current_arm, tf.int64)
+        arm_chosen = tf.reduce_sum(arms, axis=1, keepdims=True) > 0.5
+        chosen_arm = tf.to_float(tf.argmax(arms, axis=1))[:, None]
         new_current_arm = tf.where(arm_chosen, chosen_arm, current_arm)
 
-        new_registers = self.rb.wrap(
-            x=new_x, y=new_y, vision=vision, action=action, arm=tf.cast(new_current_arm, tf.float32))
-
-        correct_arm = tf.equal(new_current_arm, tf.cast(self.input[:, 2:3], tf.int64))
+        new_registers = self.rb.wrap(x=new_x, y=new_y, vision=vision, action=action, arm=new_current_arm)
 
-        reward = tf.cast(correct_arm, tf.float32)
+        reward = tf.to_float(tf.equal(new_current_arm, self.input[:, 2:3]))
 
         return tf.fill((tf.shape(r)[0], 1), 0.0), reward, new_registers
@@ -69,8 +69,7 @@ class PathDiscovery(TensorFlowEnv):
         return {self.input: inp}
 
     def build_init(self, r):
-        return self.rb.wrap(x=self.input[:, 0:1], y=self.input[:, 1:2],
-                            vision=r[:, 2:3], action=r[:, 3:4], discovered=r[:, 4:5])
+        return self.rb.update(r, x=self.input[:, 0:1], y=self.input[:, 1:2])
 
     def build_step(self, t, r, actions):
         x, y, vision, action, discovered = self.rb.as_tuple(r)
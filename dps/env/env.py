@@ -10,7 +10,9 @@ from gym.spaces import Discrete, Box
 
 from dps import cfg
 from dps.rl import RolloutBatch
+from dps.env.subproc import SubprocessEnvPool
 from dps.utils import Parameterized, gen_seed, Param
+from dps.utils.tf import unrolled_while_loop
 
 
 class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
@@ -19,8 +21,25 @@ class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
     n_rollouts = None
     has_differentiable_loss = False
 
+    # Largest number of rollouts that the env can generate in a single call to `do_rollouts`, None means unlimited.
+    max_batch_size = None
+
+    rollout_sampler = Param(
+        "graph", help="How to generate rollouts in `do_rollouts`. \"graph\": a tf.while_loop that calls into "
+                      "the env through tf.py_func at every step. \"host\": a Python loop that runs policy "
+                      "inference with one sess.run per step and steps the env directly.")
+    unroll_steps = Param(
+        1, help="Number of env steps taken per iteration of the while loop built by the \"graph\" rollout sampler. "
+                "Steps after the first in an iteration are guarded by the loop condition.")
+    sampler_parallel_iterations = Param(
+        1, help="`parallel_iterations` for the while loop built by the \"graph\" rollout sampler. Each env step "
+                "depends on the previous observation, so this only lets bookkeeping (e.g. writing TensorArrays) "
+                "overlap with the next step. With values above 1, stateful ops (e.g. action sampling) from different "
+                "iterations may run in any order, so seeded rollouts are only reproducible with 1.")
+
     def __init__(self, **kwargs):
         self._samplers = {}
+        self._host_samplers = {}
         super(Env, self).__init__(**kwargs)
 
     def set_mode(self, mode, n_rollouts):
@@ -132,8 +151,9 @@ class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
                 dummy_action = tf.zeros((self.n_rollouts,) + self.action_shape)
                 self.build_step(dummy_action)
 
-                _, final_done, final_policy_state, final_obs, *tas = tf.while_loop(
-                    cond, body, inp, parallel_iterations=1)
+                _, final_done, final_policy_state, final_obs, *tas = unrolled_while_loop(
+                    cond, body, inp, unroll=self.unroll_steps,
+                    parallel_iterations=self.sampler_parallel_iterations)
 
                 obs_ta, action_ta, reward_ta, done_ta, log_prob_ta, entropy_ta, util_ta, policy_state_ta, *info_tas = tas
 
@@ -163,7 +183,19 @@ class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
 
         return sampler
 
+    def maybe_build_rollouts(self, policy):
+        """ Build whatever is needed for `do_rollouts` to run with `policy` without adding to the graph. """
+        if self.rollout_sampler == "host":
+            self.maybe_build_host_sampler(policy)
+        else:
+            self.maybe_build_sampler(policy)
+
     def do_rollouts(self, policy, n_rollouts=None, T=None, exploration=None, mode='train'):
+        if self.rollout_sampler == "host":
+            return self.do_host_rollouts(policy, n_rollouts, T, exploration, mode)
+        elif self.rollout_sampler != "graph":
+            raise Exception("Unknown rollout sampler: {}".format(self.rollout_sampler))
+
         # Important to do this first, it can mess with the mode and other things.
         rollout, static = self.maybe_build_sampler(policy)
 
@@ -180,7 +212,65 @@ class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
 
         _rollout, _static = sess.run([rollout, static], feed_dict=feed_dict)
 
-        return RolloutBatch(**_rollout, static=_static)
+        return RolloutBatch._from_arrays(_rollout, static=_static)
+
+    def maybe_build_host_sampler(self, policy):
+        sampler = self._host_samplers.get(id(policy))
+        if not sampler:
+            self.maybe_build_placeholders()
+            policy.maybe_build_act()
+
+            with tf.name_scope("host_sampler_" + policy.display_name):
+                zero_state = policy.zero_state(self.n_rollouts, tf.float32)
+
+            self._host_samplers[id(policy)] = zero_state, policy.exploration
+            sampler = self._host_samplers[id(policy)]
+
+        return sampler
+
+    def do_host_rollouts(self, policy, n_rollouts=None, T=None, exploration=None, mode='train'):
+        """ Generate rollouts with a Python loop that alternates between running policy inference
+            for the whole batch (one sess.run per step) and stepping the env. Produces the same
+            components as the graph sampler built by `maybe_build_sampler`. """
+        zero_state, exploration_signal = self.maybe_build_host_sampler(policy)
+
+        policy.set_mode(mode)
+        self.set_mode(mode, n_rollouts)
+
+        sess = tf.get_default_session()
+        policy_state, _exploration = sess.run(
+            [zero_state, exploration_signal], feed_dict={self.n_rollouts: n_rollouts})
+        if exploration is not None:
+            _exploration = exploration
+
+        T = 0 if T is None else T
+
+        # Preallocate for the full rollout (+1 for the final observation), so appending never reallocates.
+        rollouts = RolloutBatch(capacity=T+1 if T > 0 else None)
+
+        obs = self.reset()
+        done = np.zeros((n_rollouts, 1), dtype='f')
+        t = 0
+
+        while (T <= 0 or t < T) and not np.all(done > 0.5):
+            (log_probs, actions, entropy, utils), next_policy_state = policy.act(obs, policy_state, exploration)
+            new_obs, reward, done, info = self.step(actions)
+
+            rollouts.append(
+                np.asarray(obs, dtype='f'), actions,
+                np.asarray(reward, dtype='f').reshape(n_rollouts, 1),
+                done=np.asarray(done, dtype='f').reshape(n_rollouts, 1),
+                log_probs=log_probs, entropy=entropy, utils=utils,
+                policy_states=np.asarray(policy_state, dtype='f'),
+                **{k: np.asarray(v, dtype='f') for k, v in info.items()})
+
+            obs, policy_state = new_obs, next_policy_state
+            t += 1
+
+        rollouts.extend(RolloutBatch(obs=np.asarray(obs, dtype='f')[None, ...]))
+        rollouts.set_static('exploration', _exploration)
+
+        return rollouts
 
     def do_slow_rollouts(
             self, policy, n_rollouts=None, T=None, exploration=None,
@@ -223,6 +313,9 @@ class Env(Parameterized, GymEnv, metaclass=abc.ABCMeta):
 
 
 class TensorFlowEnv(Env):
+    def do_host_rollouts(self, *args, **kwargs):
+        raise Exception("TensorFlowEnvs are stepped in the graph, and do not support the \"host\" rollout sampler.")
+
     @abc.abstractmethod
     def build_reset(self, registers):
         raise Exception("NotImplemented")
@@ -235,6 +328,12 @@ class TensorFlowEnv(Env):
 class BatchGymEnv(Env):
     gym_env = Param(help="Either an instance of gym's Env class, or a string specifying an env to create.")
     reward_scale = Param(None)
+    n_env_workers = Param(
+        0, help="If > 0, the batch of envs is partitioned across this many worker "
+                "processes which step in lockstep. Otherwise envs are stepped serially in this process.")
+    batch_game = Param(
+        False, help="If True, `gym_env` must provide `make_batch(n)` (e.g. an ObjectGame), which returns an object "
+                    "that steps n copies of the env at once with vectorized operations. Used instead of copies of `gym_env`.")
 
     def __init__(self, **kwargs):
         super(BatchGymEnv, self).__init__()
@@ -246,6 +345,9 @@ class BatchGymEnv(Env):
 
         self._env_copies = []
         self._active_envs = []
+        self._pool = None
+        self._batch = None
+        self._worker_seed = None
 
         assert isinstance(self.gym_env.observation_space, Box)
 
@@ -272,6 +374,15 @@ class BatchGymEnv(Env):
         self._mode = mode
         self._n_rollouts = n_rollouts
 
+        if self.batch_game:
+            if self._batch is None or self._batch.n_games != n_rollouts:
+                self._batch = self.gym_env.make_batch(n_rollouts)
+            return
+
+        if self.n_env_workers > 0:
+            self._set_mode_subprocess(n_rollouts)
+            return
+
         n_needed = n_rollouts - len(self._env_copies)
 
         if n_needed > 0:
@@ -288,7 +399,31 @@ class BatchGymEnv(Env):
         self.obs = self._obs[:n_rollouts, ...]
         self.done = self._done[:n_rollouts, ...]
 
+    def _set_mode_subprocess(self, n_rollouts):
+        if self._pool is None or self._pool.n_envs < n_rollouts:
+            if self._pool is not None:
+                self._pool.close()
+
+            self._pool = SubprocessEnvPool(
+                [copy.deepcopy(self.gym_env) for i in range(n_rollouts)],
+                self.obs_shape, self.n_env_workers)
+
+            if self._worker_seed is not None:
+                self._pool.seed(self._worker_seed + np.arange(n_rollouts))
+
+            self._done = np.ones((n_rollouts, 1)).astype('bool')
+
+        self.obs = self._pool.obs[:n_rollouts, ...]
+        self.done = self._done[:n_rollouts, ...]
+
     def reset(self):
+        if self._batch is not None:
+            return self._batch.reset()
+
+        if self._pool is not None:
+            self.done[:] = False
+            return self._pool.reset(self._n_rollouts).copy()
+
         for i, env in enumerate(self._active_envs):
             self.done[i, 0] = True
 
@@ -306,6 +441,30 @@ class BatchGymEnv(Env):
 
         actions = np.array(actions).astype(self.gym_env.action_space.dtype).reshape((-1, *self.gym_env.action_space.shape))
 
+        if self._batch is not None:
+            obs, rewards, done, info = self._batch.step(actions)
+
+            rewards = rewards.reshape(-1, 1)
+            if self.reward_scale:
+                rewards /= self.reward_scale
+
+            return (obs, rewards, done.reshape(-1, 1), info)
+
+        if self._pool is not None:
+            obs, rewards, done, _info = self._pool.step(actions, self.done[:, 0])
+            self.done[:, 0] = done
+
+            rewards = rewards.reshape(-1, 1)
+            if self.reward_scale:
+                rewards /= self.reward_scale
+
+            for i in _info:
+                for k, v in i.items():
+                    info[k].append(v)
+            info = {k: np.array(v) for k, v in info.items()}
+
+            return (obs.copy(), rewards, self.done.copy(), info)
+
         for idx, (a, env) in enumerate(zip(actions, self._active_envs)):
             if self.done[idx, 0]:
                 rewards.append(0.0)
@@ -327,9 +486,21 @@ class BatchGymEnv(Env):
         return (self.obs.copy(), rewards, self.done.copy(), info)
 
     def render(self, mode='human'):
+        if self._batch is not None:
+            return self._batch.render(mode=mode)
+        if self._pool is not None:
+            return self._pool.render(mode=mode)
         self._active_envs[0].render(mode=mode)
 
     def close(self):
+        if self._batch is not None:
+            self._batch.close()
+            self._batch = None
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
         for env in self._env_copies:
             env.close()
 
@@ -338,3 +509,9 @@ class BatchGymEnv(Env):
         for env in self._env_copies:
             s = gen_seed()
             env.seed(s)
+
+        if self.n_env_workers > 0:
+            # Envs living in worker processes are seeded from this, including whenever the pool is rebuilt.
+            self._worker_seed = gen_seed()
+            if self._pool is not None:
+                self._pool.seed(self._worker_seed + np.arange(self._pool.n_envs))
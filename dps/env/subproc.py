@@ -0,0 +1,204 @@
+import multiprocessing
+import traceback
+import numpy as np
+
+
+class SubprocessEnvPool(object):
+    """ Steps a batch of gym envs in lockstep, with the envs partitioned across worker processes.
+
+    Observations are written by the workers directly into an array in shared memory, so only actions,
+    rewards, done flags and info dicts are sent over the pipes. When an env finishes its episode, its
+    worker resets it immediately (while other envs are still stepping), and the initial observation
+    is returned at the next call to `reset`. Envs which are already done are not stepped.
+
+    Parameters
+    ----------
+    envs: list of gym Env
+        The envs to step; copies are sent to (or, when forking, inherited by) the workers.
+    obs_shape: tuple
+        Shape of a single observation.
+    n_workers: int
+        Number of worker processes; the envs are split as evenly as possible between them.
+    context: str or None
+        The multiprocessing start method to use, defaults to the platform's default.
+
+    """
+    def __init__(self, envs, obs_shape, n_workers, context=None):
+        self.n_envs = len(envs)
+        self.obs_shape = tuple(obs_shape)
+        self.n_workers = max(1, min(n_workers, self.n_envs))
+
+        ctx = multiprocessing.get_context(context)
+
+        obs_size = self.n_envs * int(np.prod(self.obs_shape))
+        self._obs_buffer = ctx.RawArray('d', obs_size)
+        self.obs = np.frombuffer(self._obs_buffer, dtype='d').reshape((self.n_envs,) + self.obs_shape)
+
+        self.partitions = np.array_split(np.arange(self.n_envs), self.n_workers)
+
+        self.connections = []
+        self.workers = []
+        for indices in self.partitions:
+            parent_conn, child_conn = ctx.Pipe()
+            worker = ctx.Process(
+                target=_worker,
+                args=(child_conn, [envs[i] for i in indices], self._obs_buffer,
+                      (self.n_envs,) + self.obs_shape, indices[0]),
+                daemon=True)
+            worker.start()
+            child_conn.close()
+
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+        self.closed = False
+
+    def _broadcast(self, cmd, args=None):
+        """ Send one command to every worker, passing it the corresponding element of `args`, then wait for all replies. """
+        args = [None] * self.n_workers if args is None else args
+
+        for conn, arg in zip(self.connections, args):
+            conn.send((cmd, arg))
+
+        results = []
+        for conn in self.connections:
+            status, result = conn.recv()
+            if status == "error":
+                raise Exception("Error in env worker process:\n{}".format(result))
+            results.append(result)
+        return results
+
+    def reset(self, n_active):
+        """ Reset the first `n_active` envs. Returns a view of the shared observation array. """
+        self._broadcast("reset", [n_active - indices[0] for indices in self.partitions])
+        return self.obs[:n_active]
+
+    def step(self, actions, done):
+        """ Step each of the first `len(actions)` envs which are not done.
+
+        Returns
+        -------
+        obs: view of the shared observation array (n_active, *obs_shape)
+        rewards: (n_active,)
+        done: (n_active,) bool
+        info: list of info dicts from envs that were stepped, in env order
+
+        """
+        n_active = len(actions)
+        args = [
+            (actions[indices[0]:indices[-1]+1], done[indices[0]:indices[-1]+1])
+            for indices in self.partitions if indices[0] < n_active]
+        args += [None] * (self.n_workers - len(args))
+
+        results = self._broadcast("step", args)
+
+        rewards = np.concatenate([r for r, _, _ in results if r is not None])
+        new_done = np.concatenate([d for _, d, _ in results if d is not None])
+        info = [i for _, _, _info in results if _info is not None for i in _info]
+
+        return self.obs[:n_active], rewards, new_done, info
+
+    def seed(self, seeds):
+        self._broadcast("seed", [[int(seeds[i]) for i in indices] for indices in self.partitions])
+
+    def render(self, mode='human'):
+        conn = self.connections[0]
+        conn.send(("render", mode))
+        status, result = conn.recv()
+        if status == "error":
+            raise Exception("Error in env worker process:\n{}".format(result))
+        return result
+
+    def close(self):
+        if self.closed:
+            return
+
+        for conn in self.connections:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _worker(conn, envs, obs_buffer, obs_shape, offset):
+    obs = np.frombuffer(obs_buffer, dtype='d').reshape(obs_shape)[offset:offset+len(envs)]
+
+    # Initial observations of envs that were reset automatically at the end of their last episode.
+    pending_reset = [None] * len(envs)
+
+    try:
+        while True:
+            cmd, arg = conn.recv()
+
+            try:
+                if cmd == "reset":
+                    for i, env in enumerate(envs[:max(arg, 0)]):
+                        if pending_reset[i] is None:
+                            obs[i] = env.reset()
+                        else:
+                            obs[i] = pending_reset[i]
+                            pending_reset[i] = None
+                    result = None
+
+                elif cmd == "step":
+                    if arg is None:
+                        result = (None, None, None)
+                    else:
+                        actions, done = arg
+                        rewards = np.zeros(len(actions))
+                        new_done = np.array(done, dtype='bool').reshape(-1)
+                        info = []
+
+                        for i, (a, env) in enumerate(zip(actions, envs)):
+                            if new_done[i]:
+                                continue
+
+                            o, r, d, _info = env.step(a)
+                            obs[i] = o
+                            rewards[i] = r
+                            new_done[i] = d
+                            info.append(_info)
+
+                            if d:
+                                pending_reset[i] = env.reset()
+
+                        result = (rewards, new_done, info)
+
+                elif cmd == "seed":
+                    for env, s in zip(envs, arg):
+                        env.seed(s)
+                    result = None
+
+                elif cmd == "render":
+                    result = envs[0].render(mode=arg)
+
+                elif cmd == "close":
+                    for env in envs:
+                        env.close()
+                    conn.send(("ok", None))
+                    break
+
+                else:
+                    raise Exception("Unknown command: {}".format(cmd))
+
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+            else:
+                conn.send(("ok", result))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        conn.close()
@@ -501,8 +501,14 @@ def build_search(
             with open(exp_dir.path_for('README.md'), 'w') as f:
                 f.write(readme)
 
+        # All runs in the search share a single recording of the host environment.
+        if config.get('environment_key', None) is None:
+            config.environment_key = os.path.basename(exp_dir.path)
+
         print(config)
-        exp_dir.record_environment(config=config)
+        exp_dir.record_environment(
+            config=config, environment_key=config.environment_key,
+            cache_dir=cfg.get('environment_cache_dir', None))
 
         print("Building parameter search at {}.".format(exp_dir.path))
 
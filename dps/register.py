@@ -20,7 +20,7 @@ def convert_dtype(lib, dtype):
 
 
 def concat(values, axis=-1, lib=None):
-    if isinstance(values[0], tf.Tensor):
+    if any(isinstance(v, tf.Tensor) for v in values):
         return tf.concat(values, -1)
     elif isinstance(values[0], np.ndarray):
         return np.concatenate(values, -1)
@@ -28,6 +28,106 @@ def concat(values, axis=-1, lib=None):
         raise Exception()
 
 
+def _last_axis(tensor):
+    ndims = tensor.shape.ndims
+    return -1 if ndims is None else ndims - 1
+
+
+class RegisterLayout(object):
+    """ A compiled layout for a subset of the registers in a RegisterBank.
+
+    Positions of the registers within the bank are computed once, so that the registers can
+    be extracted from (or written into) an array with a fixed, small number of ops, regardless
+    of how many registers are in the layout. Obtain instances using `RegisterBank.layout`.
+
+    Parameters
+    ----------
+    bank: RegisterBank
+        The bank that the layout is for.
+    names: list of str
+        Names of the registers in the layout, in the order that they are extracted/written.
+
+    Attributes
+    ----------
+    width: int
+        Sum of dimensions of the registers in the layout.
+    indices: ndarray
+        Position within the bank of each dimension of the registers in the layout.
+    sizes: list of int
+        Dimension of each register in the layout.
+
+    """
+    def __init__(self, bank, names):
+        self.names = list(names)
+        self.bank_width = bank.width
+
+        unknown = set(self.names) - set(bank.names)
+        if unknown:
+            raise Exception("Unknown registers {} for bank {}.".format(unknown, bank.bank_name))
+
+        self.sizes = [bank.reg_shape(name) for name in self.names]
+        self.indices = np.array(
+            [i for name in self.names for i in range(*bank._offsets[name])], dtype=np.int32)
+        self.width = len(self.indices)
+
+        # If the registers occupy a contiguous block in order, a slice is enough.
+        self.slice = None
+        if self.width and np.array_equal(self.indices, np.arange(self.indices[0], self.indices[0] + self.width)):
+            self.slice = (int(self.indices[0]), int(self.indices[0]) + self.width)
+
+        # Index into the concatenation of a bank array and the layout's values (in that order) which
+        # yields the bank array with the layout's registers replaced.
+        self.scatter_indices = np.arange(self.bank_width, dtype=np.int32)
+        self.scatter_indices[self.indices] = self.bank_width + np.arange(self.width, dtype=np.int32)
+
+    def __str__(self):
+        return "RegisterLayout(names={}, width={})".format(self.names, self.width)
+
+    def __repr__(self):
+        return str(self)
+
+    def get(self, array):
+        """ Values of all registers in the layout, concatenated along the final dimension (a single op). """
+        if self.slice is not None:
+            start, end = self.slice
+            return array[..., start:end]
+
+        if isinstance(array, tf.Tensor):
+            return tf.gather(array, self.indices, axis=_last_axis(array))
+        else:
+            return array[..., self.indices]
+
+    def split(self, array):
+        """ Tuple containing the value of each register in the layout. """
+        if not self.names:
+            return ()
+
+        values = self.get(array)
+
+        if len(self.names) == 1:
+            return (values,)
+
+        if isinstance(values, tf.Tensor):
+            return tuple(tf.split(values, self.sizes, axis=-1))
+        else:
+            return tuple(np.split(values, np.cumsum(self.sizes)[:-1], axis=-1))
+
+    def update(self, array, values):
+        """ Return a copy of `array` with the registers in the layout replaced by `values`, whose
+            final dimension has size `self.width`. For tensors, requires one concat and one gather. """
+        if self.slice == (0, self.bank_width):
+            return values
+
+        if isinstance(array, tf.Tensor) or isinstance(values, tf.Tensor):
+            array = tf.convert_to_tensor(array)
+            values = tf.cast(values, array.dtype)
+            return tf.gather(tf.concat([array, values], axis=-1), self.scatter_indices, axis=_last_axis(array))
+        else:
+            array = array.copy()
+            array[..., self.indices] = values
+            return array
+
+
 class RegisterBank(object):
     """ A wrapper around an array (np.ndarray or tf.Tensor) that allows
         name-based extraction of slices along the final dimension of the array.
@@ -146,6 +246,8 @@ class RegisterBank(object):
         self.hidden_width = self.width - self.visible_width
         self.dtype = tf.float32
 
+        self._layouts = {}
+
     def __str__(self):
         s = ["{}(".format(self.__class__.__name__)]
         s.append("    Registers:")
@@ -215,6 +317,48 @@ class RegisterBank(object):
     def new_placeholder(self, leading_shape):
         return tf.placeholder(tf.float32, leading_shape + (self.width,))
 
+    def layout(self, names=None):
+        """ Return a compiled `RegisterLayout` for the given registers (all registers by default). Cached.
+
+        Parameters
+        ----------
+        names: space-separated str or list of str
+            Names of registers in the layout, in the order they are to be extracted/written.
+
+        """
+        if names is None:
+            names = self.names
+        elif isinstance(names, str):
+            names = names.replace(',', ' ').split()
+
+        names = tuple(names)
+        layout = self._layouts.get(names)
+        if layout is None:
+            layout = self._layouts[names] = RegisterLayout(self, names)
+        return layout
+
+    def get_many(self, names, array):
+        """ Values of the registers `names`, concatenated along the final dimension in a single op. """
+        return self.layout(names).get(array)
+
+    def update(self, array, **registers):
+        """ Return a copy of `array` in which the registers given as keyword arguments have been replaced.
+
+        Unlike `set`, works for both tensors and arrays, and does not modify `array`. All registers are
+        written at once, with a constant number of ops.
+
+        """
+        if not registers:
+            return array
+
+        extra = registers.keys() - set(self.names)
+        if extra:
+            raise Exception("Value provided for unknown registers {}.".format(extra))
+
+        names = [name for name in self.names if name in registers]
+        values = [registers[name] for name in names]
+        return self.layout(names).update(array, concat(values))
+
     def get(self, name, array):
         start, end = self._offsets[name]
         return array[..., start:end]
@@ -232,7 +376,7 @@ class RegisterBank(object):
 
     def as_tuple(self, array, visible_only=False):
         names = self.visible_names if visible_only else self.names
-        return tuple(self.get(name, array) for name in names)
+        return self.layout(names).split(array)
 
     def as_dict(self, array, visible_only=False):
         names = self.visible_names if visible_only else self.names
@@ -241,8 +385,7 @@ class RegisterBank(object):
     def get_output(self, array):
         if not self.output_names:
             raise Exception("`output_names` was not provided at RegisterBank creation time.")
-        values = [self.get(name, array) for name in self.output_names]
-        return concat(values)
+        return self.layout(self.output_names).get(array)
 
     def visible(self, array):
         return array[..., :self.visible_width]
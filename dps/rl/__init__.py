@@ -1,12 +1,14 @@
 from .base import (
     RLUpdater, RLObject, RLContext, rl_render_hook, get_active_context, ObjectiveFunctionTerm,
+    EvaluationScheduler,
 )
 from .terms import (
     PolicyGradient, PolicyEntropyBonus, PolicyEvaluation_State, PolicyEvaluation_StateAction,
     ValueFunctionRegularization, ConstrainedPolicyEvaluation_State, DifferentiableLoss
 )
 from .rollout import RolloutBatch
-from .replay import ReplayBuffer, PrioritizedReplayBuffer
+from .actors import ActorPool, EvaluationPool, Evaluation
+from .replay import ReplayBuffer, PrioritizedReplayBuffer, ProportionalPrioritizedReplayBuffer
 from .agent import AgentHead, Agent
 from .optimizer import Optimizer, StochasticGradientDescent
 from .trust_region import TrustRegionOptimizer
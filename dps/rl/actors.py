@@ -0,0 +1,480 @@
+""" Actor processes which generate rollouts for an off-policy learner.
+
+Each actor builds its own copy of the env and the learner's graph (from the config the learner is
+running under), then repeatedly generates rollouts with the learner's behaviour policy and pushes
+them onto a queue that the learner consumes. Parameters flow the other way through shared memory:
+the learner publishes its agents' flattened parameters (`Agent.get_params_flat`), tagged with a
+version number, and each actor loads the latest version (`Agent.set_params_flat`) before every
+batch of rollouts. Every batch is tagged with the version that generated it, so the learner can
+measure policy lag.
+
+`EvaluationPool` runs evaluation rollouts in worker processes built the same way. Rather than
+following the learner continuously, each evaluation job carries a snapshot of every learner's
+parameters, taken when the job was submitted, so the learner can keep training while the
+evaluation runs.
+
+"""
+import multiprocessing
+import queue
+import time
+import traceback
+
+import dill
+import numpy as np
+import tensorflow as tf
+
+from dps import cfg
+from dps.utils import NumpySeed, gen_seed
+from dps.utils.tf import uninitialized_variables_initializer
+
+
+class ActorPool(object):
+    """ A pool of actor processes generating rollouts for an `RLContext`.
+
+    Parameters
+    ----------
+    context: RLContext
+        The learner. Its graph must already be built.
+    n_actors: int
+        Number of actor processes.
+    batch_size: int
+        Number of rollouts generated by an actor per call to `do_rollouts`.
+    queue_size: int or None
+        Maximum number of rollout batches waiting to be consumed; actors block when the queue
+        is full. Defaults to `2 * n_actors`.
+    start_method: str
+        The multiprocessing start method. Tensorflow does not survive forking a process which
+        has created a session, so the default is "spawn".
+
+    """
+    def __init__(self, context, n_actors, batch_size, queue_size=None, start_method="spawn"):
+        self.agents = context.agents
+        self.n_actors = n_actors
+
+        ctx = multiprocessing.get_context(start_method)
+
+        params = self._get_params()
+        self._params = ctx.RawArray('f', params.size)
+        self._version = ctx.Value('l', 0)
+        self.version = 0
+
+        self.rollout_queue = ctx.Queue(maxsize=queue_size or 2 * n_actors)
+        self.stop_event = ctx.Event()
+
+        self.publish_params()
+
+        config = dill.dumps(cfg.freeze())
+
+        self.workers = []
+        for idx in range(n_actors):
+            worker = ctx.Process(
+                target=_actor,
+                args=(idx, config, gen_seed(), context.name, batch_size,
+                      self._params, self._version, self.rollout_queue, self.stop_event),
+                daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+        self.start_time = time.time()
+        self.n_rollouts = 0
+        self.n_experiences = 0
+        self.closed = False
+
+    def _get_params(self):
+        return np.concatenate([agent.get_params_flat() for agent in self.agents]).astype('f')
+
+    def publish_params(self):
+        """ Make the learner's current parameters available to the actors, as a new version. """
+        params = self._get_params()
+        with self._version.get_lock():
+            np.frombuffer(self._params, dtype='f')[:] = params
+            self._version.value += 1
+            self.version = self._version.value
+
+    def get_rollouts(self, block=False, timeout=None):
+        """ Retrieve all rollout batches that are currently waiting. If `block` is True, waits until at least one is available.
+
+        Returns
+        -------
+        rollouts: list of RolloutBatch
+        lags: list of int
+            For each batch, the number of parameter versions that had been published since
+            the version that generated it.
+
+        """
+        items = []
+        start = time.time()
+        while block and not items:
+            try:
+                items.append(self.rollout_queue.get(timeout=1.0))
+            except queue.Empty:
+                if not any(w.is_alive() for w in self.workers):
+                    raise Exception("All actor processes have exited.")
+                if timeout is not None and time.time() - start > timeout:
+                    break
+
+        try:
+            while True:
+                items.append(self.rollout_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        rollouts, lags = [], []
+        for status, result in items:
+            if status == "error":
+                raise Exception("Error in actor process:\n{}".format(result))
+
+            version, r = result
+            rollouts.append(r)
+            lags.append(self.version - version)
+
+            self.n_rollouts += r.batch_size
+            self.n_experiences += r.batch_size * r.T
+
+        return rollouts, lags
+
+    @property
+    def experiences_per_sec(self):
+        """ Rate at which experiences have been consumed from the actors since the pool was started. """
+        duration = time.time() - self.start_time
+        return self.n_experiences / duration if duration > 0 else 0.0
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.stop_event.set()
+
+        # Unblock actors waiting on a full queue.
+        deadline = time.time() + 10
+        while any(w.is_alive() for w in self.workers) and time.time() < deadline:
+            try:
+                self.rollout_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        for worker in self.workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class Evaluation(object):
+    """ The result of an evaluation submitted to an `EvaluationPool`.
+
+    Attributes
+    ----------
+    id: int
+        Identifier returned by `EvaluationPool.submit`.
+    reward_per_ep: list of float
+        For each learner, the average (over rollouts) of the total reward per episode.
+    n_rollouts: int
+        Number of rollouts generated for each learner.
+    frames: ndarray or None
+        If frames were requested, array of shape (T, batch_size, *image_shape) containing the frames
+        of the first batch of rollouts generated for the final learner.
+    duration: float
+        Time from submission to completion, in seconds.
+
+    """
+    def __init__(self, id, n_learners, n_rollouts, n_chunks):
+        self.id = id
+        self.n_rollouts = n_rollouts
+        self.frames = None
+        self.duration = None
+
+        self._start = time.time()
+        self._reward = [0.0] * n_learners
+        self._n_chunks = n_chunks
+
+    @property
+    def done(self):
+        return self._n_chunks == 0
+
+    @property
+    def reward_per_ep(self):
+        return [r / self.n_rollouts for r in self._reward]
+
+    def _add(self, learner_idx, total_reward, frames):
+        self._reward[learner_idx] += total_reward
+        if frames is not None:
+            self.frames = frames
+
+        self._n_chunks -= 1
+        if self.done:
+            self.duration = time.time() - self._start
+
+
+class EvaluationPool(object):
+    """ A pool of worker processes which evaluate the learners of an `RLUpdater` on arbitrary envs.
+
+    Each worker builds its own copy of the training env and the updater's graph (from the config the
+    updater is running under). Evaluation jobs are submitted with a snapshot of the learners' current
+    parameters; the rollouts for each learner are split into chunks which are spread over the workers.
+
+    Parameters
+    ----------
+    updater: RLUpdater
+        The updater whose learners are evaluated. Its graph must already be built.
+    n_workers: int
+        Number of worker processes.
+    start_method: str
+        The multiprocessing start method. See `ActorPool`.
+
+    """
+    def __init__(self, updater, n_workers, start_method="spawn"):
+        self.learners = updater.learners
+        self.n_workers = n_workers
+
+        ctx = multiprocessing.get_context(start_method)
+        self.job_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+
+        config = dill.dumps(cfg.freeze())
+
+        self.workers = []
+        for idx in range(n_workers):
+            worker = ctx.Process(
+                target=_evaluator, args=(idx, config, gen_seed(), self.job_queue, self.result_queue), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+        self.evaluations = {}
+        self._n_submitted = 0
+        self.closed = False
+
+    def snapshot(self):
+        """ Flattened parameters of every learner, as a list of arrays. """
+        return [np.concatenate([agent.get_params_flat() for agent in learner.agents]).astype('f') for learner in self.learners]
+
+    def submit(self, build_env, n_rollouts, T, env_key=None, mode='val', frames=False):
+        """ Evaluate the learners' current parameters on the env returned by `build_env`.
+
+        Parameters
+        ----------
+        build_env: callable
+            Returns an instance of `Env`. Must be serializable with dill. Each worker calls it once per
+            `env_key` and learner, and caches the result.
+        n_rollouts: int
+            Number of rollouts to generate for each learner.
+        T: int
+            Maximum length of each rollout.
+        env_key: hashable
+            Key under which workers cache the env. Defaults to `build_env` itself.
+        mode: str
+            Mode to generate rollouts in.
+        frames: bool
+            If True, the evaluation includes the frames of one batch of rollouts.
+
+        Returns the id of the evaluation, to be passed to `get`.
+
+        """
+        if self.closed:
+            raise Exception("Cannot submit to an EvaluationPool that has been closed.")
+
+        env_key = build_env if env_key is None else env_key
+        build_env = dill.dumps(build_env)
+        snapshot = self.snapshot()
+
+        chunk_sizes = [
+            len(c) for c in np.array_split(np.arange(n_rollouts), min(self.n_workers, n_rollouts)) if len(c)]
+
+        eval_id = self._n_submitted
+        self._n_submitted += 1
+        self.evaluations[eval_id] = Evaluation(eval_id, len(self.learners), n_rollouts, len(chunk_sizes) * len(self.learners))
+
+        for learner_idx in range(len(self.learners)):
+            for chunk_idx, chunk_size in enumerate(chunk_sizes):
+                want_frames = frames and learner_idx == len(self.learners) - 1 and chunk_idx == 0
+                self.job_queue.put(
+                    (eval_id, learner_idx, snapshot, env_key, build_env, chunk_size, T, mode, want_frames))
+
+        return eval_id
+
+    def _collect(self, block):
+        results = []
+        try:
+            if block:
+                while True:
+                    try:
+                        results.append(self.result_queue.get(timeout=1.0))
+                        break
+                    except queue.Empty:
+                        if not any(w.is_alive() for w in self.workers):
+                            raise Exception("All evaluation processes have exited.")
+            while True:
+                results.append(self.result_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        for status, result in results:
+            if status == "error":
+                raise Exception("Error in evaluation process:\n{}".format(result))
+
+            eval_id, learner_idx, total_reward, frames = result
+            self.evaluations[eval_id]._add(learner_idx, total_reward, frames)
+
+    def get(self, eval_ids, block=False):
+        """ Retrieve completed evaluations.
+
+        Returns a list containing the completed Evaluations among `eval_ids`, in the same order. If `block`
+        is True, waits for all of them to complete. Completed evaluations are removed from the pool.
+
+        """
+        eval_ids = list(eval_ids)
+        self._collect(False)
+        while block and not all(self.evaluations[i].done for i in eval_ids):
+            self._collect(True)
+
+        return [self.evaluations.pop(i) for i in eval_ids if self.evaluations[i].done]
+
+    def close(self):
+        if self.closed:
+            return
+
+        for worker in self.workers:
+            self.job_queue.put(None)
+
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.closed = True
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _build_updater():
+    """ Build the env and updater specified by the current config, in the default graph and session. """
+    env = cfg.build_env()
+    updater = cfg.get_updater(env)
+    updater.build_graph()
+    tf.get_default_session().run(uninitialized_variables_initializer())
+    return env, updater
+
+
+def _set_params(agents, params):
+    sizes = [agent.get_params_flat().size for agent in agents]
+    offsets = np.cumsum([0] + sizes)
+    for agent, start, end in zip(agents, offsets[:-1], offsets[1:]):
+        agent.set_params_flat(params[start:end])
+
+
+def _actor(idx, config, seed, learner_name, batch_size, shared_params, shared_version, rollout_queue, stop_event):
+    config = dill.loads(config)
+    config.update(n_actors=0)
+
+    try:
+        with config, NumpySeed(seed):
+            graph = tf.Graph()
+            sess = tf.Session(graph=graph)
+
+            with graph.as_default(), graph.device("/cpu:0"), sess, sess.as_default():
+                tf.set_random_seed(gen_seed())
+
+                env, updater = _build_updater()
+
+                context = [l for l in updater.learners if l.name == learner_name][0]
+
+                version = None
+                while not stop_event.is_set():
+                    with shared_version.get_lock():
+                        if shared_version.value != version:
+                            version = shared_version.value
+                            params = np.frombuffer(shared_params, dtype='f').copy()
+                        else:
+                            params = None
+
+                    with context:
+                        if params is not None:
+                            _set_params(context.agents, params)
+
+                        rollouts = env.do_rollouts(context.mu, n_rollouts=batch_size, T=cfg.T, mode='train')
+
+                    while not stop_event.is_set():
+                        try:
+                            rollout_queue.put(("ok", (version, rollouts)), timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+
+                for learner in updater.learners:
+                    learner.close()
+                env.close()
+    except Exception:
+        rollout_queue.put(("error", "Actor {}:\n{}".format(idx, traceback.format_exc())))
+
+
+def _evaluator(idx, config, seed, job_queue, result_queue):
+    from dps.rl.base import EvaluationScheduler
+
+    config = dill.loads(config)
+    config.update(n_actors=0)
+
+    try:
+        with config, NumpySeed(seed):
+            graph = tf.Graph()
+            sess = tf.Session(graph=graph)
+
+            with graph.as_default(), graph.device("/cpu:0"), sess, sess.as_default():
+                tf.set_random_seed(gen_seed())
+
+                env, updater = _build_updater()
+                scheduler = EvaluationScheduler()
+
+                envs = {}
+                loaded_snapshot = None
+
+                while True:
+                    job = job_queue.get()
+                    if job is None:
+                        break
+
+                    eval_id, learner_idx, snapshot, env_key, build_env, n_rollouts, T, mode, want_frames = job
+
+                    # All jobs belonging to an evaluation share a snapshot.
+                    if eval_id != loaded_snapshot:
+                        for learner, params in zip(updater.learners, snapshot):
+                            _set_params(learner.agents, params)
+                        loaded_snapshot = eval_id
+
+                    learner = updater.learners[learner_idx]
+
+                    with learner:
+                        eval_env = envs.get((env_key, learner_idx))
+                        if eval_env is None:
+                            eval_env = envs[(env_key, learner_idx)] = dill.loads(build_env)()
+                            eval_env.maybe_build_rollouts(learner.pi)
+                            sess.run(uninitialized_variables_initializer())
+
+                        batches = scheduler.do_rollouts(eval_env, learner.pi, n_rollouts, T, mode)
+
+                    total_reward = sum(r.batch_size * r.rewards.sum(0).mean() for r in batches)
+
+                    frames = None
+                    if want_frames:
+                        image_obs = getattr(getattr(eval_env, 'gym_env', None), 'image_obs', False)
+                        frames = np.array(batches[0].obs if image_obs else batches[0].image)
+
+                    result_queue.put(("ok", (eval_id, learner_idx, float(total_reward), frames)))
+
+                for eval_env in envs.values():
+                    eval_env.close()
+                for learner in updater.learners:
+                    learner.close()
+                env.close()
+    except Exception:
+        result_queue.put(("error", "Evaluator {}:\n{}".format(idx, traceback.format_exc())))
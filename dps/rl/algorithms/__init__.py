@@ -1 +1 @@
-from . import a2c, acer, qlearning
\ No newline at end of file
+from . import a2c, acer, qlearning, trpo
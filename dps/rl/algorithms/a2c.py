@@ -9,7 +9,7 @@ from dps.rl import (
 )
 
 
-def A2C(env):
+def A2C(env, mpi_context=None):
     with RLContext(cfg.gamma) as context:
         actor = cfg.build_policy(
             env, name="actor",
@@ -73,10 +73,10 @@ def A2C(env):
         if env.has_differentiable_loss and cfg.use_differentiable_loss:
             DifferentiableLoss(env, actor)
 
-        optimizer = StochasticGradientDescent(agents=agents, alg=cfg.optimizer_spec)
+        optimizer = StochasticGradientDescent(agents=agents, alg=cfg.optimizer_spec, mpi_context=mpi_context)
         context.set_optimizer(optimizer)
 
-    return RLUpdater(env, context)
+    return RLUpdater(env, context, mpi_context=mpi_context)
 
 
 config = Config(
@@ -129,6 +129,7 @@ actor_critic_config = config.copy(
 ppo_config = config.copy(
     exp_name="PPO",
     opt_steps_per_update=10,
+    in_graph_batching=True,
     epsilon=0.2,
     value_weight=0.0,
 )
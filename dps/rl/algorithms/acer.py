@@ -4,7 +4,7 @@ from dps.rl import (
     RLUpdater, RLContext, Agent, StochasticGradientDescent,
     PolicyGradient, PolicyEvaluation_State, PolicyEntropyBonus,
     AdvantageEstimator, ValueFunction, Retrace,
-    BuildLstmController, PrioritizedReplayBuffer, ReplayBuffer,
+    BuildLstmController, PrioritizedReplayBuffer, ProportionalPrioritizedReplayBuffer, ReplayBuffer,
     ValueFunctionRegularization, BuildEpsilonSoftmaxPolicy,
     BasicAdvantageEstimator,
 )
@@ -51,10 +51,16 @@ def ACER(env):
 
             policy_eval = PolicyEvaluation_State(value_function, values_from_returns, weight=cfg.value_weight)
             priority_func = MaxPriorityFunc(policy_eval)
-            replay_buffer = PrioritizedReplayBuffer(
-                cfg.replay_size, cfg.replay_n_partitions,
-                priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences
-            )
+            if cfg.get('prioritization', 'rank') == 'proportional':
+                replay_buffer = ProportionalPrioritizedReplayBuffer(
+                    cfg.replay_size, priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences,
+                    directory=cfg.get('replay_directory', None))
+            else:
+                replay_buffer = PrioritizedReplayBuffer(
+                    cfg.replay_size, cfg.replay_n_partitions,
+                    priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences,
+                    directory=cfg.get('replay_directory', None),
+                    resort_interval=cfg.get('replay_resort_interval', None))
 
             ValueFunctionRegularization(policy_eval, weight=cfg.value_reg_weight)
 
@@ -74,7 +80,8 @@ def ACER(env):
             advantage_estimator = BasicAdvantageEstimator(
                 actor, q_importance_c=cfg.q_importance_c, v_importance_c=cfg.v_importance_c)
 
-            replay_buffer = ReplayBuffer(cfg.replay_size, cfg.min_experiences)
+            replay_buffer = ReplayBuffer(
+                cfg.replay_size, cfg.min_experiences, directory=cfg.get('replay_directory', None))
 
         PolicyGradient(
             actor, advantage_estimator, epsilon=cfg.epsilon,
@@ -127,7 +134,10 @@ config = Config(
 
     min_experiences=1000,
     replay_size=20000,
+    replay_directory=None,  # If not None, replay memory is backed by memory-mapped files in this directory.
+    prioritization="rank",  # One of "rank", "proportional".
     replay_n_partitions=100,
+    replay_resort_interval=None,  # For rank-based prioritization; if not None, re-sort priorities lazily.
     alpha=0.0,
     beta_schedule=0.0,
 )
@@ -6,7 +6,7 @@ from dps.utils.tf import MLP, CompositeCell
 from dps.rl import (
     RLContext, RLObject, Agent, StochasticGradientDescent, BuildEpsilonGreedyPolicy,
     DiscretePolicy, RLUpdater, ActionValueFunction,
-    PolicyEvaluation_StateAction, Retrace, PrioritizedReplayBuffer
+    PolicyEvaluation_StateAction, Retrace, PrioritizedReplayBuffer, ProportionalPrioritizedReplayBuffer
 )
 
 
@@ -130,9 +130,16 @@ def QLearning(env):
         policy_eval = PolicyEvaluation_StateAction(action_value_function, action_values_from_returns, weight=1.0)
 
         priority_func = MaxPriorityFunc(policy_eval)
-        replay_buffer = PrioritizedReplayBuffer(
-            cfg.replay_size, cfg.replay_n_partitions,
-            priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences)
+        if cfg.get('prioritization', 'rank') == 'proportional':
+            replay_buffer = ProportionalPrioritizedReplayBuffer(
+                cfg.replay_size, priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences,
+                directory=cfg.get('replay_directory', None))
+        else:
+            replay_buffer = PrioritizedReplayBuffer(
+                cfg.replay_size, cfg.replay_n_partitions,
+                priority_func, cfg.alpha, cfg.beta_schedule, cfg.min_experiences,
+                directory=cfg.get('replay_directory', None),
+                resort_interval=cfg.get('replay_resort_interval', None))
         context.set_replay_buffer(cfg.update_batch_size, replay_buffer)
 
         optimizer = StochasticGradientDescent(
@@ -178,7 +185,10 @@ config = Config(
 
     min_experiences=1000,
     replay_size=20000,
+    replay_directory=None,  # If not None, replay memory is backed by memory-mapped files in this directory.
+    prioritization="rank",  # One of "rank", "proportional".
     replay_n_partitions=100,
+    replay_resort_interval=None,  # For rank-based prioritization; if not None, re-sort priorities lazily.
     alpha=1.0,
     beta_schedule=0.0,
     # alpha=0.7,
@@ -0,0 +1,70 @@
+from dps import cfg
+from dps.utils import Config
+from dps.rl import (
+    RLContext, Agent, TrustRegionOptimizer,
+    BuildEpsilonSoftmaxPolicy, BuildLstmController,
+    PolicyGradient, RLUpdater, BasicAdvantageEstimator,
+)
+
+
+def TRPO(env):
+    with RLContext(cfg.gamma) as context:
+        actor = cfg.build_policy(
+            env, name="actor",
+            exploration_schedule=cfg.exploration_schedule,
+            val_exploration_schedule=cfg.val_exploration_schedule
+        )
+
+        context.set_behaviour_policy(actor)
+        context.set_validation_policy(actor)
+
+        agent = Agent("agent", cfg.build_controller, [actor])
+
+        advantage_estimator = BasicAdvantageEstimator(
+            actor, q_importance_c=cfg.q_importance_c, v_importance_c=cfg.v_importance_c)
+
+        PolicyGradient(
+            actor, advantage_estimator, epsilon=None,
+            importance_c=cfg.policy_importance_c, weight=cfg.policy_weight)
+
+        optimizer = TrustRegionOptimizer(
+            agents=[agent], policy=actor, delta_schedule=cfg.delta_schedule,
+            max_cg_steps=cfg.max_cg_steps, max_line_search_steps=cfg.max_line_search_steps,
+            in_graph=cfg.trpo_in_graph)
+        context.set_optimizer(optimizer)
+
+    return RLUpdater(env, context)
+
+
+config = Config(
+    exp_name="TRPO",
+    get_updater=TRPO,
+    n_controller_units=64,
+    batch_size=16,
+    n_val_rollouts=100,
+
+    # Second-order differentiation is required, so T must be known when the graph is built.
+    T=20,
+
+    delta_schedule=0.01,
+    max_cg_steps=10,
+    max_line_search_steps=10,
+
+    # If True, the conjugate gradient solve and the line search are performed in the graph,
+    # and the batch is transferred into the graph only once per update.
+    trpo_in_graph=True,
+
+    exploration_schedule=0.1,
+    val_exploration_schedule=0.0,
+
+    build_policy=BuildEpsilonSoftmaxPolicy(),
+    build_controller=BuildLstmController(),
+
+    policy_weight=1.0,
+    policy_importance_c=0,
+    q_importance_c=None,
+    v_importance_c=None,
+    gamma=1.0,
+
+    render_n_rollouts=4,
+)
@@ -1,14 +1,18 @@
 import numpy as np
 import tensorflow as tf
 import abc
+import copy
 from contextlib import ExitStack
 import time
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from dps import cfg
-from dps.utils import Param, Parameterized, shift_fill
+from dps.utils import Param, Parameterized
 from dps.utils.tf import masked_mean, tf_discount_matrix, build_scheduled_value, get_scheduled_values
 from dps.updater import Updater
+from dps.rl.actors import ActorPool
 
 
 def rl_render_hook(updater):
@@ -81,11 +85,118 @@ def get_active_context():
     return RLContext.active_context
 
 
+class FeedPlan(object):
+    """ Converts RolloutBatches into feed dicts for a fixed set of placeholders.
+
+    The plan (which rollout component feeds each placeholder, and with what dtype and rank) is compiled
+    once, when the graph is built. Each component is converted in a single pass, by copying it into a
+    buffer with the placeholder's dtype (adding a trailing unit dimension to per-step scalars). Buffers
+    are reused from one call to the next while the shape of the batch stays the same; they are kept
+    separately for each mode, so the feed dict returned for one mode remains valid while feed dicts
+    are created for other modes.
+
+    """
+    kinds = "component static mask weights mode".split()
+
+    def __init__(self):
+        self.entries = []
+        self._buffers = {}
+
+    def add(self, placeholder, source=None, kind="component", optional=False):
+        """ Add a placeholder to the plan.
+
+        Parameters
+        ----------
+        placeholder: Tensor
+        source: str
+            Name of the rollout component (or, for kind "static", the static value) that feeds the placeholder.
+        kind: str
+            One of "component", "static", "mask" (1 for time steps before the episode is done, 0 after,
+            computed from `source`), "weights" (per-rollout or per-step weights passed to `feed_dict`)
+            or "mode".
+        optional: bool
+            If True, the placeholder is not fed when `source` is missing from the rollouts.
+
+        """
+        if kind not in self.kinds:
+            raise Exception("Unknown feed kind {}, must be one of {}.".format(kind, self.kinds))
+
+        dtype = placeholder.dtype.as_numpy_dtype
+        ndim = placeholder.shape.ndims
+        self.entries.append((placeholder, source, kind, dtype, ndim, optional))
+
+    def _buffer(self, mode, placeholder, shape, dtype):
+        key = (mode, placeholder)
+        buf = self._buffers.get(key, None)
+        if buf is None or buf.shape != shape:
+            buf = self._buffers[key] = np.empty(shape, dtype=dtype)
+        return buf
+
+    def _convert(self, mode, placeholder, value, dtype, ndim):
+        value = np.asarray(value)
+        if value.ndim == ndim - 1:
+            value = value[..., None]
+        if value.ndim != ndim:
+            raise Exception(
+                "Value for placeholder {} has shape {}, expected {} dimensions.".format(
+                    placeholder.name, value.shape, ndim))
+
+        buf = self._buffer(mode, placeholder, value.shape, dtype)
+        np.copyto(buf, value, casting='unsafe')
+        return buf
+
+    def feed_dict(self, rollouts, mode, weights=None):
+        feed_dict = {}
+        shape = (rollouts.T, rollouts.batch_size, 1)
+
+        for placeholder, source, kind, dtype, ndim, optional in self.entries:
+            if kind == "mode":
+                feed_dict[placeholder] = mode
+
+            elif kind == "weights":
+                buf = self._buffer(mode, placeholder, shape, dtype)
+                if weights is None:
+                    buf.fill(1)
+                else:
+                    weights = np.asarray(weights)
+                    weights = weights.reshape(1, -1, 1) if weights.ndim == 1 else RLContext.at_least_3d(weights)
+                    np.copyto(buf, weights, casting='unsafe')
+                feed_dict[placeholder] = buf
+
+            elif kind == "static":
+                try:
+                    value = rollouts.get_static(source)
+                except KeyError:
+                    if optional:
+                        continue
+                    raise
+                feed_dict[placeholder] = self._convert(mode, placeholder, value, dtype, ndim)
+
+            else:
+                if source not in rollouts:
+                    if optional:
+                        continue
+                    raise Exception("Rollouts have no component named {}.".format(source))
+
+                if kind == "mask":
+                    done = RLContext.at_least_3d(rollouts[source])
+                    buf = self._buffer(mode, placeholder, done.shape, dtype)
+                    buf[:1] = 1
+                    np.subtract(1, done[:-1], out=buf[1:], casting='unsafe')
+                    feed_dict[placeholder] = buf
+                else:
+                    feed_dict[placeholder] = self._convert(mode, placeholder, rollouts[source], dtype, ndim)
+
+        return feed_dict
+
+
 class RLContext(Parameterized):
     active_context = None
 
     replay_updates_per_sample = Param(1)
     on_policy_updates = Param(True)
+    n_actors = Param(0, help="If > 0, rollouts are generated asynchronously by this many actor processes (see `ActorPool`).")
+    param_broadcast_interval = Param(1, help="Number of updates between publishing parameters to the actors.")
 
     def __init__(self, gamma, name=""):
         self.mu = None
@@ -102,6 +213,16 @@ class RLContext(Parameterized):
         self.objective_fn_terms = []
         self.agents = []
         self.rl_objects = []
+        self.stage_batches = False
+        self._stage_ops = {}
+        self.actor_pool = None
+
+        # Number of calls to `update` that have completed. Matches the global step when there is one learner.
+        self.n_updates = 0
+        self._policy_lag = (0.0, 0)
+
+        # Number of rollouts that the most recent call to `update` learned from.
+        self.n_rollouts_last_update = 0
 
     def __enter__(self):
         if RLContext.active_context is not None:
@@ -166,7 +287,11 @@ class RLContext(Parameterized):
 
             stack.enter_context(self)
 
+            # Per-rollout placeholders are only backed by staged variables for optimizers that make use of them.
+            self.stage_batches = self.optimizer.stages_batch
+
             self.build_core_signals()
+            self.feed_plan = self.build_feed_plan()
 
             objective = None
             for term in self.objective_fn_terms:
@@ -182,13 +307,11 @@ class RLContext(Parameterized):
             self.add_recorded_values(get_scheduled_values())
 
     def build_core_signals(self):
-        self._signals['mask'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None, 1), name="_mask")
-        self._signals['done'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None, 1), name="_done")
+        self._signals['mask'] = self.batch_placeholder(tf.float32, (cfg.T, None, 1), "_mask")
+        self._signals['done'] = self.batch_placeholder(tf.float32, (cfg.T, None, 1), "_done")
 
-        self._signals['all_obs'] = tf.placeholder(
-            tf.float32, shape=(cfg.T+1 if cfg.T is not None else None, None) + self.obs_shape, name="_all_obs")
+        self._signals['all_obs'] = self.batch_placeholder(
+            tf.float32, (cfg.T+1 if cfg.T is not None else None, None) + self.obs_shape, "_all_obs")
 
         # observations that we learn about
         self._signals['obs'] = tf.identity(self._signals['all_obs'][:-1, ...], name="_obs")
@@ -196,14 +319,13 @@ class RLContext(Parameterized):
         # observations that we use as targets
         self._signals['target_obs'] = tf.identity(self._signals['all_obs'][1:, ...], name="_target_obs")
 
-        self._signals['actions'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None) + self.action_shape, name="_actions")
+        self._signals['actions'] = self.batch_placeholder(
+            tf.float32, (cfg.T, None) + self.action_shape, "_actions")
         self._signals['gamma'] = tf.constant(self.gamma)
         self._signals['batch_size'] = tf.shape(self._signals['obs'])[1]
         self._signals['batch_size_float'] = tf.cast(self._signals['batch_size'], tf.float32)
 
-        self._signals['rewards'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None, 1), name="_rewards")
+        self._signals['rewards'] = self.batch_placeholder(tf.float32, (cfg.T, None, 1), "_rewards")
         self._signals['returns'] = tf.cumsum(
             self._signals['rewards'], axis=0, reverse=True, name="_returns")
         self._signals['reward_per_ep'] = tf.reduce_mean(
@@ -213,8 +335,7 @@ class RLContext(Parameterized):
 
         self._signals['mode'] = tf.placeholder(tf.string, ())
 
-        self._signals['weights'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None, 1), name="_weights")
+        self._signals['weights'] = self.batch_placeholder(tf.float32, (cfg.T, None, 1), "_weights")
 
         T = tf.shape(self._signals['mask'])[0]
         discount_matrix = tf_discount_matrix(self.gamma, T)
@@ -227,50 +348,135 @@ class RLContext(Parameterized):
         self._signals['average_discounted_returns'] = mean_returns
 
         # off-policy
-        self._signals['mu_utils'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None,) + self.mu.param_shape, name="_mu_log_probs")
-        self._signals['mu_exploration'] = tf.placeholder(
-            tf.float32, shape=(None,), name="_mu_exploration")
-        self._signals['mu_log_probs'] = tf.placeholder(
-            tf.float32, shape=(cfg.T, None, 1), name="_mu_log_probs")
+        self._signals['mu_utils'] = self.batch_placeholder(
+            tf.float32, (cfg.T, None,) + self.mu.param_shape, "_mu_utils")
+        self._signals['mu_exploration'] = self.batch_placeholder(
+            tf.float32, (None,), "_mu_exploration", batch_axis=0)
+        self._signals['mu_log_probs'] = self.batch_placeholder(
+            tf.float32, (cfg.T, None, 1), "_mu_log_probs")
 
         for obj in self.rl_objects:
             obj.build_core_signals(self)
 
+    def _maybe_build_staging(self):
+        if 'batch_indices' in self._signals:
+            return
+
+        with tf.control_dependencies(None):
+            self._staged_batch_size = tf.Variable(0, trainable=False, name="_staged_batch_size")
+            self._staged_batch_size_input = tf.placeholder(tf.int32, (), name="_staged_batch_size_input")
+
+            # Order in which staged rollouts are selected; reset to the identity whenever a batch is staged.
+            self._batch_order = tf.Variable(
+                tf.zeros([0], dtype=tf.int32), trainable=False, validate_shape=False, name="_batch_order")
+
+            self._set_staged_batch_size = tf.group(
+                tf.assign(self._staged_batch_size, self._staged_batch_size_input),
+                tf.assign(self._batch_order, tf.range(self._staged_batch_size_input), validate_shape=False))
+            self._shuffle_staged_batch = tf.assign(
+                self._batch_order, tf.random_shuffle(self._batch_order), validate_shape=False)
+
+            # By default, all staged rollouts are selected.
+            self._batch_start = tf.placeholder_with_default(0, (), name="_batch_start")
+            self._batch_length = tf.placeholder_with_default(self._staged_batch_size.value(), (), name="_batch_length")
+
+            # Indices of the staged rollouts that placeholders created by `batch_placeholder` read from when not fed.
+            self._signals['batch_indices'] = tf.placeholder_with_default(
+                self._batch_order[self._batch_start:self._batch_start+self._batch_length],
+                (None,), name="_batch_indices")
+
+    def batch_placeholder(self, dtype, shape, name, batch_axis=1):
+        """ Create a placeholder for per-rollout data, with the batch dimension at `batch_axis`.
+
+        If `stage_batches` is False (the default, and the case unless the optimizer's `stages_batch` is True),
+        this is an ordinary placeholder. Otherwise, when fed the placeholder behaves like any other, and when not
+        fed its value is read from the batch most recently uploaded by `stage_batch`, restricted to the rollouts
+        given by the `batch_indices` signal (all staged rollouts, by default). This allows optimizers that run the
+        graph several times per update to transfer the batch into the graph only once.
+
+        """
+        if not self.stage_batches:
+            return tf.placeholder(dtype, shape=shape, name=name)
+
+        self._maybe_build_staging()
+        shape = tf.TensorShape(shape)
+
+        with tf.control_dependencies(None):
+            initial_value = tf.zeros([0 if d is None else d for d in shape.as_list()], dtype=dtype)
+            staged = tf.Variable(initial_value, trainable=False, validate_shape=False, name=name + "_staged")
+
+            default = tf.gather(staged, self._signals['batch_indices'], axis=batch_axis)
+            placeholder = tf.placeholder_with_default(default, shape, name=name)
+            self._stage_ops[placeholder] = tf.assign(staged, placeholder, validate_shape=False)
+
+        return placeholder
+
+    def stage_batch(self, feed_dict, batch_size):
+        """ Upload the values that `feed_dict` provides for placeholders created by `batch_placeholder` into the
+            graph, where they are used by subsequent runs that do not feed those placeholders.
+
+        Returns
+        -------
+        A feed dict containing the remaining entries of `feed_dict`, which must still be fed explicitly.
+
+        """
+        if not self.stage_batches:
+            raise Exception("Batch staging is not enabled for this RLContext (see `RLContext.batch_placeholder`).")
+
+        self._maybe_build_staging()
+
+        fetches = [self._set_staged_batch_size]
+        stage_feed_dict = {self._staged_batch_size_input: batch_size}
+        remaining = {}
+
+        for k, v in feed_dict.items():
+            if k in self._stage_ops:
+                fetches.append(self._stage_ops[k])
+                stage_feed_dict[k] = v
+            else:
+                remaining[k] = v
+
+        tf.get_default_session().run(fetches, feed_dict=stage_feed_dict)
+        return remaining
+
+    def shuffle_staged_batch(self):
+        """ Randomly permute the order of the staged rollouts, as used by `staged_minibatch`. """
+        tf.get_default_session().run(self._shuffle_staged_batch)
+
+    def staged_minibatch(self, start, length):
+        """ Returns feed dict entries which restrict placeholders created by `batch_placeholder` (when not fed)
+            to rollouts `start` to `start + length` of the staged batch, in its current order. """
+        return {self._batch_start: start, self._batch_length: length}
+
     @staticmethod
     def at_least_3d(array):
-        array = np.array(array)
+        array = np.asarray(array)
         if array.ndim < 2:
             raise Exception("Array has shape {}".format(array.shape))
         if array.ndim == 2:
             array = array[..., None]
         return array
 
-    def make_feed_dict(self, rollouts, mode, weights=None):
-        if weights is None:
-            weights = np.ones((rollouts.T, rollouts.batch_size, 1))
-        elif weights.ndim == 1:
-            weights = np.tile(weights.reshape(1, -1, 1), (rollouts.T, 1, 1))
-
-        feed_dict = {
-            self._signals['done']: self.at_least_3d(rollouts['done']),
-            self._signals['mask']: self.at_least_3d((1-shift_fill(rollouts['done'], 1)).astype('f')),
-            self._signals['all_obs']: self.at_least_3d(rollouts.o),
-            self._signals['actions']: self.at_least_3d(rollouts.a),
-            self._signals['rewards']: self.at_least_3d(rollouts.r),
-            self._signals['weights']: self.at_least_3d(weights),
-            self._signals['mu_log_probs']: self.at_least_3d(rollouts.log_probs),
-            self._signals['mode']: mode,
-        }
-
-        if hasattr(rollouts, 'utils'):
-            # utils are not always stored in the rollouts as they can occupy a lot of memory
-            feed_dict.update({
-                self._signals['mu_utils']: self.at_least_3d(rollouts.utils),
-                self._signals['mu_exploration']: rollouts.get_static('exploration')
-            })
+    def build_feed_plan(self):
+        plan = FeedPlan()
 
-        return feed_dict
+        plan.add(self._signals['done'], 'done')
+        plan.add(self._signals['mask'], 'done', kind="mask")
+        plan.add(self._signals['all_obs'], 'obs')
+        plan.add(self._signals['actions'], 'actions')
+        plan.add(self._signals['rewards'], 'rewards')
+        plan.add(self._signals['weights'], kind="weights")
+        plan.add(self._signals['mu_log_probs'], 'log_probs')
+        plan.add(self._signals['mode'], kind="mode")
+
+        # utils are not always stored in the rollouts as they can occupy a lot of memory
+        plan.add(self._signals['mu_utils'], 'utils', optional=True)
+        plan.add(self._signals['mu_exploration'], 'exploration', kind="static", optional=True)
+
+        return plan
+
+    def make_feed_dict(self, rollouts, mode, weights=None):
+        return self.feed_plan.feed_dict(rollouts, mode, weights)
 
     def get_signal(self, key, generator=None, gradient=False, masked=True, memoize=True, **kwargs):
         """ Memoized signal retrieval and generation. """
@@ -314,7 +520,11 @@ class RLContext(Parameterized):
 
     def _run_and_record(self, rollouts, mode, weights, do_update):
         sess = tf.get_default_session()
+
+        start = time.time()
         feed_dict = self.make_feed_dict(rollouts, mode, weights)
+        feed_duration = time.time() - start
+
         self.set_mode(mode)
 
         for obj in self.rl_objects:
@@ -334,16 +544,27 @@ class RLContext(Parameterized):
             else:
                 obj.post_eval(feed_dict, self)
 
+        recorded_values['feed_duration'] = feed_duration
         return recorded_values
 
     def update(self, batch_size):
         assert self.mu is not None, "A behaviour policy must be set using `set_behaviour_policy` before calling `update`."
         assert self.optimizer is not None, "An optimizer must be set using `set_optimizer` before calling `update`."
 
+        if self.n_actors > 0:
+            record = self._update_async(batch_size)
+        else:
+            record = self._update_sync(batch_size)
+
+        self.n_updates += 1
+        return record
+
+    def _update_sync(self, batch_size):
         with self:
             start = time.time()
             rollouts = self.env.do_rollouts(self.mu, n_rollouts=batch_size, T=cfg.T, mode='train')
             train_rollout_duration = time.time() - start
+            self.n_rollouts_last_update = rollouts.batch_size
 
             train_record = {}
 
@@ -360,21 +581,118 @@ class RLContext(Parameterized):
                 start = time.time()
 
                 self.replay_buffer.add_rollouts(rollouts)
+                get_batch_duration, n_batches = 0.0, 0
                 for i in range(self.replay_updates_per_sample):
-                    off_policy_rollouts, weights = self.replay_buffer.get_batch(self.update_batch_size)
+                    get_batch_start = time.time()
+                    off_policy_rollouts, weights = self.replay_buffer.get_batch(
+                        self.update_batch_size, step=self.n_updates)
+                    get_batch_duration += time.time() - get_batch_start
+
                     if off_policy_rollouts is None:
                         # Most common reason for `rollouts` being None
                         # is there not being enough experiences in replay memory.
                         break
 
+                    n_batches += 1
                     off_policy_record = self._run_and_record(
                         off_policy_rollouts, mode='off_policy', weights=weights, do_update=True)
 
                 off_policy_duration = time.time() - start
                 off_policy_record['step_duration'] = off_policy_duration
 
+                if n_batches:
+                    off_policy_record['get_batch_duration'] = get_batch_duration / n_batches
+
             return train_record, off_policy_record
 
+    def _update_async(self, batch_size):
+        """ Update using rollouts generated by a pool of actor processes, which is started on the first call.
+
+        Rollouts received from the actors are added to the replay buffer, and `replay_updates_per_sample`
+        off-policy updates are performed; this only blocks when the replay buffer cannot yet supply a batch.
+        Since the actors' parameters may lag behind the learner's, no on-policy updates are performed.
+        Parameters are published to the actors every `param_broadcast_interval` updates.
+
+        The train record always has the same keys. `rollout_duration` is the time spent retrieving rollouts
+        from the pool (of which `wait_duration` was spent blocking), and `step_duration` the time spent on
+        updates. If no rollouts were received, `policy_lag` and `max_policy_lag` repeat the values from the
+        most recent update that did receive rollouts.
+
+        """
+        if self.replay_buffer is None:
+            raise Exception("Asynchronous actors (n_actors > 0) require a replay buffer.")
+
+        if self.actor_pool is None:
+            self.actor_pool = ActorPool(self, self.n_actors, batch_size)
+
+        pool = self.actor_pool
+
+        with self:
+            start = time.time()
+            wait_duration = 0.0
+            rollouts, lags = pool.get_rollouts(block=False)
+            rollout_duration = time.time() - start
+
+            for r in rollouts:
+                self.replay_buffer.add_rollouts(r)
+
+            off_policy_record = {}
+            for i in range(self.replay_updates_per_sample):
+                off_policy_rollouts, weights = self.replay_buffer.get_batch(
+                    self.update_batch_size, step=self.n_updates)
+
+                while off_policy_rollouts is None:
+                    # Not enough experiences in replay memory yet, wait for the actors.
+                    wait_start = time.time()
+                    _rollouts, _lags = pool.get_rollouts(block=True)
+                    wait_duration += time.time() - wait_start
+
+                    for r in _rollouts:
+                        self.replay_buffer.add_rollouts(r)
+                    rollouts.extend(_rollouts)
+                    lags.extend(_lags)
+
+                    off_policy_rollouts, weights = self.replay_buffer.get_batch(
+                        self.update_batch_size, step=self.n_updates)
+
+                off_policy_record = self._run_and_record(
+                    off_policy_rollouts, mode='off_policy', weights=weights, do_update=True)
+
+            if (self.n_updates + 1) % self.param_broadcast_interval == 0:
+                pool.publish_params()
+
+            step_duration = time.time() - start - rollout_duration - wait_duration
+            off_policy_record['step_duration'] = step_duration
+
+        if lags:
+            self._policy_lag = (np.mean(lags), np.max(lags))
+
+        self.n_rollouts_last_update = sum(r.batch_size for r in rollouts)
+
+        train_record = dict(
+            step_duration=step_duration,
+            rollout_duration=rollout_duration + wait_duration,
+            wait_duration=wait_duration,
+            n_rollouts_received=self.n_rollouts_last_update,
+            samples_per_sec=pool.experiences_per_sec,
+            policy_lag=self._policy_lag[0],
+            max_policy_lag=self._policy_lag[1],
+        )
+
+        return train_record, off_policy_record
+
+    def close_actors(self):
+        if self.actor_pool is not None:
+            self.actor_pool.close()
+            self.actor_pool = None
+
+    def close(self):
+        """ Release the context's actor processes and replay memory, at the end of training. """
+        self.close_actors()
+
+        if self.replay_buffer is not None:
+            self.replay_buffer.close()
+
     def evaluate(self, batch_size, mode):
         assert self.pi is not None, "A validation policy must be set using `set_validation_policy` before calling `evaluate`."
 
@@ -383,16 +701,108 @@ class RLContext(Parameterized):
             rollouts = self.env.do_rollouts(self.pi, n_rollouts=batch_size, T=cfg.T, mode=mode)
             eval_rollout_duration = time.time() - start
 
+        eval_record = self.evaluate_rollouts(rollouts, mode)
+        eval_record.update(rollout_duration=eval_rollout_duration)
+        return eval_record
+
+    def evaluate_rollouts(self, rollouts, mode):
+        """ Compute the recorded values for `rollouts`, which were generated by the validation policy. """
+        with self:
             start = time.time()
             eval_record = self._run_and_record(rollouts, mode=mode, weights=None, do_update=False)
-            eval_duration = time.time() - start
-
-            eval_record.update(
-                eval_duration=eval_duration, rollout_duration=eval_rollout_duration)
+            eval_record.update(eval_duration=time.time() - start)
 
         return eval_record
 
 
+class EvaluationScheduler(Parameterized):
+    """ Schedules the rollouts performed during evaluation.
+
+    All rollouts for a given policy are generated in as few calls to `do_rollouts` as
+    possible: batches are as large as `eval_batch_size` and the env's `max_batch_size`
+    (either of which may be None, meaning unlimited) allow. Independent evaluation jobs
+    (ones which use different envs) can be run concurrently in a pool of threads that
+    share the default graph and session. The number of rollouts generated per second
+    is tracked.
+
+    """
+    eval_batch_size = Param(None, help="Maximum number of rollouts per call to `do_rollouts` during evaluation.")
+    n_eval_threads = Param(1, help="Number of threads to use for running independent evaluation jobs.")
+
+    def __init__(self, **kwargs):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.n_rollouts = 0
+        self.duration = 0.0
+
+    def batch_sizes(self, n_rollouts, env=None):
+        max_batch_size = min(
+            self.eval_batch_size or n_rollouts,
+            getattr(env, 'max_batch_size', None) or n_rollouts)
+        n_batches = int(np.ceil(n_rollouts / max_batch_size))
+        return [min(max_batch_size, n_rollouts - i * max_batch_size) for i in range(n_batches)]
+
+    def do_rollouts(self, env, policy, n_rollouts, T, mode):
+        """ Generate `n_rollouts` rollouts, returns a list of RolloutBatches. """
+        start = time.time()
+        rollouts = [
+            env.do_rollouts(policy, n_rollouts=batch_size, T=T, mode=mode)
+            for batch_size in self.batch_sizes(n_rollouts, env)]
+
+        with self._lock:
+            self.duration += time.time() - start
+            self.n_rollouts += n_rollouts
+
+        return rollouts
+
+    def map(self, func, items):
+        """ Apply `func` to each of `items`, concurrently if `n_eval_threads` > 1.
+
+        `func` should only run existing parts of the graph, not add to it. Returns the list of results.
+
+        """
+        items = list(items)
+        if self.n_eval_threads <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        graph = tf.get_default_graph()
+        sess = tf.get_default_session()
+
+        def _func(item):
+            # The default graph and session are thread-local.
+            with ExitStack() as stack:
+                stack.enter_context(graph.as_default())
+                if sess is not None:
+                    stack.enter_context(sess.as_default())
+                return func(item)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.n_eval_threads)
+
+        start = time.time()
+        duration = self.duration
+
+        results = list(self._executor.map(_func, items))
+
+        # Rollouts generated concurrently are counted against wall-clock time.
+        self.duration = duration + time.time() - start
+
+        return results
+
+    @property
+    def rollouts_per_sec(self):
+        return self.n_rollouts / self.duration if self.duration > 0 else 0.0
+
+    def reset_stats(self):
+        self.n_rollouts = 0
+        self.duration = 0.0
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
 class RLUpdater(Updater):
     """ Update parameters of objects (mainly policies and value functions)
         based on sequences of interactions between a behaviour policy and
@@ -423,11 +833,19 @@ class RLUpdater(Updater):
         assert len(learner_names) == len(set(learner_names)), (
             "Learners must have unique names. Names are: {}".format(learner_names))
 
+        self.eval_scheduler = EvaluationScheduler()
+        self._eval_envs = None
+
         super(RLUpdater, self).__init__(env, **kwargs)
 
     def trainable_variables(self, for_opt):
         return [v for learner in self.learners for v in learner.trainable_variables(for_opt=for_opt)]
 
+    @property
+    def data_parallel(self):
+        # Only optimizers given an MPI communicator (see `StochasticGradientDescent`) average gradients.
+        return any(getattr(learner.optimizer, 'mpi_comm', None) is not None for learner in self.learners)
+
     def _build_graph(self):
         for learner in self.learners:
             learner.build_graph(self.env)
@@ -447,21 +865,61 @@ class RLUpdater(Updater):
 
         return dict(train=train_record, off_policy=off_policy_record)
 
+    def _n_experiences_in_update(self, batch_size):
+        # Learners with asynchronous actors learn from however many rollouts the actors delivered, rather than
+        # `batch_size`. As before, an update counts once no matter how many learners it involves.
+        return max(learner.n_rollouts_last_update for learner in self.learners)
+
+    def worker_code(self):
+        super(RLUpdater, self).worker_code()
+
+        for learner in self.learners:
+            learner.close()
+
+    def stop_workers(self):
+        super(RLUpdater, self).stop_workers()
+
+        for learner in self.learners:
+            learner.close()
+
+        if self._eval_envs is not None:
+            for env in self._eval_envs[1:]:
+                env.close()
+            self._eval_envs = None
+
+    def _get_eval_envs(self):
+        """ One env per learner, so that learners can be evaluated concurrently. The first learner uses the
+            training env, the others use copies of it. Samplers are built here, so evaluation only runs the graph. """
+        if self._eval_envs is None:
+            self._eval_envs = [self.env] + [copy.deepcopy(self.env) for _ in self.learners[1:]]
+
+            for env, learner in zip(self._eval_envs, self.learners):
+                with learner:
+                    env.maybe_build_rollouts(learner.pi)
+
+        return self._eval_envs
+
     def _evaluate(self, batch_size, mode):
+        # `batch_size` is not used: each learner's `n_val_rollouts` rollouts are generated in batches
+        # limited only by `eval_batch_size` and the env's `max_batch_size`.
         n_rollouts = cfg.n_val_rollouts
-        record = defaultdict(float)
-        n_iters = int(np.ceil(n_rollouts / batch_size))
+        envs = self._get_eval_envs()
 
-        for it in range(n_iters):
-            n_remaining = n_rollouts - it * batch_size
-            _batch_size = min(batch_size, n_remaining)
+        # Rollouts for different learners are generated concurrently (if `n_eval_threads` > 1), each in its own env.
+        self.eval_scheduler.reset_stats()
+        results = self.eval_scheduler.map(
+            lambda job: self.eval_scheduler.do_rollouts(job[0], job[1].pi, n_rollouts, cfg.T, mode),
+            zip(envs, self.learners))
 
-            for learner in self.learners:
-                _record = learner.evaluate(_batch_size, mode)
+        record = defaultdict(float)
+        for learner, batches in zip(self.learners, results):
+            for rollouts in batches:
+                _record = learner.evaluate_rollouts(rollouts, mode)
 
                 for k, v in _record.items():
                     key = (learner.name + ":" if learner.name else "") + k
-                    record[key] += _batch_size * v
+                    record[key] += rollouts.batch_size * v
 
         record = {k: v / n_rollouts for k, v in record.items()}
+        record['rollouts_per_sec'] = self.eval_scheduler.rollouts_per_sec
         return record
@@ -0,0 +1,140 @@
+""" Numpy implementations of return-based estimators.
+
+These compute the same quantities as the corresponding signals built in the graph (`discounted_returns`,
+`Retrace`, generalized advantage estimation), but operate on arrays that are already on the host (e.g.
+batches sampled from replay memory, or stored rollouts being analyzed offline), so no session round trip
+is required. All arrays have shape (T, batch_size, ...) and are processed for all time steps at once.
+
+"""
+import numpy as np
+
+
+# Above this number of elements, `reverse_linear_recurrence` loops over time rather than
+# materializing a (T, T, ...) array.
+_MAX_VECTORIZED_SIZE = 2**24
+
+
+def reverse_linear_recurrence(a, b, final=0.0):
+    """ Solve the recurrence x[t] = a[t] + b[t] * x[t+1] for t = T-1, ..., 0, with x[T] = `final`.
+
+    Parameters
+    ----------
+    a: array (T, ...)
+    b: array broadcastable to the shape of `a`, or scalar
+    final: array broadcastable to a[0], or scalar
+
+    """
+    a = np.asarray(a, dtype='d')
+    T = a.shape[0]
+    b = np.broadcast_to(np.asarray(b, dtype='d'), a.shape)
+    final = np.broadcast_to(np.asarray(final, dtype='d'), a.shape[1:])
+
+    if not T:
+        return a.copy()
+
+    if T * a.size > _MAX_VECTORIZED_SIZE:
+        x = np.empty_like(a)
+        x_next = final
+        for t in range(T-1, -1, -1):
+            x[t] = a[t] + b[t] * x_next
+            x_next = x[t]
+        return x
+
+    # cumulative[t, k] = prod_{j=t}^{k} b[j] for k >= t (and 1 for k < t).
+    extra_dims = (1,) * (a.ndim - 1)
+    upper = (np.arange(T)[None, :] >= np.arange(T)[:, None]).reshape((T, T) + extra_dims)
+    cumulative = np.cumprod(np.where(upper, b[None, ...], 1.0), axis=1)
+
+    # weights[t, k] = prod_{j=t}^{k-1} b[j] for k >= t, 0 otherwise. Computed without division, so zeros in `b` are fine.
+    weights = np.concatenate([np.ones_like(cumulative[:, :1]), cumulative[:, :-1]], axis=1)
+    weights = np.where(upper, weights, 0.0)
+
+    return (weights * a[None, ...]).sum(axis=1) + cumulative[:, -1] * final
+
+
+def discounted_returns(rewards, gamma):
+    """ Sum of discounted future rewards at each time step. Matches the `discounted_returns` signal. """
+    return reverse_linear_recurrence(rewards, gamma)
+
+
+def truncated_importance_weights(pi_log_probs, mu_log_probs, c=None):
+    """ Importance weights pi / mu, truncated at `c`. Matches the `rho` signal of a Policy:
+        if `c` is None, all weights are 1; if `c` <= 0, weights are not truncated. """
+    if c is None:
+        return np.ones_like(np.asarray(pi_log_probs, dtype='d'))
+
+    rho = np.exp(np.asarray(pi_log_probs, dtype='d') - np.asarray(mu_log_probs, dtype='d'))
+    if c > 0:
+        rho = np.minimum(rho, c)
+    return rho
+
+
+def retrace(rewards, values, rho, gamma, lmbda=1.0, to_action_value=False):
+    """ Retrace estimates, matching the `Retrace` signal.
+
+    Parameters
+    ----------
+    rewards: array (T, batch_size, 1)
+    values: array (T, batch_size, 1)
+        Value estimates for the state at each time step.
+    rho: array (T, batch_size, 1)
+        Truncated importance weights for the action taken at each time step.
+    gamma: float
+        Discount factor.
+    lmbda: float
+        Trace decay.
+    to_action_value: bool
+        If True, estimate the value of the state-action pair at each time step, otherwise
+        estimate the value of the state.
+
+    Returns
+    -------
+    retrace, one_step_estimate, adjustment: arrays (T, batch_size, 1)
+
+    """
+    rewards = np.asarray(rewards, dtype='d')
+    values = np.asarray(values, dtype='d')
+    rho = np.asarray(rho, dtype='d')
+
+    # Values of the next state, with 0 after the final time step.
+    next_values = np.concatenate([values[1:], np.zeros_like(values[:1])], axis=0)
+
+    if to_action_value:
+        # Importance weights of the next action, as the current action is given.
+        rho = np.concatenate([rho[1:], np.ones_like(rho[:1])], axis=0)
+        a = rewards + gamma * (1 - lmbda) * next_values
+        b = gamma * lmbda * rho
+    else:
+        a = rho * (rewards + gamma * (1 - lmbda) * next_values)
+        b = rho * gamma * lmbda
+
+    estimate = reverse_linear_recurrence(a, b)
+
+    next_estimate = np.concatenate([estimate[1:], np.zeros_like(estimate[:1])], axis=0)
+    if to_action_value:
+        one_step_estimate = rewards + gamma * next_values
+        adjustment = gamma * lmbda * (rho * next_estimate - next_values)
+    else:
+        one_step_estimate = rho * (rewards + gamma * next_values)
+        adjustment = rho * gamma * lmbda * (next_estimate - next_values)
+
+    return estimate, one_step_estimate, adjustment
+
+
+def generalized_advantage(rewards, values, gamma, lmbda=1.0, rho=None):
+    """ Generalized advantage estimates, computed as the difference between Retrace
+        estimates of action values and `values`. With `rho` equal to 1 everywhere
+        (the default), this is standard (on-policy) GAE. """
+    values = np.asarray(values, dtype='d')
+    rho = np.ones_like(values) if rho is None else rho
+    action_values, _, _ = retrace(rewards, values, rho, gamma, lmbda, to_action_value=True)
+    return action_values - values
+
+
+def retrace_targets(rollouts, values, pi_log_probs, gamma, lmbda=1.0, importance_c=0, to_action_value=False):
+    """ Compute Retrace targets for a RolloutBatch (e.g. one sampled from replay memory), using the behaviour
+        policy log probs stored in the batch. `values` and `pi_log_probs` are the current value estimates
+        and the log probs of the stored actions under the target policy. """
+    rho = truncated_importance_weights(pi_log_probs, rollouts.log_probs, importance_c)
+    targets, _, _ = retrace(rollouts.rewards, values, rho, gamma, lmbda, to_action_value)
+    return targets
@@ -2,10 +2,13 @@ import tensorflow as tf
 import numpy as np
 
 from dps.utils import Parameterized, Param
-from dps.utils.tf import build_gradient_train_op
+from dps.utils.tf import build_gradient_train_op, mpi_broadcast_variables
 
 
 class Optimizer(Parameterized):
+    # Whether the optimizer uploads each batch into the graph with `RLContext.stage_batch`.
+    stages_batch = False
+
     def __init__(self, agents):
         self.agents = agents
 
@@ -19,22 +22,48 @@ class StochasticGradientDescent(Optimizer):
     lr_schedule = Param()
     max_grad_norm = Param(None)
     noise_schedule = Param(None)
+    in_graph_batching = Param(
+        False, help="If True, the batch is transferred into the graph once per update, and minibatches "
+                    "are selected from it in the graph, rather than being sliced in numpy and fed.")
 
-    def __init__(self, agents, alg, **kwargs):
+    def __init__(self, agents, alg, mpi_context=None, **kwargs):
         super(StochasticGradientDescent, self).__init__(agents)
         self.alg = alg
 
+        # With an MPI context that has more than one process, training is synchronous and data-parallel:
+        # every process computes gradients on its own rollouts, and the gradients are averaged before being applied.
+        self.mpi_comm = None
+        if mpi_context is not None and mpi_context.n_procs > 1:
+            self.mpi_comm = mpi_context.merged_comm
+        self.params_synced = False
+
+    @property
+    def stages_batch(self):
+        return self.in_graph_batching
+
     def build_update(self, context):
+        self.context = context
         tvars = self.trainable_variables(for_opt=True)
 
         # `context.objective` is the quantity we want to maximize, but TF minimizes, so use negative.
         self.train_op, train_recorded_values = build_gradient_train_op(
             -context.objective, tvars, self.alg, self.lr_schedule, self.max_grad_norm,
-            self.noise_schedule)
+            self.noise_schedule, mpi_comm=self.mpi_comm)
 
         context.add_recorded_values(train_recorded_values, train_only=True)
 
+    def maybe_sync_params(self):
+        """ Before the first data-parallel update, give every process the parameters of the process with rank 0. """
+        if self.mpi_comm is not None and not self.params_synced:
+            mpi_broadcast_variables(self.trainable_variables(for_opt=False), self.mpi_comm, root=0)
+            self.params_synced = True
+
     def update(self, n_rollouts, feed_dict, fetches):
+        self.maybe_sync_params()
+
+        if self.in_graph_batching:
+            return self._update_in_graph(n_rollouts, feed_dict, fetches)
+
         sess = tf.get_default_session()
         for epoch in range(self.opt_steps_per_update):
             record = epoch == self.opt_steps_per_update-1
@@ -49,6 +78,32 @@ class StochasticGradientDescent(Optimizer):
 
         return fetched[1]
 
+    def _update_in_graph(self, n_rollouts, feed_dict, fetches):
+        sess = tf.get_default_session()
+
+        # Only entries which are not per-rollout data (e.g. the mode) remain to be fed.
+        feed_dict = self.context.stage_batch(feed_dict, n_rollouts)
+
+        for epoch in range(self.opt_steps_per_update):
+            record = epoch == self.opt_steps_per_update-1
+
+            if not self.sub_batch_size:
+                _fetches = [self.train_op, fetches] if record else self.train_op
+                fetched = sess.run(_fetches, feed_dict=feed_dict)
+            else:
+                self.context.shuffle_staged_batch()
+
+                updates_per_epoch = int(np.floor(n_rollouts / self.sub_batch_size))
+                for i in range(updates_per_epoch):
+                    is_final = i == updates_per_epoch-1
+                    fd = feed_dict.copy()
+                    fd.update(self.context.staged_minibatch(i * self.sub_batch_size, self.sub_batch_size))
+
+                    _fetches = [self.train_op, fetches] if (record and is_final) else self.train_op
+                    fetched = sess.run(_fetches, feed_dict=fd)
+
+        return fetched[1]
+
     def subsample_feed_dict(self, n_rollouts, feed_dict):
         updates_per_epoch = int(np.floor(n_rollouts / self.sub_batch_size))
         permutation = np.random.permutation(n_rollouts)
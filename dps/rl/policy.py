@@ -99,7 +99,10 @@ class Policy(AgentHead):
             utils = self.agent.get_utils(self, context)
             return self.action_selection.sample(utils, self.exploration)
         elif key == 'kl':
-            raise Exception("NotImplemented")
+            # KL divergence from the policy with its parameters held fixed at their current values. The value is
+            # always 0, but its Hessian with respect to the parameters is the Fisher information matrix.
+            utils = self.agent.get_utils(self, context)
+            return self.action_selection.kl(tf.stop_gradient(utils), utils, self.exploration)
         elif key in ['monte_carlo_values', 'monte_carlo_action_values']:
             c = kwargs.get('c', None)
             rho = context.get_signal('rho', self, c=c)
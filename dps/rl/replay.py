@@ -1,10 +1,169 @@
+import os
+import shutil
+import tempfile
 import numpy as np
 import tensorflow as tf
-from itertools import cycle, islice
 from pyskiplist import SkipList
 
 from dps.rl import RolloutBatch, RLObject
-from dps.utils.tf import build_scheduled_value
+from dps.utils.tf import build_scheduled_value, eval_schedule
+
+
+class ReplayStore(object):
+    """ Fixed-capacity ring buffer of rollouts, stored column-wise.
+
+    Each component of the stored rollouts (obs, actions, rewards, etc.) is kept in a single contiguous
+    array of shape (size, T) + element_shape, and each static value in an array of shape (size,).
+    Adding a batch of rollouts writes into the next slots of the ring, overwriting the oldest
+    rollouts once the store is full, and retrieving a batch is a single fancy-indexing
+    operation per component. Components with fewer than 2 dimensions (which are not
+    per-rollout, e.g. info dicts) are not stored.
+
+    The number of valid time steps in each stored rollout (i.e. up to and including the first
+    step where `done` is set) is tracked, so that sub-sequences can be sampled without
+    crossing episode boundaries.
+
+    Arrays are allocated lazily when the first rollouts are added, since that is when their shapes
+    and dtypes become known.
+
+    Parameters
+    ----------
+    size: int
+        Maximum number of rollouts to store.
+    directory: str or None
+        If supplied, arrays are backed by memory-mapped .npy files, allowing stores larger than
+        available RAM. The files are written to a fresh subdirectory of `directory` (named after
+        `name`), so several stores can share the same `directory` without overwriting each other.
+    name: str or None
+        Prefix for the name of the subdirectory holding the memory-mapped files.
+
+    """
+    def __init__(self, size, directory=None, name=None):
+        self.size = size
+
+        self.index = 0
+        self.n_rollouts = 0
+        self.T = None
+
+        self._arrays = {}
+        self._static = {}
+        self.lengths = np.zeros(size, dtype='i')
+
+        if directory is None:
+            self.directory = None
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix="{}_".format(name or "replay"), dir=directory)
+
+    def __len__(self):
+        return self.n_rollouts
+
+    def close(self):
+        """ Release the stored rollouts, and delete the subdirectory holding the memory-mapped files (if any).
+            The store cannot be used afterwards. """
+        self._arrays = {}
+        self._static = {}
+
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._arrays.values()) + sum(a.nbytes for a in self._static.values())
+
+    def _allocate(self, name, shape, dtype):
+        shape = (self.size,) + tuple(shape)
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+
+        path = os.path.join(self.directory, "{}.npy".format(name))
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def add_rollouts(self, rollouts):
+        """ Add the rollouts in `rollouts` to the store. Returns the slot indices that were written to. """
+        assert isinstance(rollouts, RolloutBatch)
+
+        if self.T is None:
+            self.T = rollouts.T
+        elif rollouts.T != self.T:
+            raise Exception(
+                "All rollouts in a ReplayStore must have the same length; "
+                "store has length {}, rollouts have length {}.".format(self.T, rollouts.T))
+
+        n = rollouts.batch_size
+        if n > self.size:
+            raise Exception("Cannot add {} rollouts to a ReplayStore of size {}.".format(n, self.size))
+
+        slots = (self.index + np.arange(n)) % self.size
+
+        for k, v in rollouts.items():
+            if v.ndim < 2:
+                continue
+
+            if k not in self._arrays:
+                if v.dtype == object:
+                    raise Exception("Component `{}` has dtype object, cannot be stored in a ReplayStore.".format(k))
+                self._arrays[k] = self._allocate(k, (v.shape[0],) + v.shape[2:], v.dtype)
+
+            self._arrays[k][slots] = np.swapaxes(v, 0, 1)
+
+        for k, v in rollouts._static.items():
+            v = np.array(v)
+            if k not in self._static:
+                self._static[k] = self._allocate("static_" + k, v.shape[1:], v.dtype)
+            self._static[k][slots] = v
+
+        if 'done' in rollouts:
+            done = rollouts['done'].reshape(rollouts.T, n, -1)[..., 0].astype('bool')
+            first_done = np.argmax(done, axis=0)
+            self.lengths[slots] = np.where(done.any(axis=0), first_done + 1, rollouts.T)
+        else:
+            self.lengths[slots] = rollouts.T
+
+        self.index = (self.index + n) % self.size
+        self.n_rollouts = min(self.n_rollouts + n, self.size)
+
+        return slots
+
+    def get(self, indices, start=None, length=None):
+        """ Retrieve the rollouts stored in slots `indices` as a RolloutBatch.
+
+        If `start` is supplied (an array with one entry per index), then the sub-sequence
+        of length `length` beginning at time step `start[i]` is retrieved from each rollout.
+        Components that are longer than the rollouts (e.g. `obs`, which includes the final
+        observation) keep their extra entries.
+
+        """
+        indices = np.asarray(indices)
+
+        if start is None:
+            components = {k: np.swapaxes(a[indices], 0, 1) for k, a in self._arrays.items()}
+        else:
+            components = {}
+            for k, a in self._arrays.items():
+                extra = a.shape[1] - self.T
+                time_indices = np.asarray(start)[:, None] + np.arange(length + extra)[None, :]
+                components[k] = np.swapaxes(a[indices[:, None], time_indices], 0, 1)
+
+        static = {k: list(a[indices]) for k, a in self._static.items()}
+        # Fancy indexing has already copied the components, so the batch can take ownership of them.
+        return RolloutBatch._from_arrays(components, static=static)
+
+    def sample_indices(self, batch_size):
+        return np.random.randint(self.n_rollouts, size=batch_size)
+
+    def sample_sequences(self, batch_size, length):
+        """ Sample `batch_size` sub-sequences of length `length`, each lying within the valid (pre-termination)
+            portion of a single stored rollout. Rollouts whose valid portion is shorter than `length`
+            are never sampled. Returns a RolloutBatch with T == length. """
+        candidates = np.flatnonzero(self.lengths[:self.n_rollouts] >= length)
+        if not len(candidates):
+            return None
+
+        indices = candidates[np.random.randint(len(candidates), size=batch_size)]
+        start = np.random.randint(self.lengths[indices] - length + 1)
+        return self.get(indices, start=start, length=length)
 
 
 class ReplayBuffer(RLObject):
@@ -19,28 +178,35 @@ class ReplayBuffer(RLObject):
         Minimum number of experiences that must be stored in the replay buffer before it will return
         a valid batch when `get_batch` is called. Before this point, it returns None, indicating that
         whatever is making use of this replay memory should not make an update.
+    directory: str or None
+        If supplied, experiences are stored in memory-mapped files in a subdirectory of this
+        directory named after the buffer.
 
     """
-    def __init__(self, size, min_experiences=None, name=None):
+    def __init__(self, size, min_experiences=None, name=None, directory=None):
         self.size = size
         self.min_experiences = min_experiences
-        self.index = 0
-        self._experiences = {}
+        self.store = ReplayStore(size, directory=directory, name=name or self.__class__.__name__)
 
         super(ReplayBuffer, self).__init__(name)
 
+    @property
+    def index(self):
+        return self.store.index
+
     @property
     def n_experiences(self):
-        return len(self._experiences)
+        return len(self.store)
+
+    def close(self):
+        self.store.close()
 
     def add_rollouts(self, rollouts):
-        assert isinstance(rollouts, RolloutBatch)
-        for r in rollouts.split():
-            # If there was already an experience at location `self.index`, it is effectively ejected.
-            self._experiences[self.index] = r
-            self.index = (self.index + 1) % self.size
+        # If there were already experiences at the slots being written to, they are effectively ejected.
+        self.store.add_rollouts(rollouts)
 
-    def get_batch(self, batch_size):
+    def get_batch(self, batch_size, step=None):
+        """ `step` is the learner's update count, unused since sampling is uniform. """
         no_sample = (
             (self.min_experiences is not None and
              self.n_experiences < self.min_experiences) or
@@ -48,8 +214,8 @@ class ReplayBuffer(RLObject):
         if no_sample:
             return None, None
 
-        indices = np.random.randint(self.n_experiences, size=batch_size)
-        experiences = RolloutBatch.join([self._experiences[i] for i in indices])
+        indices = self.store.sample_indices(batch_size)
+        experiences = self.store.get(indices)
 
         weights = np.ones_like(indices).astype('f')
 
@@ -79,9 +245,20 @@ class PrioritizedReplayBuffer(RLObject):
         Minimum number of experiences that must be stored in the replay buffer before it will return
         a valid batch when `get_batch` is called. Before this point, it returns None, indicating that
         whatever is making use of this replay memory should not make an update.
+    directory: str or None
+        If supplied, experiences are stored in memory-mapped files in a subdirectory of this
+        directory named after the buffer.
+    resort_interval: int > 0 or None
+        If None, experiences are kept exactly sorted by priority in a skip list, which is re-sorted
+        on every call to `update_priority`. Otherwise, priorities are kept in an array and the ranking is
+        only recomputed (with a single argsort) after every `resort_interval` calls to `update_priority`,
+        so the ranking used for sampling is stale by at most that many updates. New experiences are
+        placed at the top of the ranking immediately.
 
     """
-    def __init__(self, size, n_partitions, priority_func, alpha, beta_schedule, min_experiences=None, name=None):
+    def __init__(
+            self, size, n_partitions, priority_func, alpha, beta_schedule,
+            min_experiences=None, name=None, directory=None, resort_interval=None):
         self.size = size
         self.n_partitions = n_partitions
         self.priority_func = priority_func
@@ -89,14 +266,23 @@ class PrioritizedReplayBuffer(RLObject):
         self.beta_schedule = beta_schedule
         self.min_experiences = min_experiences
 
-        self.index = 0
+        self.resort_interval = resort_interval
 
-        self._experiences = {}
+        self.store = ReplayStore(size, directory=directory, name=name or self.__class__.__name__)
 
-        # Note this is actually a MIN priority queue, so to make it act like a MAX priority
-        # queue, we use the negative of the provided priorities.
-        self.skip_list = SkipList()
-        self.distributions = self.build_distribution()
+        if resort_interval is None:
+            # Note this is actually a MIN priority queue, so to make it act like a MAX priority
+            # queue, we use the negative of the provided priorities.
+            self.skip_list = SkipList()
+        else:
+            self.priorities = np.zeros(size)
+
+            # Experience indices in decreasing order of priority, as of the last re-sort.
+            self.ranking = np.zeros(0, dtype='i')
+            self.updates_since_resort = 0
+            self.n_resorts = 0
+
+        self.build_distribution()
 
         self._active_set = None
 
@@ -117,9 +303,16 @@ class PrioritizedReplayBuffer(RLObject):
             priority = tf.get_default_session().run(self.priority_signal, feed_dict=feed_dict)
             self.update_priority(priority)
 
+    @property
+    def index(self):
+        return self.store.index
+
     @property
     def n_experiences(self):
-        return len(self._experiences)
+        return len(self.store)
+
+    def close(self):
+        self.store.close()
 
     def build_distribution(self):
         pdf = np.arange(1, self.size+1)**-self.alpha
@@ -146,31 +339,44 @@ class PrioritizedReplayBuffer(RLObject):
             strata_sizes.append(strata_ends[-1] - strata_starts[-1])
             start_idx = end_idx
 
-        self.strata_starts = strata_starts
-        self.strata_ends = strata_ends
-        self.strata_sizes = strata_sizes
+        self.strata_starts = np.array(strata_starts)
+        self.strata_ends = np.array(strata_ends)
+        self.strata_sizes = np.array(strata_sizes)
         self.pdf = pdf
 
     def add_rollouts(self, rollouts):
-        assert isinstance(rollouts, RolloutBatch)
-        for r in rollouts.split():
-            # If there was already an experience at location `self.index`, it is effectively ejected.
-            self._experiences[self.index] = r
+        # If there were already experiences at the slots being written to, they are effectively ejected.
+        slots = self.store.add_rollouts(rollouts)
+
+        if self.resort_interval is not None:
+            # Insert with the current maximum priority, at the top of the ranking.
+            priority = self.priorities[self.ranking].max() if len(self.ranking) else 0.0
+            self.priorities[slots] = priority
+            self.ranking = np.concatenate([slots, self.ranking[~np.isin(self.ranking, slots)]])
+            return
 
+        for e_idx in slots:
             # Insert with minimum priority initially.
             if self.skip_list:
                 priority = self.skip_list[0][0]
             else:
                 priority = 0.0
-            self.skip_list.insert(priority, self.index)
-
-            self.index = (self.index + 1) % self.size
+            self.skip_list.insert(priority, int(e_idx))
 
     def update_priority(self, priorities):
         """ update priority after calling `get_batch` """
         if self._active_set is None:
             raise Exception("``update_priority`` should only called after calling ``get_batch``.")
 
+        if self.resort_interval is not None:
+            self.priorities[self._active_set] = priorities
+            self._active_set = None
+
+            self.updates_since_resort += 1
+            if self.updates_since_resort >= self.resort_interval:
+                self.resort()
+            return
+
         for (p_idx, e_idx, old_priority), new_priority in zip(self._active_set, priorities):
             # negate `new_priority` because SkipList puts lowest first.
             if old_priority != -new_priority:
@@ -179,7 +385,15 @@ class PrioritizedReplayBuffer(RLObject):
 
         self._active_set = None
 
-    def get_batch(self, batch_size):
+    def resort(self):
+        """ Recompute the ranking from the current priorities. Only applicable when `resort_interval` is not None. """
+        # Stable, so that ties keep their current relative order.
+        self.ranking = self.ranking[np.argsort(-self.priorities[self.ranking], kind='mergesort')]
+        self.updates_since_resort = 0
+        self.n_resorts += 1
+
+    def get_batch(self, batch_size, step=None):
+        """ `step` is unused, `beta` is a scheduled value driven by the global step in the graph. """
         no_sample = (
             (self.min_experiences is not None and
              self.n_experiences < self.min_experiences) or
@@ -187,21 +401,16 @@ class PrioritizedReplayBuffer(RLObject):
         if no_sample:
             return None, None
 
-        priority_indices = []
-        start = 0
-        permutation = np.random.permutation(self.n_partitions)
-
-        selected_sizes = []
-        for i in islice(cycle(permutation), batch_size):
-            start, end = self.strata_starts[i], self.strata_ends[i]
-            priority_indices.append(np.random.randint(start, end))
-            selected_sizes.append(self.strata_sizes[i])
+        # Cycle through the partitions in a random order, sampling uniformly within each selected partition.
+        partitions = np.resize(np.random.permutation(self.n_partitions), batch_size)
+        selected_sizes = self.strata_sizes[partitions]
+        priority_indices = self.strata_starts[partitions] + np.floor(np.random.rand(batch_size) * selected_sizes).astype('i')
 
         # We set p_x to be the actual probability that we sampled with,
         # namely 1 / (n_partitions * size_of_partition), rather than
         # the pdf that our sampling method approximates, namely `self.pdf`.
         # This is both more faithful, and works better when the memory is not full.
-        p_x = (self.n_partitions * np.array(selected_sizes))**-1.
+        p_x = (self.n_partitions * selected_sizes)**-1.
 
         beta = tf.get_default_session().run(self.beta)
 
@@ -210,13 +419,205 @@ class PrioritizedReplayBuffer(RLObject):
 
         # When we aren't full, map priority_indices (which are in range(self.size)) down to range(self.n_experiences)
         if self.n_experiences < self.size:
-            priority_indices = [int(np.floor(self.n_experiences * (i / self.size))) for i in priority_indices]
+            priority_indices = np.floor(self.n_experiences * (priority_indices / self.size)).astype('i')
+
+        if self.resort_interval is not None:
+            self._active_set = self.ranking[priority_indices]
+            experiences = self.store.get(self._active_set)
+            return experiences, weights
 
         self._active_set = []
         for p_idx in priority_indices:
             priority, e_idx = self.skip_list[p_idx]
-            self._active_set.append((p_idx, e_idx, priority))
+            self._active_set.append((int(p_idx), e_idx, priority))
 
-        experiences = RolloutBatch.join([self._experiences[e_idx] for _, e_idx, _ in self._active_set])
+        experiences = self.store.get([e_idx for _, e_idx, _ in self._active_set])
 
         return experiences, weights
+
+
+class SumTree(object):
+    """ Binary tree over a fixed number of non-negative leaf values, where each internal node stores the sum
+        (and, in a parallel tree, the minimum) of the leaves beneath it. All operations are vectorized over
+        batches of leaves, requiring O(log n) numpy operations per batch.
+
+    Parameters
+    ----------
+    size: int
+        Number of leaves.
+
+    """
+    def __init__(self, size):
+        self.size = size
+        self.depth = int(np.ceil(np.log2(max(size, 2))))
+        self.n_leaves = 2**self.depth
+
+        # Node i has children 2i and 2i+1; the root is node 1 and the leaves are nodes n_leaves, ..., 2*n_leaves-1.
+        self.sums = np.zeros(2 * self.n_leaves)
+        self.mins = np.full(2 * self.n_leaves, np.inf)
+
+    @property
+    def total(self):
+        return self.sums[1]
+
+    @property
+    def min(self):
+        return self.mins[1]
+
+    def __getitem__(self, indices):
+        return self.sums[np.asarray(indices) + self.n_leaves]
+
+    def update(self, indices, values):
+        """ Set the values of leaves `indices` to `values`. If an index appears more than once, the last value wins. """
+        nodes = np.asarray(indices, dtype='i8') + self.n_leaves
+        values = np.asarray(values, dtype='d')
+        self.sums[nodes] = values
+        self.mins[nodes] = values
+
+        if not len(nodes):
+            return
+
+        nodes = np.unique(nodes // 2)
+        while nodes[0] > 0:
+            self.sums[nodes] = self.sums[2*nodes] + self.sums[2*nodes+1]
+            self.mins[nodes] = np.minimum(self.mins[2*nodes], self.mins[2*nodes+1])
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """ For each entry v of `values` (which should lie in [0, self.total)), find the leaf whose prefix-sum
+            interval contains v. """
+        values = np.array(values, dtype='d')
+        nodes = np.ones(len(values), dtype='i8')
+
+        for _ in range(self.depth):
+            left = self.sums[2*nodes]
+            go_right = values >= left
+            values -= left * go_right
+            nodes = 2 * nodes + go_right
+
+        return np.minimum(nodes - self.n_leaves, self.size - 1)
+
+    def sample(self, batch_size, n_valid=None):
+        """ Stratified sample of leaves with probability proportional to their values. Returns leaf indices. """
+        n_valid = self.size if n_valid is None else n_valid
+        bounds = self.total * (np.arange(batch_size) + np.random.rand(batch_size)) / batch_size
+        indices = self.find(bounds)
+
+        # Guard against floating point error landing on an empty leaf.
+        return np.minimum(indices, n_valid - 1)
+
+
+class ProportionalPrioritizedReplayBuffer(RLObject):
+    """ Implements the proportional version of Prioritized Experience Replay.
+
+    Priorities are stored in a `SumTree`, so sampling a batch and updating the priorities of a
+    batch each take O(batch_size * log(size)) time, with all work vectorized in numpy.
+
+    The importance sampling exponent `beta` is computed on the host from `beta_schedule`, at the step
+    passed to `get_batch` (the learner's update count), so sampling a batch does not run anything
+    in the session.
+
+    Parameters
+    ----------
+    size: int
+        Maximum number of experiences to store.
+    priority_func: callable
+        Maps from an RLContext object to a signal to use as the priorities for the replay buffer.
+    alpha: float >= 0
+        Degree of prioritization; experiences are sampled with probability proportional to priority**alpha.
+    beta_schedule: 1 > float > 0
+        Degree of importance sampling correction, 0 corresponds to no correction, 1 corresponds to
+        full correction.
+    min_experiences: int > 0
+        Minimum number of experiences that must be stored in the replay buffer before it will return
+        a valid batch when `get_batch` is called.
+    epsilon: float > 0
+        Added to absolute priorities so that no experience has zero probability of being sampled.
+    directory: str or None
+        If supplied, experiences are stored in memory-mapped files in a subdirectory of this
+        directory named after the buffer.
+
+    """
+    def __init__(
+            self, size, priority_func, alpha, beta_schedule, min_experiences=None,
+            epsilon=1e-6, name=None, directory=None):
+        self.size = size
+        self.priority_func = priority_func
+        self.alpha = alpha
+        self.beta_schedule = eval_schedule(beta_schedule)
+        self.min_experiences = min_experiences
+        self.epsilon = epsilon
+
+        self.store = ReplayStore(size, directory=directory, name=name or self.__class__.__name__)
+        self.tree = SumTree(size)
+        self.max_priority = 1.0
+
+        self._active_set = None
+
+        super(ProportionalPrioritizedReplayBuffer, self).__init__(name)
+
+    def build_core_signals(self, context):
+        self.priority_signal = tf.reshape(self.priority_func(context), [-1])
+
+    def post_update(self, feed_dict, context):
+        if self._active_set is not None:
+            priority = tf.get_default_session().run(self.priority_signal, feed_dict=feed_dict)
+            self.update_priority(priority)
+
+    @property
+    def index(self):
+        return self.store.index
+
+    @property
+    def n_experiences(self):
+        return len(self.store)
+
+    def close(self):
+        self.store.close()
+
+    def beta(self, step):
+        return float(self.beta_schedule.value(step))
+
+    def add_rollouts(self, rollouts):
+        # If there were already experiences at the slots being written to, they are effectively ejected.
+        slots = self.store.add_rollouts(rollouts)
+
+        # New experiences get the maximum priority seen so far, so that each is likely to be sampled at least once.
+        self.tree.update(slots, np.full(len(slots), self.max_priority ** self.alpha))
+
+    def update_priority(self, priorities):
+        """ update priority after calling `get_batch` """
+        if self._active_set is None:
+            raise Exception("``update_priority`` should only called after calling ``get_batch``.")
+
+        priorities = np.abs(np.asarray(priorities, dtype='d')) + self.epsilon
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(self._active_set, priorities ** self.alpha)
+
+        self._active_set = None
+
+    def get_batch(self, batch_size, step=None):
+        """ Sample a batch, with importance sampling weights computed using `beta` at `step`, the
+            learner's update count (0 if not supplied). """
+        no_sample = (
+            (self.min_experiences is not None and
+             self.n_experiences < self.min_experiences) or
+            self.n_experiences < batch_size)
+        if no_sample:
+            return None, None
+
+        indices = self.tree.sample(batch_size, self.n_experiences)
+
+        total = self.tree.total
+        p_x = self.tree[indices] / total
+        p_min = self.tree.min / total
+
+        beta = self.beta(step or 0)
+        weights = (p_x * self.n_experiences) ** -beta
+        weights /= (p_min * self.n_experiences) ** -beta
+
+        self._active_set = indices
+
+        experiences = self.store.get(indices)
+
+        return experiences, weights.astype('f')
@@ -5,6 +5,26 @@ class RolloutBatch(dict):
     """ Assumes components are stored with shape (time, batch_size) + element_shape,
         where `element_shape` is the shape of elements in the component.
 
+    Each component is backed by a numpy array whose first (time) dimension may have
+    spare capacity; only the valid time steps (tracked separately for each component)
+    are exposed. Retrieving a component returns a view onto the valid portion of its
+    array, so field access is O(1) and never copies. Appending writes into the spare
+    capacity in place, doubling the capacity of a component when it is exhausted.
+
+    Values passed in (to the constructor or by item assignment) are copied, so the batch
+    never aliases the caller's arrays. However, since retrieved components are views,
+    modifying them in place modifies the batch. Batches returned by `split` are views onto
+    the batch they were split from.
+
+    Components are not required to have the same temporal length; in particular, `obs`
+    usually has one more entry than the other components (the final observation). The
+    length of the batch, `T`, is the length of `rewards`.
+
+    Components which have fewer than 2 dimensions (e.g. a list containing one dict of
+    info per time step) have no batch dimension, and are treated as being shared by all
+    rollouts in the batch: `split` gives every rollout the whole component, and `join`
+    keeps the component of the first batch.
+
     Observations, actions and rewards are given special treatment, but other
     per-time step attributes can also be supplied as kwargs.
 
@@ -21,20 +41,26 @@ class RolloutBatch(dict):
     static: dictionary
         Mapping from names to lists (each list with length equal to number of
         rollouts) giving time-independent, batch-dependent values.
+    capacity: int
+        Number of time steps to preallocate storage for the first time an empty
+        component is written to by `append`.
     kwargs:
         Other columns to include.
 
     """
     def __init__(
             self, obs=None, actions=None, rewards=None,
-            metadata=None, static=None, **kwargs):
+            metadata=None, static=None, capacity=None, **kwargs):
+
+        kwargs['obs'] = [] if obs is None else obs
+        kwargs['actions'] = [] if actions is None else actions
+        kwargs['rewards'] = [] if rewards is None else rewards
 
-        kwargs['obs'] = list([] if obs is None else obs)
-        kwargs['actions'] = list([] if actions is None else actions)
-        kwargs['rewards'] = list([] if rewards is None else rewards)
+        self._lengths = {}
+        self._initial_capacity = capacity or 16
 
         for k, v in kwargs.items():
-            self[k] = list(v)
+            self[k] = v
 
         self._metadata = metadata or {}
 
@@ -44,24 +70,60 @@ class RolloutBatch(dict):
             self.set_static(k, v)
 
     def _get(self, key):
-        """ Internal counterpart to `__getitem__` which returns list, not array. """
-        try:
-            value = super(RolloutBatch, self).__getitem__(key)
-        except KeyError:
-            value = []
-            self[key] = value
-        return value
+        """ Internal counterpart to `__getitem__` which creates the component if it does not exist. """
+        if key not in self:
+            self[key] = []
+        return self[key]
 
     def __getitem__(self, key):
-        val = super(RolloutBatch, self).__getitem__(key)
-        return np.array(val)
+        buf = super(RolloutBatch, self).__getitem__(key)
+        if buf is None:
+            return np.zeros(0)
+        return buf[:self._lengths[key]]
+
+    def __setitem__(self, key, value):
+        self._set(key, _to_array(value, copy=True))
+
+    def _set(self, key, value):
+        """ Set component `key` to the array `value` without copying it. """
+        # Empty components are allocated lazily, once we know their shape and dtype.
+        dict.__setitem__(self, key, value if len(value) else None)
+        self._lengths[key] = len(value)
+
+    @staticmethod
+    def _from_arrays(components, metadata=None, static=None):
+        """ Build a batch which takes ownership of (or shares) the arrays in `components`, without copying them. """
+        batch = RolloutBatch(metadata=metadata)
+        for k, v in components.items():
+            batch._set(k, _to_array(v))
+        for k, v in (static or {}).items():
+            batch.set_static(k, v)
+        return batch
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
 
     def __getattr__(self, key):
+        if key.startswith('_'):
+            # Avoid infinite recursion during copying/unpickling, before attributes are set.
+            raise AttributeError("No attribute named `{}`.".format(key))
         try:
             return self[key]
         except KeyError:
             raise AttributeError("No attribute named `{}`.".format(key))
 
+    def __reduce__(self):
+        # Only pickle the valid part of each component.
+        return (_rebuild_rollout_batch, (dict(self.items()), self._metadata, self._static))
+
     @property
     def o(self):
         return self.obs
@@ -88,23 +150,30 @@ class RolloutBatch(dict):
 
     @property
     def T(self):
-        return len(self._rewards)
+        return self._lengths.get('rewards', 0)
+
+    @property
+    def capacity(self):
+        """ Number of time steps that can be stored in every component without reallocating. """
+        capacities = [buf.shape[0] for buf in dict.values(self) if buf is not None]
+        return min(capacities) if capacities else 0
 
     @property
     def batch_size(self):
-        return self._obs[0].shape[0]
+        obs = self._obs
+        return obs.shape[1] if obs.ndim >= 2 else 0
 
     @property
     def obs_shape(self):
-        return self._obs[0].shape[1:]
+        return self._obs.shape[2:]
 
     @property
     def action_shape(self):
-        return self._actions[0].shape[1:]
+        return self._actions.shape[2:]
 
     @property
     def reward_shape(self):
-        return self._rewards[0].shape[1:]
+        return self._rewards.shape[2:]
 
     def __len__(self):
         return self.T
@@ -127,26 +196,54 @@ class RolloutBatch(dict):
         return self._static[key]
 
     def clear(self):
-        self._o = []
-        self._a = []
-        self._r = []
+        self._lengths = {}
         self._metadata = {}
         super(RolloutBatch, self).clear()
 
+    def _write(self, key, start, value):
+        """ Write `value` (which has a leading time dimension) into component `key` starting at time `start`,
+            growing the component's array if necessary. """
+        buf = dict.get(self, key, None)
+        end = start + len(value)
+
+        if buf is None:
+            buf = _empty(max(end, self._initial_capacity), value.shape[1:], value.dtype)
+        else:
+            dtype = buf.dtype
+            if dtype != value.dtype and not np.can_cast(value.dtype, dtype, casting='safe'):
+                dtype = np.result_type(dtype, value.dtype)
+
+            if end > buf.shape[0] or dtype != buf.dtype:
+                new_buf = _empty(max(end, 2 * buf.shape[0]), buf.shape[1:], dtype)
+                new_buf[:start] = buf[:start]
+                buf = new_buf
+
+        if value.dtype == object and buf.ndim == 1:
+            for i, v in enumerate(value):
+                buf[start+i] = v
+        else:
+            buf[start:end] = value
+
+        dict.__setitem__(self, key, buf)
+        self._lengths[key] = end
+
     def append(self, o, a, r, **kwargs):
-        self._get('obs').append(o)
-        self._get('actions').append(a)
-        self._get('rewards').append(r)
+        kwargs.update(obs=o, actions=a, rewards=r)
 
         for k, v in kwargs.items():
-            self._get(k).append(v)
+            self._write(k, self._lengths.get(k, 0), _to_array([v]))
 
     def extend(self, other):
         if not isinstance(other, RolloutBatch):
             raise Exception("Cannot concatenate a RolloutBatch with {}.".format(other))
 
         for k in other:
-            self._get(k).extend(other._get(k))
+            value = other[k]
+            if len(value):
+                self._write(k, self._lengths.get(k, 0), value)
+            elif k not in self:
+                self[k] = []
+
         self._metadata.update(other._metadata)
 
     @staticmethod
@@ -155,19 +252,18 @@ class RolloutBatch(dict):
         if not rollouts:
             return []
 
-        all_keys = set()
+        metadata = {}
         for r in rollouts:
-            all_keys |= r.keys()
+            metadata.update(r._metadata)
 
-        kwargs = {}
-        for k in all_keys:
-            kwargs[k] = list_concat([r._get(k) for r in rollouts])
+        # Allocate enough room for the longest component up front, so that extending never reallocates.
+        capacity = sum(max([r._lengths[k] for k in r] + [0]) for r in rollouts)
+        result = RolloutBatch(metadata=metadata, capacity=capacity)
 
-        metadata = {}
         for r in rollouts:
-            metadata.update(r._metadata)
+            result.extend(r)
 
-        return RolloutBatch(metadata=metadata, **kwargs)
+        return result
 
     def __add__(self, other):
         if not isinstance(other, RolloutBatch):
@@ -175,17 +271,28 @@ class RolloutBatch(dict):
         return RolloutBatch.concat([self, other])
 
     def split(self):
-        """ Return a list of RolloutBatches, each containing a single rollout from the current batch. """
+        """ Return a list of RolloutBatches, each containing a single rollout from the current batch.
+
+        The returned batches contain views onto the current batch, so no data is copied.
+
+        """
         rollouts = []
         for b in range(self.batch_size):
             new_static = {k: [v[b]] for k, v in self._static.items()}
-            batch = RolloutBatch(**{k: self[k][:, b:b+1, :] for k in self.keys()}, static=new_static)
+            batch = RolloutBatch._from_arrays(
+                {k: (v[:, b:b+1] if v.ndim >= 2 else v) for k, v in self.items()},
+                metadata=self._metadata.copy(), static=new_static)
             rollouts.append(batch)
         return rollouts
 
     @staticmethod
     def join(rollouts):
-        """ Join a collection of RolloutBatches of the same temporal length into a single rollout batch. """
+        """ Join a collection of RolloutBatches of the same temporal length into a single rollout batch.
+
+        Components with fewer than 2 dimensions are shared rather than joined: the result contains the
+        component from the first batch.
+
+        """
         keys = set(rollouts[0].keys())
         for r in rollouts[1:]:
             assert set(r.keys()) == keys, "Cannot join rollouts, they do not have the same set of keys."
@@ -196,8 +303,55 @@ class RolloutBatch(dict):
                 "Cannot join rollouts, they do not have the same set of keys for static values.")
 
         new_static = {k: list_concat([r.get_static(k) for r in rollouts]) for k in static_keys}
-        return RolloutBatch(
-            **{k: np.concatenate([r[k] for r in rollouts], axis=1) for k in keys}, static=new_static)
+
+        joined = {}
+        for k in keys:
+            first = rollouts[0][k]
+            if first.ndim >= 2:
+                # Write directly into a preallocated array rather than building intermediate lists.
+                sizes = [r[k].shape[1] for r in rollouts]
+                dtype = np.result_type(*[r[k].dtype for r in rollouts])
+                out = np.empty((first.shape[0], sum(sizes)) + first.shape[2:], dtype=dtype)
+                start = 0
+                for r, size in zip(rollouts, sizes):
+                    out[:, start:start+size] = r[k]
+                    start += size
+                joined[k] = out
+            else:
+                joined[k] = first
+
+        return RolloutBatch._from_arrays(joined, static=new_static)
+
+
+def _to_array(value, copy=False):
+    """ Convert a sequence of per-time-step values into an array whose first dimension is time. Unless `copy`
+        is True, does not copy if `value` is already an array. Values which are not numeric (e.g. dicts)
+        are stored in object arrays. """
+    if isinstance(value, np.ndarray):
+        return value.copy() if copy else value
+
+    value = list(value)
+    try:
+        array = np.array(value)
+    except ValueError:
+        array = None
+
+    if array is None or (array.dtype == object and array.ndim != 1):
+        array = np.empty(len(value), dtype=object)
+        for i, v in enumerate(value):
+            array[i] = v
+
+    return array
+
+
+def _empty(capacity, element_shape, dtype):
+    if dtype == object:
+        return np.empty((capacity,) + tuple(element_shape), dtype=object)
+    return np.zeros((capacity,) + tuple(element_shape), dtype=dtype)
+
+
+def _rebuild_rollout_batch(components, metadata, static):
+    return RolloutBatch._from_arrays(components, metadata=metadata, static=static)
 
 
 def list_concat(lsts):
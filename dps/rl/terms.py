@@ -16,11 +16,11 @@ class PolicyGradient(ObjectiveFunctionTerm):
     def generate_signal(self, signal_key, context, **kwargs):
         if signal_key == "prev_log_probs":
             self.log_probs = context.get_signal('log_probs', self.policy)
-            self.prev_log_probs = tf.placeholder(tf.float32, shape=self.log_probs.shape, name="_prev_log_probs")
+            self.prev_log_probs = context.batch_placeholder(tf.float32, self.log_probs.shape, "_prev_log_probs")
             return self.prev_log_probs
         elif signal_key == "prev_advantage":
             self.advantage = context.get_signal('advantage', self.advantage_estimator)
-            self.prev_advantage = tf.placeholder(tf.float32, shape=self.advantage.shape, name="_prev_advantage")
+            self.prev_advantage = context.batch_placeholder(tf.float32, self.advantage.shape, "_prev_advantage")
             return self.prev_advantage
         elif signal_key == 'importance_weights':
             pi_log_probs = context.get_signal("prev_log_probs", self)
@@ -206,7 +206,7 @@ class ValueFunctionRegularization(ObjectiveFunctionTerm):
             return self.variance
         elif signal_key == "prev_values":
             self.values = context.get_signal('values', self.value_function)
-            self.prev_values = tf.placeholder(tf.float32, shape=self.values.shape, name="_prev_values")
+            self.prev_values = context.batch_placeholder(tf.float32, self.values.shape, "_prev_values")
             return self.prev_values
         else:
             raise Exception("NotImplemented")
@@ -263,7 +263,7 @@ class ConstrainedPolicyEvaluation_State(ObjectiveFunctionTerm):
             return self.variance
         elif signal_key == "prev_values":
             self.values = context.get_signal('values', self.value_function)
-            self.prev_values = tf.placeholder(tf.float32, shape=self.values.shape, name="_prev_values")
+            self.prev_values = context.batch_placeholder(tf.float32, self.values.shape, "_prev_values")
             return self.prev_values
         else:
             raise Exception("NotImplemented")
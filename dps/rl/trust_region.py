@@ -8,24 +8,54 @@ from dps.utils.tf import lst_to_vec, vec_to_lst, masked_mean, build_scheduled_va
 
 
 class TrustRegionOptimizer(Optimizer):
-    def __init__(self, agents, policy, delta_schedule, max_cg_steps, max_line_search_steps):
+    """ Trust region policy optimization.
+
+    Parameters
+    ----------
+    in_graph: bool
+        If True, the batch is uploaded into the graph once per update (see `RLContext.stage_batch`), and
+        the gradient, the conjugate gradient solve for the natural gradient direction and the proposed
+        step are all computed by a single run of the graph, with the CG iterations performed in a
+        `tf.while_loop`. Each step of the backtracking line search is then a single run that evaluates
+        the objective at the current candidate and, in the graph, either accepts it or assigns the
+        next candidate (the objective is built outside of any loop, so it cannot be re-evaluated at
+        new parameter values from inside a `tf.while_loop`). If False, CG and the line search are performed in numpy, with a separate run
+        (and feed of the batch) for every Fisher-vector product and objective evaluation.
+
+    """
+    accept_ratio = 0.1
+
+    def __init__(self, agents, policy, delta_schedule, max_cg_steps, max_line_search_steps, in_graph=True):
         super(TrustRegionOptimizer, self).__init__(agents)
         self.policy = policy
         self.delta_schedule = delta_schedule
         self.max_cg_steps = max_cg_steps
         self.max_line_search_steps = max_line_search_steps
+        self.in_graph = in_graph
+
+    @property
+    def stages_batch(self):
+        return self.in_graph
 
     def build_update(self, context):
+        self.context = context
         self.delta = build_scheduled_value(self.delta_schedule, "delta")
 
-        tvars = self.trainable_variables(for_opt=True)
-        self.gradient = tf.gradients(context.objective, tvars)
+        self.tvars = tvars = self.trainable_variables(for_opt=True)
+        self.objective = context.objective
+        self.gradient = [
+            tf.zeros_like(v) if g is None else g
+            for g, v in zip(tf.gradients(self.objective, tvars), tvars)]
 
         mask = context.get_signal('mask')
-        kl = context.get_signal('kl', self.policy)
+        kl = context.get_signal('kl', self.policy, gradient=True)
+
+        self.mean_kl = masked_mean(kl, mask)
+        self.fv_product = HessianVectorProduct(self.mean_kl, tvars)
 
-        mean_kl = masked_mean(kl, mask)
-        self.fv_product = HessianVectorProduct(mean_kl, tvars)
+        self.flat_params = lst_to_vec(tvars)
+        self.flat_params_input = tf.placeholder(tf.float32, self.flat_params.shape, name="_flat_params_input")
+        self.set_params_op = self._assign_params(self.flat_params_input)
 
         self.grad_norm_pure = tf.placeholder(tf.float32, shape=(), name="_grad_norm_pure")
         self.grad_norm_natural = tf.placeholder(tf.float32, shape=(), name="_grad_norm_natural")
@@ -37,7 +67,145 @@ class TrustRegionOptimizer(Optimizer):
             step_norm=self.step_norm,
             train_only=True)
 
-    def update(self, feed_dict):
+        if self.in_graph:
+            self._build_in_graph_update()
+
+    def _assign_params(self, flat_params):
+        return tf.group(*[v.assign(p) for v, p in zip(self.tvars, vec_to_lst(flat_params, self.tvars))])
+
+    def _build_in_graph_update(self):
+        n_params = int(self.flat_params.shape[0])
+
+        def fv_product(v):
+            return lst_to_vec(_hessian_vector_product(self.mean_kl, self.tvars, vec_to_lst(v, self.tvars)))
+
+        # Propose a step
+        # --------------
+        gradient = lst_to_vec(self.gradient)
+        grad_norm_pure = tf.norm(gradient)
+
+        step_dir = build_cg(fv_product, gradient, max_steps=self.max_cg_steps or n_params)
+        grad_norm_natural = tf.norm(step_dir)
+
+        denom = tf.reduce_sum(step_dir * fv_product(step_dir))
+        valid = tf.logical_and(grad_norm_pure > 1e-8, grad_norm_natural >= 1e-6)
+        valid = tf.logical_and(valid, denom > 0.0)
+
+        beta = tf.sqrt(2 * self.delta / tf.where(valid, denom, 1.0))
+        full_step = beta * step_dir
+        expected_improve_rate = beta * tf.reduce_sum(gradient * step_dir)
+
+        with tf.variable_scope("trust_region"):
+            self._old_params = tf.Variable(tf.zeros(n_params), trainable=False, name="old_params")
+            self._full_step = tf.Variable(tf.zeros(n_params), trainable=False, name="full_step")
+            self._old_objective = tf.Variable(0.0, trainable=False, name="old_objective")
+            self._expected_improve_rate = tf.Variable(0.0, trainable=False, name="expected_improve_rate")
+            self._n_backtracks = tf.Variable(0, trainable=False, name="n_backtracks")
+
+        current_params = self.flat_params
+        proposal = [full_step, expected_improve_rate, self.objective, current_params, valid]
+
+        # Parameters must only be assigned once everything which reads them has been computed.
+        with tf.control_dependencies(proposal):
+            record = tf.group(
+                self._old_params.assign(current_params),
+                self._full_step.assign(full_step),
+                self._old_objective.assign(self.objective),
+                self._expected_improve_rate.assign(expected_improve_rate),
+                self._n_backtracks.assign(0))
+
+            new_params = tf.cond(valid, lambda: current_params + full_step, lambda: current_params)
+
+        with tf.control_dependencies([record]):
+            take_step = self._assign_params(new_params)
+
+        self.propose_step = dict(
+            take_step=take_step, valid=valid, grad_norm_pure=grad_norm_pure, grad_norm_natural=grad_norm_natural)
+
+        # Line search step
+        # ----------------
+        # Evaluates the objective at the current candidate, which is `old_params + frac * full_step`.
+        frac = 0.5 ** tf.cast(self._n_backtracks, tf.float32)
+        rate = self._expected_improve_rate
+
+        actual_improve = self.objective - self._old_objective
+        expected_improve = tf.where(
+            rate > 0, tf.maximum(1e-6, rate * frac), tf.minimum(-1e-6, rate * frac))
+        ratio = actual_improve / expected_improve
+
+        accepted = tf.logical_and(ratio > self.accept_ratio, rate * actual_improve > 0)
+        exhausted = tf.logical_and(tf.logical_not(accepted), self._n_backtracks + 1 >= self.max_line_search_steps)
+
+        with tf.control_dependencies([accepted, exhausted]):
+            next_params = tf.cond(
+                accepted,
+                lambda: current_params,
+                lambda: tf.cond(
+                    exhausted,
+                    lambda: self._old_params.read_value(),
+                    lambda: self._old_params + 0.5 * frac * self._full_step))
+
+            step_norm = tf.where(accepted, frac * tf.norm(self._full_step), 0.0)
+
+            with tf.control_dependencies([next_params, step_norm]):
+                advance = tf.group(
+                    self._assign_params(next_params),
+                    self._n_backtracks.assign_add(1))
+
+        self.line_search_step = dict(advance=advance, accepted=accepted, exhausted=exhausted, step_norm=step_norm)
+
+    def update(self, n_rollouts, feed_dict, fetches):
+        if self.in_graph:
+            # After staging, only entries that are not per-rollout data (e.g. the mode) need to be fed.
+            feed_dict = self.context.stage_batch(feed_dict, n_rollouts)
+            record = self._update_in_graph(feed_dict)
+        else:
+            record = self._update_numpy(feed_dict)
+
+        feed_dict.update({
+            self.grad_norm_pure: record['grad_norm_pure'],
+            self.grad_norm_natural: record['grad_norm_natural'],
+            self.step_norm: record['step_norm'],
+        })
+
+        if cfg.verbose:
+            print("Gradient norm: ", record['grad_norm_pure'])
+            print("Natural Gradient norm: ", record['grad_norm_natural'])
+            print("Step norm: ", record['step_norm'])
+
+        sess = tf.get_default_session()
+        return sess.run(fetches, feed_dict=feed_dict)
+
+    def _update_in_graph(self, feed_dict):
+        sess = tf.get_default_session()
+        proposal = sess.run(self.propose_step, feed_dict=feed_dict)
+        record = dict(
+            grad_norm_pure=proposal['grad_norm_pure'],
+            grad_norm_natural=proposal['grad_norm_natural'],
+            step_norm=0.0)
+
+        if not proposal['valid']:
+            print("Got zero policy gradient or natural gradient, not updating.")
+            return record
+
+        for i in range(self.max_line_search_steps):
+            result = sess.run(self.line_search_step, feed_dict=feed_dict)
+            record['step_norm'] = result['step_norm']
+
+            if result['accepted'] or result['exhausted']:
+                if result['exhausted'] and cfg.verbose:
+                    print("Line search failed")
+                break
+
+        return record
+
+    def _get_params_flat(self):
+        return tf.get_default_session().run(self.flat_params)
+
+    def _set_params_flat(self, flat_params):
+        tf.get_default_session().run(self.set_params_op, feed_dict={self.flat_params_input: flat_params})
+
+    def _update_numpy(self, feed_dict):
         # Compute gradient of objective
         # -----------------------------
         sess = tf.get_default_session()
@@ -53,8 +221,6 @@ class TrustRegionOptimizer(Optimizer):
         else:
             # Compute natural gradient direction
             # ----------------------------------
-            self.prev_policy.set_params_flat(self.policy.get_params_flat())
-
             self.fv_product.update_feed_dict(feed_dict)
             step_dir = cg(self.fv_product, gradient, max_steps=self.max_cg_steps)
 
@@ -71,33 +237,25 @@ class TrustRegionOptimizer(Optimizer):
                 full_step = beta * step_dir
 
                 def objective(_params):
-                    self.policy.set_params_flat(_params)
+                    self._set_params_flat(_params)
                     sess = tf.get_default_session()
                     return sess.run(self.objective, feed_dict=feed_dict)
 
                 grad_dot_step_dir = gradient.dot(step_dir)
 
-                params = self.policy.get_params_flat()
+                params = self._get_params_flat()
 
                 expected_imp = beta * grad_dot_step_dir
                 success, new_params = line_search(
                     objective, params, full_step, expected_imp,
-                    max_backtracks=self.max_line_search_steps, verbose=cfg.verbose)
+                    max_backtracks=self.max_line_search_steps,
+                    accept_ratio=self.accept_ratio, verbose=cfg.verbose)
 
-                self.policy.set_params_flat(new_params)
+                self._set_params_flat(new_params)
 
                 step_norm = np.linalg.norm(new_params - params)
 
-        if cfg.verbose:
-            print("Gradient norm: ", grad_norm_pure)
-            print("Natural Gradient norm: ", grad_norm_natural)
-            print("Step norm: ", step_norm)
-
-        feed_dict.update({
-            self.grad_norm_pure: grad_norm_pure,
-            self.grad_norm_natural: grad_norm_natural,
-            self.step_norm: step_norm,
-        })
+        return dict(grad_norm_pure=grad_norm_pure, grad_norm_natural=grad_norm_natural, step_norm=step_norm)
 
 
 def mean_kl(p, q, obs, mask):
@@ -222,6 +380,43 @@ def cg(A, b, x=None, tol=1e-10, verbose=0, f=10, max_steps=None):
     return x
 
 
+def build_cg(A, b, max_steps, tol=1e-10):
+    """ Conjugate gradient in the graph, starting from x = 0. Iterations are performed in a `tf.while_loop`,
+        which stops after `max_steps` iterations, or once the search direction has energy norm below `tol`.
+
+    Parameters
+    ----------
+    A: function
+        Given a vector, builds its product with the (symmetric positive definite) matrix.
+    b: Tensor (n,)
+
+    """
+    r_dot_r = tf.reduce_sum(b * b)
+
+    def cond(i, x, r, d, r_dot_r, done):
+        return tf.logical_and(i < max_steps, tf.logical_not(done))
+
+    def body(i, x, r, d, r_dot_r, done):
+        A_dot_d = A(d)
+        d_energy_norm = tf.reduce_sum(d * A_dot_d)
+        done = d_energy_norm < tol
+
+        alpha = tf.where(done, 0.0, r_dot_r / d_energy_norm)
+        x += alpha * d
+        r -= alpha * A_dot_d
+
+        new_r_dot_r = tf.reduce_sum(r * r)
+        beta = tf.where(r_dot_r > 0, new_r_dot_r / r_dot_r, 0.0)
+        d = r + beta * d
+
+        return i + 1, x, r, d, new_r_dot_r, done
+
+    _, x, *_ = tf.while_loop(
+        cond, body, [tf.constant(0), tf.zeros_like(b), b, b, r_dot_r, tf.constant(False)],
+        back_prop=False)
+    return x
+
+
 def line_search(f, x, fullstep, expected_improve_rate, max_backtracks=10, accept_ratio=.1, verbose=False):
     """ Backtracking line search, where expected_improve_rate is the slope dy/dx at the initial point """
     fval = f(x)
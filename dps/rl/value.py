@@ -250,6 +250,45 @@ class RetraceCell(RNNCell):
         return tf.fill((batch_size, 1), 0.0)
 
 
+def build_retrace(rewards, values, rho, gamma, lmbda, to_action_value):
+    """ Build Retrace estimates from tensors with shape (T, batch_size, 1).
+        Returns (retrace, one_step_estimate, adjustment). See also `dps.rl.estimators.retrace`. """
+    R = rewards
+    V = tf_roll(values, 1, fill=0.0, reverse=True)
+    RHO = rho
+
+    # if context.truncated_rollouts:
+    #     R = R[:-1, ...]
+    #     V = V[:-1, ...]
+    #     RHO = RHO[:-1, ...]
+
+    if to_action_value:
+        RHO = tf_roll(RHO, 1, fill=1.0, reverse=True)
+
+    retrace_cell = RetraceCell(
+        rewards.shape[-1], gamma, lmbda, to_action_value)
+
+    retrace_input = (
+        tf.reverse(RHO, axis=[0]),
+        tf.reverse(R, axis=[0]),
+        tf.reverse(V, axis=[0]),
+    )
+
+    (retrace, one_step_estimate, adjustment), _ = dynamic_rnn(
+        retrace_cell, retrace_input,
+        initial_state=V[-1, ...],
+        parallel_iterations=1, swap_memory=False, time_major=True)
+
+    one_step_estimate = tf.reverse(one_step_estimate, axis=[0])
+    adjustment = tf.reverse(adjustment, axis=[0])
+    retrace = tf.reverse(retrace, axis=[0])
+
+    # if context.truncated_rollouts:
+    #     retrace = tf.concat([retrace, V[-1, ...]], axis=0)
+
+    return retrace, one_step_estimate, adjustment
+
+
 class Retrace(RLObject):
     """ An off-policy (though also works on-policy) return-based estimate of the value of
         a policy as a function of either a state or a state-action pair. The estimate
@@ -294,39 +333,9 @@ class Retrace(RLObject):
         else:
             values = context.get_signal("values", self.value_function)
 
-        R = rewards
-        V = tf_roll(values, 1, fill=0.0, reverse=True)
-        RHO = rho
-
-        # if context.truncated_rollouts:
-        #     R = R[:-1, ...]
-        #     V = V[:-1, ...]
-        #     RHO = RHO[:-1, ...]
-
-        if self.to_action_value:
-            RHO = tf_roll(RHO, 1, fill=1.0, reverse=True)
-
         gamma = context.get_signal("gamma")
-        retrace_cell = RetraceCell(
-            rewards.shape[-1], gamma, self.lmbda, self.to_action_value)
-
-        retrace_input = (
-            tf.reverse(RHO, axis=[0]),
-            tf.reverse(R, axis=[0]),
-            tf.reverse(V, axis=[0]),
-        )
-
-        (retrace, one_step_estimate, adjustment), _ = dynamic_rnn(
-            retrace_cell, retrace_input,
-            initial_state=V[-1, ...],
-            parallel_iterations=1, swap_memory=False, time_major=True)
-
-        one_step_estimate = tf.reverse(one_step_estimate, axis=[0])
-        adjustment = tf.reverse(adjustment, axis=[0])
-        retrace = tf.reverse(retrace, axis=[0])
-
-        # if context.truncated_rollouts:
-        #     retrace = tf.concat([retrace, V[-1, ...]], axis=0)
+        retrace, one_step_estimate, adjustment = build_retrace(
+            rewards, values, rho, gamma, self.lmbda, self.to_action_value)
 
         mask = context.get_signal("mask")
         label = "{}-one_step_estimate".format(self.name)
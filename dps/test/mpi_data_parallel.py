@@ -0,0 +1,44 @@
+""" Launched under mpiexec by `test_mpi.py`. Each process computes gradients on different data;
+    checks that the gradients are averaged over processes and that parameters stay identical. """
+import numpy as np
+import tensorflow as tf
+from mpi4py import MPI
+
+from dps.utils.tf import build_gradient_train_op, mpi_broadcast_variables
+
+
+def main():
+    comm = MPI.COMM_WORLD
+    rank, n_procs = comm.Get_rank(), comm.Get_size()
+
+    graph = tf.Graph()
+    sess = tf.Session(graph=graph)
+
+    with graph.as_default(), sess.as_default():
+        # Different initial values in each process.
+        tf.set_random_seed(rank)
+        w = tf.get_variable("w", shape=(3,), initializer=tf.random_normal_initializer())
+
+        x = tf.constant(np.arange(3) + rank, tf.float32)
+        loss = tf.reduce_sum(w * x)
+
+        train_op, records = build_gradient_train_op(loss, [w], "adam", 1e-2, mpi_comm=comm)
+
+        sess.run(tf.global_variables_initializer())
+        mpi_broadcast_variables([w], comm)
+
+        for i in range(5):
+            _, grad_norm = sess.run([train_op, records['grad_norm_pure']])
+
+        expected_gradient = np.arange(3) + (n_procs - 1) / 2
+        assert np.isclose(grad_norm, np.linalg.norm(expected_gradient)), grad_norm
+
+        all_w = comm.gather(sess.run(w), root=0)
+
+    if rank == 0:
+        assert all(np.allclose(_w, all_w[0]) for _w in all_w), all_w
+        print("Parameters consistent across {} processes.".format(n_procs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+""" Launched under mpiexec by `test_mpi.py`. Trains A2C with one process per rank, workers running
+    `worker_code` until the master calls `stop_workers`; checks that parameters stay identical. """
+import numpy as np
+import tensorflow as tf
+from mpi4py import MPI
+
+from dps import cfg
+from dps.utils import NumpySeed
+from dps.utils.tf import uninitialized_variables_initializer
+from dps.test.test_actors import _counting_config
+
+
+class _MPIContext(object):
+    def __init__(self, comm):
+        self.merged_comm = comm
+        self.n_procs = comm.Get_size()
+        self.rank = comm.Get_rank()
+
+
+def main():
+    comm = MPI.COMM_WORLD
+    mpi_context = _MPIContext(comm)
+    n_updates = 3
+
+    graph = tf.Graph()
+    sess = tf.Session(graph=graph)
+
+    # Different seeds, so that each process generates different rollouts and initial parameters.
+    with _counting_config(), NumpySeed(mpi_context.rank), graph.as_default(), sess.as_default():
+        tf.set_random_seed(mpi_context.rank)
+
+        env = cfg.build_env()
+        updater = cfg.get_updater(env, mpi_context=mpi_context)
+        updater.build_graph()
+        sess.run(uninitialized_variables_initializer())
+
+        assert updater.data_parallel
+
+        if mpi_context.rank == 0:
+            for i in range(n_updates):
+                updater.update(cfg.batch_size)
+            updater.stop_workers()
+        else:
+            updater.worker_code()
+
+        assert updater.n_updates == n_updates, updater.n_updates
+
+        params = np.concatenate([agent.get_params_flat() for agent in updater.learners[0].agents])
+        all_params = comm.gather(params, root=0)
+        env.close()
+
+    if mpi_context.rank == 0:
+        assert all(np.allclose(p, all_params[0]) for p in all_params), all_params
+        print("Parameters consistent across {} processes.".format(mpi_context.n_procs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import time
+import numpy as np
+import tensorflow as tf
+import pytest
+
+import gym
+from gym.spaces import Discrete, Box
+
+from dps.config import DEFAULT_CONFIG
+from dps.env import BatchGymEnv
+from dps.rl import ActorPool, EvaluationPool, BuildSoftmaxPolicy
+from dps.rl.actors import _build_updater
+from dps.rl.algorithms import a2c
+
+
+class CountingGymEnv(gym.Env):
+    """ Observation is the number of steps taken; episode ends after `length` steps. Reward is the action. """
+    observation_space = Box(low=0.0, high=np.inf, shape=(1,), dtype=np.float32)
+    action_space = Discrete(2)
+
+    def __init__(self, length=3):
+        self.length = length
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return np.array([self.t], dtype='f')
+
+    def step(self, action):
+        self.t += 1
+        return np.array([self.t], dtype='f'), float(action), self.t >= self.length, {}
+
+    def seed(self, seed=None):
+        pass
+
+
+def build_counting_env():
+    return BatchGymEnv(gym_env=CountingGymEnv())
+
+
+def _counting_config():
+    config = DEFAULT_CONFIG.copy()
+    config.update(a2c.config)
+    config.update(
+        build_env=build_counting_env,
+        build_policy=BuildSoftmaxPolicy(one_hot=False),
+        exploration_schedule=1.0,
+        n_controller_units=8,
+        T=3,
+        batch_size=2,
+        n_val=2,
+        use_gpu=False,
+    )
+    return config
+
+
+@pytest.mark.slow
+def test_actor_pool():
+    with _counting_config():
+        graph = tf.Graph()
+        with graph.as_default(), tf.Session(graph=graph).as_default():
+            env, updater = _build_updater()
+            context = updater.learners[0]
+
+            pool = ActorPool(context, n_actors=2, batch_size=2)
+            try:
+                assert pool.version == 1
+
+                rollouts, lags = pool.get_rollouts(block=True, timeout=60)
+                assert rollouts
+                assert lags == [0] * len(rollouts)
+
+                for r in rollouts:
+                    assert r.batch_size == 2
+                    assert r.T == 3
+                    assert np.all(r.obs[:-1, :, 0] == np.arange(3)[:, None])
+
+                assert pool.n_rollouts == 2 * len(rollouts)
+                assert pool.n_experiences == 2 * 3 * len(rollouts)
+
+                # Rollouts generated before the new parameters were published lag by one version. Actors load
+                # the new version before their next batch, so rollouts with no lag eventually arrive.
+                pool.publish_params()
+                assert pool.version == 2
+
+                all_lags = []
+                deadline = time.time() + 60
+                while 0 not in all_lags and time.time() < deadline:
+                    _, lags = pool.get_rollouts(block=True, timeout=10)
+                    all_lags.extend(lags)
+
+                assert 0 in all_lags
+                assert set(all_lags) <= {0, 1}
+            finally:
+                pool.close()
+
+            assert pool.closed
+            assert not any(w.is_alive() for w in pool.workers)
+            env.close()
+
+
+@pytest.mark.slow
+def test_evaluation_pool():
+    with _counting_config():
+        graph = tf.Graph()
+        with graph.as_default(), tf.Session(graph=graph).as_default():
+            env, updater = _build_updater()
+
+            pool = EvaluationPool(updater, n_workers=2)
+            try:
+                val_id = pool.submit(build_counting_env, n_rollouts=5, T=3)
+                test_id = pool.submit(build_counting_env, n_rollouts=1, T=3, env_key="counting", mode="test")
+                assert val_id != test_id
+
+                # Results are only returned once every chunk of an evaluation is done.
+                evaluations = pool.get([val_id, test_id], block=True)
+                assert [e.id for e in evaluations] == [val_id, test_id]
+                assert not pool.evaluations
+
+                for evaluation, n_rollouts in zip(evaluations, [5, 1]):
+                    assert evaluation.done
+                    assert evaluation.n_rollouts == n_rollouts
+                    assert evaluation.duration > 0
+                    assert evaluation.frames is None
+
+                    # Reward is the action (0 or 1) at each of the 3 steps.
+                    assert len(evaluation.reward_per_ep) == len(updater.learners)
+                    assert all(0.0 <= r <= 3.0 for r in evaluation.reward_per_ep)
+            finally:
+                pool.close()
+
+            assert pool.closed
+            assert not any(w.is_alive() for w in pool.workers)
+
+            with pytest.raises(Exception):
+                pool.submit(build_counting_env, n_rollouts=1, T=3)
+
+            env.close()
@@ -0,0 +1,49 @@
+import pytest
+
+from dps.benchmark import latency_stats, compare_to_baseline, run_scenario
+
+
+def test_latency_stats():
+    stats = latency_stats([0.1] * 98 + [1.0, 2.0], batch_size=10)
+    assert stats['n_steps'] == 100
+    assert stats['p50'] == pytest.approx(0.1)
+    assert stats['p99'] > 0.9
+    assert stats['mean'] == pytest.approx((9.8 + 3.0) / 100)
+    assert stats['examples_per_sec'] == pytest.approx(10 / stats['mean'])
+
+
+def test_compare_to_baseline():
+    def result(scenario, p50, batch_size=16):
+        return dict(scenario=scenario, batch_size=batch_size, intra_op_threads=1, inter_op_threads=1, p50=p50)
+
+    baseline = [result("a", 1.0), result("b", 1.0), result("c", 1.0)]
+    results = [result("a", 1.05), result("b", 1.2), result("c", 2.0, batch_size=32), result("d", 5.0)]
+
+    regressions = compare_to_baseline(results, baseline, tolerance=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b ")
+
+    assert not compare_to_baseline(results, baseline, tolerance=0.5)
+
+
+@pytest.mark.slow
+def test_run_scenario():
+    result = run_scenario("sl_update", batch_size=8, intra_op_threads=1, inter_op_threads=1, n_steps=5, n_warmup=1)
+    assert result['n_steps'] == 5
+    assert result['batch_size'] == 8
+    assert 0 < result['p50'] <= result['p99']
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("scenario", ["rl_evaluate", "rl_evaluate_host"])
+def test_rollout_samplers(scenario):
+    result = run_scenario(scenario, batch_size=4, intra_op_threads=1, inter_op_threads=1, n_steps=2, n_warmup=1)
+    assert result['n_steps'] == 2
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("scenario", ["tf_env_grid_bandit", "tf_env_grid_bandit_unroll", "tf_env_cliff_walk_unroll"])
+def test_tensorflow_env_scenarios(scenario):
+    result = run_scenario(scenario, batch_size=64, intra_op_threads=1, inter_op_threads=1, n_steps=2, n_warmup=1)
+    assert result['n_graph_ops'] > 0
+    assert result['env_steps_per_sec'] > 0
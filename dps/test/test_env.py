@@ -0,0 +1,162 @@
+import time
+from importlib import import_module
+import numpy as np
+import tensorflow as tf
+import pytest
+
+from dps.env.subproc import SubprocessEnvPool
+from dps.rl import EvaluationScheduler, Evaluation
+from dps.utils import Config
+from dps.utils.tf import unrolled_while_loop
+
+
+class CountingEnv(object):
+    """ Observation is the env's id and the number of steps taken; episode ends after `length` steps. """
+    def __init__(self, idx, length):
+        self.idx = idx
+        self.length = length
+        self.n_resets = 0
+
+    def reset(self):
+        self.t = 0
+        self.n_resets += 1
+        return np.array([self.idx, self.t, self.n_resets], dtype='d')
+
+    def step(self, action):
+        self.t += 1
+        obs = np.array([self.idx, self.t, self.n_resets], dtype='d')
+        return obs, float(action), self.t >= self.length, dict(t=self.t)
+
+    def seed(self, seed):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_subprocess_env_pool():
+    lengths = [1, 2, 3, 4, 5]
+    pool = SubprocessEnvPool([CountingEnv(i, l) for i, l in enumerate(lengths)], (3,), n_workers=2)
+
+    try:
+        for episode in [1, 2]:
+            obs = pool.reset(4)
+            assert obs.shape == (4, 3)
+            assert np.all(obs[:, 0] == np.arange(4))
+            assert np.all(obs[:, 1] == 0)
+            assert np.all(obs[:, 2] == episode)
+
+            done = np.zeros(4, dtype='bool')
+            for t in range(1, 5):
+                n_stepped = (~done).sum()
+                obs, rewards, done, info = pool.step(np.arange(4), done)
+
+                assert len(info) == n_stepped
+                assert np.all(done == (t >= np.array(lengths[:4])))
+
+                # Envs which are done are not stepped further, and receive no reward.
+                assert np.all(obs[:, 1] == np.minimum(t, lengths[:4]))
+                stepped = np.array(lengths[:4]) >= t
+                assert np.all(rewards[stepped] == np.arange(4)[stepped])
+                assert np.all(rewards[~stepped] == 0)
+
+        # The inactive env was never reset or stepped.
+        obs = pool.reset(5)
+        assert obs[4, 2] == 1
+    finally:
+        pool.close()
+
+    assert all(not w.is_alive() for w in pool.workers)
+
+
+class _DummyEnv(object):
+    max_batch_size = 4
+
+    def do_rollouts(self, policy, n_rollouts, T, mode):
+        time.sleep(0.01)
+        assert tf.get_default_session() is not None
+        return n_rollouts
+
+
+def test_evaluation_scheduler():
+    scheduler = EvaluationScheduler(eval_batch_size=None, n_eval_threads=3)
+
+    assert scheduler.batch_sizes(10) == [10]
+    assert scheduler.batch_sizes(10, _DummyEnv()) == [4, 4, 2]
+
+    scheduler.eval_batch_size = 3
+    assert scheduler.batch_sizes(10, _DummyEnv()) == [3, 3, 3, 1]
+
+    envs = [_DummyEnv() for i in range(3)]
+    with tf.Session().as_default():
+        results = scheduler.map(lambda env: scheduler.do_rollouts(env, None, 10, 5, 'val'), envs)
+    scheduler.close()
+
+    assert results == [[3, 3, 3, 1]] * 3
+    assert scheduler.n_rollouts == 30
+    assert scheduler.rollouts_per_sec > 0
+
+
+def test_evaluation():
+    # Two learners, 10 rollouts each, split into chunks of 6 and 4.
+    evaluation = Evaluation(0, n_learners=2, n_rollouts=10, n_chunks=4)
+
+    evaluation._add(0, 6.0, None)
+    evaluation._add(1, 12.0, np.zeros((3, 2, 1)))
+    evaluation._add(0, 4.0, None)
+    assert not evaluation.done
+    assert evaluation.duration is None
+
+    evaluation._add(1, 8.0, None)
+    assert evaluation.done
+    assert evaluation.duration >= 0
+    assert evaluation.reward_per_ep == [1.0, 2.0]
+    assert evaluation.frames.shape == (3, 2, 1)
+
+
+def _sample_tensorflow_env(env, actions, unroll, parallel_iterations=10):
+    """ Step `env` through the (T, batch_size, n_actions) array `actions` in a while loop that takes
+        `unroll` steps per iteration, letting `parallel_iterations` iterations overlap. Returns the final registers and the reward summed over steps,
+        with each step's reward weighted by its index so that out-of-order steps would be detected. """
+    T, batch_size = actions.shape[:2]
+    actions = tf.constant(actions, tf.float32)
+
+    def body(t, registers, weighted_reward):
+        _, reward, registers = env.build_step(t, registers, actions[t])
+        return t + 1, registers, weighted_reward + tf.to_float(t + 1) * reward
+
+    registers = env.build_init(env.rb.new_array(batch_size, lib='tf'))
+    _, registers, weighted_reward = unrolled_while_loop(
+        lambda t, *_: t < T, body, [tf.constant(0), registers, tf.zeros((batch_size, 1))],
+        unroll=unroll, parallel_iterations=parallel_iterations,
+        shape_invariants=[tf.TensorShape([]), tf.TensorShape([None, env.rb.width]), tf.TensorShape([None, 1])])
+    return registers, weighted_reward
+
+
+@pytest.mark.parametrize("env_name, env_class, kwargs", [
+    ("grid_bandit", "GridBandit", dict(n_val=8)),
+    ("cliff_walk", "CliffWalk", dict(n_states=3)),
+])
+def test_tensorflow_env_unroll(env_name, env_class, kwargs):
+    module = import_module("dps.env.basic." + env_name)
+
+    # These envs implement `build_init` rather than `build_reset`, which TensorFlowEnv declares abstract.
+    env_class = getattr(module, env_class)
+    env_class = type(env_class.__name__, (env_class,), dict(build_reset=lambda self, r: self.build_init(r)))
+
+    T, batch_size = 7, 8
+    rng = np.random.RandomState(0)
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+        with Config(module.config.copy(), **kwargs):
+            env = env_class()
+        env._build_placeholders()
+
+        n_actions = env.action_shape[0]
+        actions = np.eye(n_actions)[rng.randint(n_actions, size=(T, batch_size))]
+
+        results = [_sample_tensorflow_env(env, actions, unroll) for unroll in [1, 3]]
+        expected, unrolled = sess.run(results, feed_dict=env._make_feed_dict(batch_size, T, 'train'))
+
+    for e, u in zip(expected, unrolled):
+        assert np.array_equal(e, u)
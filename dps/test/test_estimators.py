@@ -0,0 +1,80 @@
+import numpy as np
+import tensorflow as tf
+import pytest
+
+from dps.rl import estimators
+from dps.rl.value import build_retrace
+from dps.utils.tf import tf_discount_matrix
+
+
+def _loop_recurrence(a, b, final):
+    x = np.zeros_like(a)
+    x_next = final
+    for t in reversed(range(len(a))):
+        x[t] = a[t] + b[t] * x_next
+        x_next = x[t]
+    return x
+
+
+@pytest.mark.parametrize("max_size", [None, 0])
+def test_reverse_linear_recurrence(max_size, monkeypatch):
+    if max_size is not None:
+        # Force the looping implementation.
+        monkeypatch.setattr(estimators, "_MAX_VECTORIZED_SIZE", max_size)
+
+    rng = np.random.RandomState(0)
+    a = rng.randn(7, 5, 1)
+    b = rng.rand(7, 5, 1)
+    b[2, 1] = 0.0
+    final = rng.randn(5, 1)
+
+    result = estimators.reverse_linear_recurrence(a, b, final)
+    assert np.allclose(result, _loop_recurrence(a, b, final))
+
+
+def test_discounted_returns():
+    rng = np.random.RandomState(0)
+    T, gamma = 10, 0.9
+    rewards = rng.randn(T, 4, 1).astype('f')
+
+    with tf.Session() as sess:
+        expected = sess.run(tf.tensordot(tf_discount_matrix(gamma, T), rewards, axes=1))
+
+    assert np.allclose(estimators.discounted_returns(rewards, gamma), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("to_action_value", [False, True])
+def test_retrace(to_action_value):
+    rng = np.random.RandomState(0)
+    T, B, gamma, lmbda = 10, 4, 0.9, 0.8
+    rewards = rng.randn(T, B, 1).astype('f')
+    values = rng.randn(T, B, 1).astype('f')
+    pi_log_probs = np.log(rng.rand(T, B, 1)).astype('f')
+    mu_log_probs = np.log(rng.rand(T, B, 1)).astype('f')
+
+    rho = estimators.truncated_importance_weights(pi_log_probs, mu_log_probs, c=1.0)
+    assert np.all(rho <= 1.0)
+
+    expected = build_retrace(
+        tf.constant(rewards), tf.constant(values), tf.constant(rho.astype('f')),
+        gamma, lmbda, to_action_value)
+    with tf.Session() as sess:
+        expected = sess.run(expected)
+
+    result = estimators.retrace(rewards, values, rho, gamma, lmbda, to_action_value)
+
+    for r, e in zip(result, expected):
+        assert np.allclose(r, e, atol=1e-4)
+
+
+def test_generalized_advantage():
+    rng = np.random.RandomState(0)
+    T, B, gamma, lmbda = 10, 4, 0.9, 0.8
+    rewards = rng.randn(T, B, 1)
+    values = rng.randn(T, B, 1)
+
+    next_values = np.concatenate([values[1:], np.zeros_like(values[:1])])
+    deltas = rewards + gamma * next_values - values
+    expected = _loop_recurrence(deltas, np.full_like(deltas, gamma * lmbda), np.zeros((B, 1)))
+
+    assert np.allclose(estimators.generalized_advantage(rewards, values, gamma, lmbda), expected)
@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+
+from dps.env.basic import collect
+from dps.env.basic.game import SpatialHash, IncrementalRenderer
+
+
+def test_spatial_hash():
+    rng = np.random.RandomState(0)
+    boxes = {}
+    index = SpatialHash(cell_size=4)
+
+    def random_box():
+        top, left = rng.uniform(-20, 20, size=2)
+        h, w = rng.uniform(0, 10, size=2)
+        return (top, top + h, left, left + w)
+
+    for i in range(50):
+        boxes[i] = random_box()
+        index.insert(i, *boxes[i])
+
+    for i in range(0, 50, 3):
+        boxes[i] = random_box()
+        index.update(i, *boxes[i])
+
+    for i in range(0, 50, 7):
+        del boxes[i]
+        index.remove(i)
+
+    assert len(index) == len(boxes)
+
+    for i in range(100):
+        top, bottom, left, right = query = random_box()
+        overlapping = {
+            k for k, (t, b, l, r) in boxes.items()
+            if t <= bottom and top <= b and l <= right and left <= r}
+        assert overlapping <= index.query(*query)
+
+
+def _trajectory(env_class, use_spatial_hash, seed, n_steps, **kwargs):
+    np.random.seed(seed)
+    rng = np.random.RandomState(seed)
+
+    with collect.config.copy(use_spatial_hash=use_spatial_hash, **kwargs):
+        env = env_class()
+        trajectory = [env.reset()]
+
+        for t in range(n_steps):
+            action = (rng.randint(8), rng.randint(3))
+            obs, reward, done, info = env.step(action)
+            positions = [(e.top, e.left, e.alive) for e in env.entities]
+            trajectory.append((obs, reward, positions))
+
+    return trajectory
+
+
+@pytest.mark.parametrize(
+    "env_class, kwargs", [
+        (collect.CollectA, dict(n_collectables=20, n_obstacles=20, max_overlap=1.0, image_shape=(72, 72))),
+        (collect.CollectB, dict(n_dirs=8)),
+        (collect.CollectC, dict(n_collectables=30, max_overlap=1.0, image_shape=(72, 72))),
+    ])
+def test_spatial_hash_trajectories(env_class, kwargs):
+    """ Games give identical trajectories with and without the spatial hash broad phase. """
+    for seed in range(5):
+        brute_force = _trajectory(env_class, False, seed, 30, **kwargs)
+        hashed = _trajectory(env_class, True, seed, 30, **kwargs)
+
+        assert len(brute_force) == len(hashed)
+        assert np.array_equal(brute_force[0], hashed[0])
+
+        for (bf_obs, bf_reward, bf_positions), (obs, reward, positions) in zip(brute_force[1:], hashed[1:]):
+            assert np.array_equal(bf_obs, obs)
+            assert bf_reward == reward
+            assert bf_positions == positions
+
+
+@pytest.mark.parametrize(
+    "env_class, kwargs", [
+        (collect.CollectA, dict(n_collectables=10, n_obstacles=10, max_overlap=1.0, discrete_actions=True)),
+        (collect.CollectA, dict(n_collectables=10, n_obstacles=10, max_overlap=1.0, discrete_actions=False, time_reward=True)),
+        (collect.CollectB, dict(n_dirs=6, discrete_actions=True)),
+        (collect.CollectC, dict(n_collectables=15, max_overlap=1.0, discrete_actions=False)),
+    ])
+def test_batch_object_game(env_class, kwargs):
+    """ Stepping a BatchObjectGame gives the same trajectories as stepping separate games. """
+    n_games, n_steps, seed = 8, 20, 0
+
+    with collect.config.copy(**kwargs):
+        games = [env_class() for i in range(n_games)]
+        batch_game = env_class().make_batch(n_games)
+
+    rng = np.random.RandomState(seed)
+    if kwargs['discrete_actions']:
+        actions = [np.stack([rng.randint(8, size=n_games), rng.randint(3, size=n_games)], axis=1) for t in range(n_steps)]
+    else:
+        actions = [rng.uniform(-1, 1, size=(n_games, 3)).astype('f') for t in range(n_steps)]
+
+    with collect.config.copy(**kwargs):
+        np.random.seed(seed)
+        separate = [np.array([g.reset() for g in games])]
+        for t in range(n_steps):
+            results = [g.step(a) for g, a in zip(games, actions[t])]
+            separate.append((
+                np.array([r[0] for r in results]),
+                np.array([r[1] for r in results]),
+                np.array([r[3]['image'] for r in results])))
+
+        np.random.seed(seed)
+        batched = [batch_game.reset()]
+        for t in range(n_steps):
+            obs, rewards, done, info = batch_game.step(actions[t])
+            assert done.shape == (n_games,)
+            batched.append((obs, rewards, info['image']))
+
+    assert np.array_equal(separate[0], batched[0])
+
+    for s, b in zip(separate[1:], batched[1:]):
+        for _s, _b in zip(s, b):
+            assert np.array_equal(_s, _b)
+
+
+def test_incremental_renderer():
+    """ Images rendered incrementally are identical to ones composited from scratch. """
+    np.random.seed(0)
+    rng = np.random.RandomState(0)
+
+    with collect.config.copy(n_collectables=10, n_obstacles=10, max_overlap=1.0, discrete_actions=True):
+        env = collect.CollectA()
+
+        for episode in range(3):
+            env.reset()
+            for t in range(20):
+                obs, reward, done, info = env.step((rng.randint(8), rng.randint(3)))
+                assert info['render_duration'] >= 0
+
+                expected = IncrementalRenderer(env.image_shape, env.background_colour, env.entities).render()
+                assert np.array_equal(info['image'], expected)
+
+
+def test_entity_feature_buffer():
+    """ Observations read from the cached feature buffer match features computed from the entities. """
+    np.random.seed(0)
+    rng = np.random.RandomState(0)
+
+    with collect.config.copy(n_collectables=10, n_obstacles=10, max_overlap=1.0, discrete_actions=True):
+        env = collect.CollectA()
+
+        def expected_features():
+            height, width = env.image_shape
+            return sorted(
+                (1.0, e.top / height, e.left / width, e.h, e.w, *env.get_entity_features(e))
+                for e in env.entities if e.alive)
+
+        def observed_features(obs):
+            obs = obs.reshape(env.max_entities, -1)
+            return sorted(tuple(row) for row in obs if row[0] > 0)
+
+        for episode in range(3):
+            obs = env.reset()
+            assert observed_features(obs) == expected_features()
+
+            for t in range(20):
+                obs, reward, done, info = env.step((rng.randint(8), rng.randint(3)))
+                assert observed_features(obs) == expected_features()
+
+            # Changes made through the entity setters are picked up automatically.
+            env.entities[1].alive = False
+            env.entities[2].top += 1.0
+            env.entities[3].h += 1.0
+            assert observed_features(env.get_entities()) == expected_features()
+
+            # Changes to game-specific features require an explicit notification.
+            entity = next(e for e in env.entities if e.alive)
+            entity.idx = (entity.idx + 1) % len(env.entity_specs)
+            assert observed_features(env.get_entities()) != expected_features()
+
+            env.entity_features_changed()
+            assert observed_features(env.get_entities()) == expected_features()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+
+try:
+    import mpi4py
+except ImportError:
+    mpi4py = None
+
+
+requires_mpi = pytest.mark.skipif(
+    mpi4py is None or shutil.which("mpiexec") is None, reason="Requires mpi4py and mpiexec.")
+
+
+def _run_mpi_script(name, n_procs=2):
+    script = os.path.join(os.path.dirname(__file__), name)
+
+    env = os.environ.copy()
+    env.update(OMPI_ALLOW_RUN_AS_ROOT="1", OMPI_ALLOW_RUN_AS_ROOT_CONFIRM="1")
+
+    return subprocess.check_output(
+        ["mpiexec", "-n", str(n_procs), sys.executable, script], env=env, timeout=600, universal_newlines=True)
+
+
+@requires_mpi
+def test_mpi_data_parallel_gradients():
+    output = _run_mpi_script("mpi_data_parallel.py")
+    assert "Parameters consistent across 2 processes." in output
+
+
+@requires_mpi
+@pytest.mark.slow
+def test_mpi_updater_lockstep():
+    output = _run_mpi_script("mpi_updater.py")
+    assert "Parameters consistent across 2 processes." in output
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from dps.rl import RLContext
+
+
+def test_staged_minibatches():
+    with tf.Graph().as_default(), tf.Session() as sess:
+        with RLContext(1.0) as context:
+            context.stage_batches = True
+            values = context.batch_placeholder(tf.float32, (2, None, 1), "_values")
+            exploration = context.batch_placeholder(tf.float32, (None,), "_exploration", batch_axis=0)
+            mode = tf.placeholder(tf.string, ())
+
+        sess.run(tf.global_variables_initializer())
+
+        batch = np.arange(12, dtype='f').reshape(2, 6, 1)
+        remaining = context.stage_batch({values: batch, exploration: np.arange(6, dtype='f'), mode: "train"}, 6)
+        assert list(remaining) == [mode]
+
+        assert np.all(sess.run(values) == batch)
+
+        # Fed values take precedence over the staged batch.
+        assert np.all(sess.run(values, feed_dict={values: batch[:, :2]}) == batch[:, :2])
+
+        context.shuffle_staged_batch()
+
+        selected = []
+        for start in range(0, 6, 2):
+            v, e = sess.run([values, exploration], feed_dict=context.staged_minibatch(start, 2))
+            assert v.shape == (2, 2, 1)
+            assert np.all(v[0, :, 0] == e)
+            assert np.all(v[1, :, 0] == e + 6)
+            selected.extend(e)
+
+        assert sorted(selected) == list(range(6))
+
+        # Staging a new batch resets the order.
+        context.stage_batch({values: batch[:, :3], exploration: np.arange(3, dtype='f')}, 3)
+        assert np.all(sess.run(exploration) == np.arange(3))
+
+
+def test_batch_placeholder_without_staging():
+    with tf.Graph().as_default():
+        with RLContext(1.0) as context:
+            values = context.batch_placeholder(tf.float32, (2, None, 1), "_values")
+
+        assert values.op.type == "Placeholder"
+        assert tf.global_variables() == []
+
+        with pytest.raises(Exception):
+            context.stage_batch({values: np.zeros((2, 3, 1))}, 3)
@@ -32,5 +32,42 @@ def test_dynamic_partition():
         assert np.allclose(r2, data[actions == i, 3:5])
 
 
+def test_register_layout():
+    RB = RegisterBank(
+        'RB', 'a b c', 'd e',
+        [[1.0, 2.0], 0.0, [3.0, 4.0, 5.0], 6.0, [7.0, 8.0]],
+        'c a')
+
+    batch_size = 4
+    data = np.random.random((batch_size, RB.width)).astype('f')
+    original = data.copy()
+    data_ph = tf.placeholder(tf.float32, (None, RB.width))
+
+    a = np.random.random((batch_size, 2)).astype('f')
+    e = np.random.random((batch_size, 2)).astype('f')
+
+    expected_update = data.copy()
+    expected_update[:, 0:2] = a
+    expected_update[:, 7:9] = e
+
+    sess = tf.Session()
+
+    for array, run in [(data, lambda x: x), (data_ph, lambda x: sess.run(x, feed_dict={data_ph: data}))]:
+        registers = RB.as_tuple(array)
+        assert len(registers) == 5
+        for name, value in zip(RB.names, registers):
+            start, end = RB._offsets[name]
+            assert np.allclose(run(value), data[:, start:end])
+
+        assert np.allclose(run(RB.get_output(array)), np.concatenate([data[:, 3:6], data[:, 0:2]], axis=1))
+        assert np.allclose(run(RB.get_many('e b', array)), np.concatenate([data[:, 7:9], data[:, 2:3]], axis=1))
+        assert np.allclose(run(RB.update(array, e=e, a=a)), expected_update)
+
+    # Updating does not modify the original array.
+    assert np.array_equal(data, original)
+    assert RB.layout('a b c') is RB.layout(['a', 'b', 'c'])
+
+
 if __name__ == "__main__":
     test_dynamic_partition()
+    test_register_layout()
@@ -0,0 +1,213 @@
+import os
+import numpy as np
+import tensorflow as tf
+
+from dps.rl import (
+    RolloutBatch, ReplayBuffer, PrioritizedReplayBuffer, ProportionalPrioritizedReplayBuffer, RLContext
+)
+from dps.rl.replay import ReplayStore, SumTree
+
+
+def _make_rollouts(T, batch_size, offset=0, done_at=None):
+    # Like rollouts produced by an env's sampler, `obs` includes the final observation.
+    obs = offset + np.arange(batch_size)[None, :, None] + np.zeros((T+1, batch_size, 3))
+    actions = np.tile(np.arange(T)[:, None, None], (1, batch_size, 1)).astype('f')
+    rewards = np.ones((T, batch_size, 1))
+    done = np.zeros((T, batch_size, 1))
+    if done_at is not None:
+        done[done_at, :, 0] = 1.0
+    return RolloutBatch(
+        obs, actions, rewards, done=done, info=[{}] * T,
+        static=dict(exploration=offset + np.arange(batch_size) / 10.))
+
+
+def test_replay_store(tmpdir):
+    for directory in [None, str(tmpdir)]:
+        store = ReplayStore(5, directory=directory)
+
+        store.add_rollouts(_make_rollouts(4, 3, offset=0))
+        assert len(store) == 3
+        store.add_rollouts(_make_rollouts(4, 3, offset=10))
+        assert len(store) == 5
+        assert store.index == 1
+
+        # Slot 0 has been overwritten by the last rollout of the second batch.
+        batch = store.get([0, 1, 4])
+        assert batch.T == 4
+        assert batch.batch_size == 3
+        assert np.all(batch.obs[:, :, 0] == np.array([12, 1, 11])[None, :])
+        assert np.all(batch.actions[:, 0, 0] == np.arange(4))
+        assert np.allclose(batch.get_static('exploration'), [10.2, 0.1, 10.1])
+        assert 'info' not in batch
+
+
+def test_replay_store_shared_directory(tmpdir):
+    directory = str(tmpdir)
+    first = ReplayStore(5, directory=directory, name="buffer")
+    second = ReplayStore(5, directory=directory, name="buffer")
+    assert first.directory != second.directory
+    assert os.path.dirname(first.directory) == directory
+    assert os.path.basename(first.directory).startswith("buffer")
+
+    first.add_rollouts(_make_rollouts(4, 3, offset=0))
+    second.add_rollouts(_make_rollouts(4, 3, offset=10))
+
+    batch = first.get([0, 1, 2])
+    assert np.all(batch.obs[:, :, 0] == np.array([0, 1, 2])[None, :])
+    batch = second.get([0, 1, 2])
+    assert np.all(batch.obs[:, :, 0] == np.array([10, 11, 12])[None, :])
+
+
+def test_replay_store_close(tmpdir):
+    directory = str(tmpdir)
+    store = ReplayStore(5, directory=directory)
+    store.add_rollouts(_make_rollouts(4, 3, offset=0))
+    store_directory = store.directory
+    assert os.listdir(store_directory)
+
+    # Only the store's own subdirectory is removed.
+    store.close()
+    assert not os.path.exists(store_directory)
+    assert os.path.isdir(directory)
+
+    store = ReplayStore(5)
+    store.add_rollouts(_make_rollouts(4, 3, offset=0))
+    store.close()
+
+
+def test_replay_store_sequences():
+    store = ReplayStore(10)
+    store.add_rollouts(_make_rollouts(6, 2, done_at=1))
+    store.add_rollouts(_make_rollouts(6, 2))
+
+    assert list(store.lengths[:4]) == [2, 2, 6, 6]
+
+    seqs = store.sample_sequences(20, length=3)
+    assert seqs.T == 3
+    assert seqs.obs.shape[0] == 4
+    assert seqs.batch_size == 20
+
+    # Only un-terminated rollouts are long enough, and sequences are contiguous in time.
+    actions = seqs.actions[:, :, 0]
+    assert np.all(np.diff(actions, axis=0) == 1)
+    assert np.all(actions[-1] <= 5)
+
+    assert store.sample_sequences(5, length=7) is None
+
+
+def test_replay_buffer():
+    with RLContext(1.0):
+        buf = ReplayBuffer(100, min_experiences=10)
+    buf.add_rollouts(_make_rollouts(4, 8))
+
+    assert buf.get_batch(4) == (None, None)
+
+    buf.add_rollouts(_make_rollouts(4, 8))
+    experiences, weights = buf.get_batch(4)
+    assert experiences.batch_size == 4
+    assert experiences.T == 4
+    assert weights.shape == (4,)
+
+
+def test_sum_tree():
+    tree = SumTree(5)
+    values = np.array([1.0, 0.0, 3.0, 2.0, 4.0])
+    tree.update(np.arange(5), values)
+
+    assert np.isclose(tree.total, 10.0)
+    assert np.isclose(tree.min, 0.0)
+
+    # Each value is mapped to the leaf whose prefix-sum interval contains it.
+    assert list(tree.find([0.0, 0.99, 1.0, 3.99, 4.0, 5.99, 6.0, 9.99])) == [0, 0, 2, 2, 3, 3, 4, 4]
+
+    # Duplicated indices in a single update.
+    tree.update([1, 1, 4], [5.0, 2.0, 1.0])
+    assert np.allclose(tree[np.arange(5)], [1.0, 2.0, 3.0, 2.0, 1.0])
+    assert np.isclose(tree.total, 9.0)
+    assert np.isclose(tree.min, 1.0)
+
+    np.random.seed(0)
+    samples = tree.sample(90000)
+    freqs = np.bincount(samples, minlength=5) / len(samples)
+    assert np.allclose(freqs, tree[np.arange(5)] / tree.total, atol=0.01)
+
+
+def test_proportional_replay_buffer():
+    with RLContext(1.0):
+        buf = ProportionalPrioritizedReplayBuffer(
+            16, priority_func=None, alpha=1.0, beta_schedule=0.5, min_experiences=4)
+
+    assert buf.get_batch(2) == (None, None)
+
+    buf.add_rollouts(_make_rollouts(4, 8))
+    assert buf.beta(0) == 0.5
+
+    # All experiences start out with the same priority.
+    experiences, weights = buf.get_batch(8)
+    assert experiences.batch_size == 8
+    assert np.allclose(weights, 1.0)
+
+    indices = buf._active_set
+    priorities = np.arange(8)
+    buf.update_priority(priorities)
+
+    p = (np.abs(priorities) + buf.epsilon)
+    assert np.allclose(buf.tree[indices], p)
+
+    experiences, weights = buf.get_batch(4, step=10)
+    p_x = buf.tree[buf._active_set] / buf.tree.total
+    p_min = buf.tree.min / buf.tree.total
+    assert np.allclose(weights, (p_x / p_min) ** -0.5)
+    assert np.all(weights <= 1.0)
+
+
+def test_proportional_replay_buffer_beta_schedule():
+    with RLContext(1.0):
+        buf = ProportionalPrioritizedReplayBuffer(
+            16, priority_func=None, alpha=1.0, beta_schedule="Poly(0.4, 1.0, 100)")
+
+    # beta is evaluated on the host at the learner's update count.
+    assert np.isclose(buf.beta(0), 0.4)
+    assert np.isclose(buf.beta(50), 0.7)
+    assert np.isclose(buf.beta(100), 1.0)
+
+    buf.add_rollouts(_make_rollouts(4, 8))
+    buf.get_batch(4)
+    buf.update_priority(np.arange(4))
+
+    _, weights = buf.get_batch(4, step=100)
+    p_x = buf.tree[buf._active_set] / buf.tree.total
+    p_min = buf.tree.min / buf.tree.total
+    assert np.allclose(weights, (p_x / p_min) ** -1.0)
+
+
+def test_rank_replay_buffer_lazy_resort():
+    with RLContext(1.0):
+        buf = PrioritizedReplayBuffer(
+            16, 4, priority_func=None, alpha=0.7, beta_schedule=0.5, resort_interval=2)
+    buf.beta = tf.constant(0.5)
+
+    with tf.Session().as_default():
+        buf.add_rollouts(_make_rollouts(4, 8))
+        assert list(buf.ranking) == list(range(8))
+
+        experiences, weights = buf.get_batch(8)
+        assert experiences.batch_size == 8
+        assert weights.shape == (8,)
+
+        # The ranking is not recomputed until `resort_interval` updates have been made.
+        sampled = buf._active_set
+        buf.update_priority(sampled + 1.0)
+        assert buf.n_resorts == 0
+        assert list(buf.ranking) == list(range(8))
+
+        buf.get_batch(8)
+        buf.update_priority(buf._active_set + 1.0)
+        assert buf.n_resorts == 1
+        assert np.all(np.diff(buf.priorities[buf.ranking]) <= 0)
+
+        # New experiences go straight to the top of the ranking with the maximum priority.
+        buf.add_rollouts(_make_rollouts(4, 2))
+        assert set(buf.ranking[:2]) == {8, 9}
+        assert len(buf.ranking) == 10
+        assert buf.priorities[8] == buf.priorities[buf.ranking[2]]
@@ -1,6 +1,8 @@
 import numpy as np
+import tensorflow as tf
 
 from dps.rl import RolloutBatch
+from dps.rl.base import FeedPlan
 
 
 def test_rollouts():
@@ -80,24 +82,24 @@ def test_rollouts_shapes_and_types():
     assert(isinstance(r1.o, np.ndarray))
     assert(isinstance(r1.obs, np.ndarray))
     assert(isinstance(r1['obs'], np.ndarray))
-    assert(isinstance(r1._get('obs'), list))
-    assert(isinstance(r1._obs, list))
+    assert(isinstance(r1._get('obs'), np.ndarray))
+    assert(isinstance(r1._obs, np.ndarray))
 
     assert(isinstance(r1.a, np.ndarray))
     assert(isinstance(r1.actions, np.ndarray))
     assert(isinstance(r1['actions'], np.ndarray))
-    assert(isinstance(r1._get('actions'), list))
-    assert(isinstance(r1._actions, list))
+    assert(isinstance(r1._get('actions'), np.ndarray))
+    assert(isinstance(r1._actions, np.ndarray))
 
     assert(isinstance(r1.r, np.ndarray))
     assert(isinstance(r1.rewards, np.ndarray))
     assert(isinstance(r1['rewards'], np.ndarray))
-    assert(isinstance(r1._get('rewards'), list))
-    assert(isinstance(r1._rewards, list))
+    assert(isinstance(r1._get('rewards'), np.ndarray))
+    assert(isinstance(r1._rewards, np.ndarray))
 
     assert(isinstance(r1.entropy, np.ndarray))
     assert(isinstance(r1['entropy'], np.ndarray))
-    assert(isinstance(r1._get('entropy'), list))
+    assert(isinstance(r1._get('entropy'), np.ndarray))
 
     assert(isinstance(r1.o, np.ndarray))
     assert(isinstance(r1.a, np.ndarray))
@@ -149,24 +151,24 @@ def test_rollouts_shapes_and_types():
     assert(isinstance(combined.o, np.ndarray))
     assert(isinstance(combined.obs, np.ndarray))
     assert(isinstance(combined['obs'], np.ndarray))
-    assert(isinstance(combined._get('obs'), list))
-    assert(isinstance(combined._obs, list))
+    assert(isinstance(combined._get('obs'), np.ndarray))
+    assert(isinstance(combined._obs, np.ndarray))
 
     assert(isinstance(combined.a, np.ndarray))
     assert(isinstance(combined.actions, np.ndarray))
     assert(isinstance(combined['actions'], np.ndarray))
-    assert(isinstance(combined._get('actions'), list))
-    assert(isinstance(combined._actions, list))
+    assert(isinstance(combined._get('actions'), np.ndarray))
+    assert(isinstance(combined._actions, np.ndarray))
 
     assert(isinstance(combined.r, np.ndarray))
     assert(isinstance(combined.rewards, np.ndarray))
     assert(isinstance(combined['rewards'], np.ndarray))
-    assert(isinstance(combined._get('rewards'), list))
-    assert(isinstance(combined._rewards, list))
+    assert(isinstance(combined._get('rewards'), np.ndarray))
+    assert(isinstance(combined._rewards, np.ndarray))
 
     assert(isinstance(combined.entropy, np.ndarray))
     assert(isinstance(combined['entropy'], np.ndarray))
-    assert(isinstance(combined._get('entropy'), list))
+    assert(isinstance(combined._get('entropy'), np.ndarray))
 
     assert(combined.o.shape == new_shape + obs_shape)
     assert(combined.a.shape == new_shape + action_shape)
@@ -185,24 +187,24 @@ def test_rollouts_shapes_and_types():
     assert(isinstance(r1.o, np.ndarray))
     assert(isinstance(r1.obs, np.ndarray))
     assert(isinstance(r1['obs'], np.ndarray))
-    assert(isinstance(r1._get('obs'), list))
-    assert(isinstance(r1._obs, list))
+    assert(isinstance(r1._get('obs'), np.ndarray))
+    assert(isinstance(r1._obs, np.ndarray))
 
     assert(isinstance(r1.a, np.ndarray))
     assert(isinstance(r1.actions, np.ndarray))
     assert(isinstance(r1['actions'], np.ndarray))
-    assert(isinstance(r1._get('actions'), list))
-    assert(isinstance(r1._actions, list))
+    assert(isinstance(r1._get('actions'), np.ndarray))
+    assert(isinstance(r1._actions, np.ndarray))
 
     assert(isinstance(r1.r, np.ndarray))
     assert(isinstance(r1.rewards, np.ndarray))
     assert(isinstance(r1['rewards'], np.ndarray))
-    assert(isinstance(r1._get('rewards'), list))
-    assert(isinstance(r1._rewards, list))
+    assert(isinstance(r1._get('rewards'), np.ndarray))
+    assert(isinstance(r1._rewards, np.ndarray))
 
     assert(isinstance(r1.entropy, np.ndarray))
     assert(isinstance(r1['entropy'], np.ndarray))
-    assert(isinstance(r1._get('entropy'), list))
+    assert(isinstance(r1._get('entropy'), np.ndarray))
 
     assert(r1.o.shape == new_shape + obs_shape)
     assert(r1.a.shape == new_shape + action_shape)
@@ -261,3 +263,136 @@ def test_rollouts_split_join():
     for r in splitted:
         assert len(r) == T
         assert r.batch_size == 1
+
+
+def test_rollouts_append_in_place():
+    batch_size = 3
+    r = RolloutBatch(capacity=4)
+
+    for t in range(10):
+        r.append(
+            t * np.ones((batch_size, 2)), np.zeros((batch_size, 1)), np.ones((batch_size, 1)),
+            done=np.zeros((batch_size, 1), dtype=bool), info={'t': t})
+
+    assert r.T == 10
+    assert r.capacity >= 10
+    assert r.o.shape == (10, batch_size, 2)
+    assert np.all(r.o[:, :, 0] == np.arange(10)[:, None])
+    assert r.info[9]['t'] == 9
+
+    # Field access and splitting return views, not copies.
+    assert np.shares_memory(r.o, r.obs)
+    splitted = r.split()
+    assert np.shares_memory(splitted[1].o, r.o)
+    assert splitted[1].o.shape == (10, 1, 2)
+
+    # Appending to a split rollout must not write into the parent.
+    splitted[1].append(np.ones((1, 2)), np.zeros((1, 1)), np.ones((1, 1)), done=np.zeros((1, 1), dtype=bool), info={})
+    assert splitted[1].T == 11
+    assert r.T == 10
+
+    joined = RolloutBatch.join(splitted[:1] + splitted[2:])
+    assert joined.o.shape == (10, 2, 2)
+
+
+def test_rollouts_final_obs():
+    T, batch_size = 4, 3
+
+    # Rollouts produced by an env's sampler include the final observation.
+    r = RolloutBatch(
+        np.zeros((T+1, batch_size, 2)), np.zeros((T, batch_size, 1)), np.ones((T, batch_size, 1)))
+    assert r.T == T
+    assert r.obs.shape == (T+1, batch_size, 2)
+
+    combined = r + r
+    assert combined.T == 2 * T
+    assert combined.obs.shape == (2 * (T+1), batch_size, 2)
+
+    splitted = r.split()
+    assert splitted[0].T == T
+    assert splitted[0].obs.shape == (T+1, 1, 2)
+
+    joined = RolloutBatch.join(splitted)
+    assert joined.T == T
+    assert joined.obs.shape == (T+1, batch_size, 2)
+
+
+def test_rollouts_ownership_and_shared_components():
+    T, batch_size = 3, 2
+    obs = np.zeros((T, batch_size, 2))
+
+    # The batch copies values it is given, so writing to its components leaves the caller's arrays alone.
+    r = RolloutBatch(obs, np.zeros((T, batch_size, 1)), np.zeros((T, batch_size, 1)), info=[{'t': t} for t in range(T)])
+    r.obs[0, 0, 0] = 1.0
+    assert obs[0, 0, 0] == 0.0
+    assert r.obs[0, 0, 0] == 1.0
+
+    # Components with fewer than 2 dimensions are shared: split gives each rollout the whole
+    # component, and join keeps the component of the first batch.
+    other = RolloutBatch(
+        np.ones((T, batch_size, 2)), np.zeros((T, batch_size, 1)), np.zeros((T, batch_size, 1)),
+        info=[{'t': -t} for t in range(T)])
+
+    for s in r.split():
+        assert [i['t'] for i in s.info] == [0, 1, 2]
+
+    joined = RolloutBatch.join([r, other])
+    assert joined.batch_size == 2 * batch_size
+    assert [i['t'] for i in joined.info] == [0, 1, 2]
+
+    joined = RolloutBatch.join([other, r])
+    assert [i['t'] for i in joined.info] == [0, -1, -2]
+
+    empty = RolloutBatch()
+    assert empty.batch_size == 0
+    assert empty.T == 0
+
+
+def test_feed_plan():
+    T, batch_size = 4, 3
+    done = np.zeros((T, batch_size))
+    done[1, 0] = 1
+    done[3, 2] = 1
+
+    r = RolloutBatch(
+        np.random.randn(T+1, batch_size, 2), np.zeros((T, batch_size, 1)), np.random.randn(T, batch_size),
+        done=done)
+
+    with tf.Graph().as_default():
+        obs_ph = tf.placeholder(tf.float32, (None, None, 2))
+        rewards_ph = tf.placeholder(tf.float32, (None, None, 1))
+        mask_ph = tf.placeholder(tf.float32, (None, None, 1))
+        weights_ph = tf.placeholder(tf.float32, (None, None, 1))
+        utils_ph = tf.placeholder(tf.float32, (None, None, 2))
+        mode_ph = tf.placeholder(tf.string, ())
+
+    plan = FeedPlan()
+    plan.add(obs_ph, 'obs')
+    plan.add(rewards_ph, 'rewards')
+    plan.add(mask_ph, 'done', kind="mask")
+    plan.add(weights_ph, kind="weights")
+    plan.add(utils_ph, 'utils', optional=True)
+    plan.add(mode_ph, kind="mode")
+
+    fd = plan.feed_dict(r, 'train', weights=np.arange(batch_size))
+
+    assert fd[obs_ph].dtype == np.float32
+    assert np.allclose(fd[obs_ph], r.obs)
+    assert fd[rewards_ph].shape == (T, batch_size, 1)
+    assert np.allclose(fd[rewards_ph][..., 0], r.rewards)
+
+    expected_mask = np.ones((T, batch_size))
+    expected_mask[1:] = 1 - done[:-1]
+    assert np.all(fd[mask_ph][..., 0] == expected_mask)
+
+    assert np.all(fd[weights_ph][..., 0] == np.arange(batch_size))
+    assert utils_ph not in fd
+    assert fd[mode_ph] == 'train'
+
+    # Buffers are reused for calls with the same mode, but not shared between modes.
+    fd2 = plan.feed_dict(r, 'train')
+    assert fd2[obs_ph] is fd[obs_ph]
+    assert np.all(fd2[weights_ph] == 1)
+
+    fd3 = plan.feed_dict(r, 'val')
+    assert fd3[obs_ph] is not fd[obs_ph]
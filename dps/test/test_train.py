@@ -5,7 +5,7 @@ import pytest
 
 from dps.run import _run
 from dps.rl.algorithms.a2c import reinforce_config
-from dps.train import training_loop, Hook
+from dps.train import training_loop, Hook, ScalarSummaryBuffer
 from dps.env.advanced import translated_mnist
 from dps.env.advanced import simple_addition
 from dps.config import DEFAULT_CONFIG
@@ -289,3 +289,46 @@ def test_fixed_variables(test_config):
 
     for key in relevant_keys:
         assert (tensors1[key] != tensors4[key]).any(), "Error on tensor with name {}".format(key)
+
+
+class _RecordingWriter(object):
+    def __init__(self):
+        self.events = []
+
+    def add_summary(self, summary, step):
+        self.events.append((step, {v.tag: v.simple_value for v in summary.value}))
+
+
+def test_scalar_summary_buffer():
+    writer = _RecordingWriter()
+    buf = ScalarSummaryBuffer(writer, flush_step=3)
+    for step in range(5):
+        buf.add(dict(loss=step), step)
+
+    assert [s for s, _ in writer.events] == [0, 1, 2]
+    buf.flush()
+    assert [s for s, _ in writer.events] == [0, 1, 2, 3, 4]
+    assert writer.events[4][1] == {"all/loss": 4.0}
+    assert buf.n_steps == 5
+    assert buf.n_events == 5
+
+    writer = _RecordingWriter()
+    buf = ScalarSummaryBuffer(writer, flush_step=4, downsample=True)
+    for step in range(6):
+        buf.add(dict(loss=step), step)
+    buf.flush()
+
+    assert writer.events == [(3, {"all/loss": 1.5}), (5, {"all/loss": 4.5})]
+    assert buf.n_events == 2
+
+    # Records for the same step are merged into one event.
+    writer = _RecordingWriter()
+    buf = ScalarSummaryBuffer(writer, flush_step=4)
+    for step in range(2):
+        buf.add(dict(loss=step), step)
+        buf.add(dict(accuracy=-step), step)
+
+    assert writer.events == [(0, {"all/loss": 0.0, "all/accuracy": 0.0}), (1, {"all/loss": 1.0, "all/accuracy": -1.0})]
+    assert buf.n_steps == 4
+    assert buf.n_events == 2
+    assert 0 <= buf.write_duration <= buf.duration
@@ -0,0 +1,91 @@
+import numpy as np
+import tensorflow as tf
+import pytest
+
+from dps.rl import RLContext
+from dps.rl.trust_region import TrustRegionOptimizer, cg, build_cg
+from dps.utils.tf import masked_mean
+
+
+@pytest.mark.parametrize("max_steps", [3, 8])
+def test_build_cg(max_steps):
+    rng = np.random.RandomState(0)
+    n = 8
+    M = rng.randn(n, n)
+    A = M.dot(M.T) + n * np.eye(n)
+    b = rng.randn(n)
+
+    expected = cg(A, b.copy(), max_steps=max_steps)
+    if max_steps == n:
+        assert np.allclose(expected, np.linalg.solve(A, b), atol=1e-4)
+
+    A_tensor = tf.constant(A, tf.float32)
+    x = build_cg(lambda v: tf.reshape(tf.matmul(A_tensor, v[:, None]), [-1]), tf.constant(b, tf.float32), max_steps)
+
+    with tf.Session() as sess:
+        result = sess.run(x)
+
+    assert np.allclose(result, expected, atol=1e-4)
+
+
+class _SoftmaxPolicy(object):
+    """ Linear softmax policy over 3 actions, acting on 2-dimensional observations. """
+    def __init__(self, obs, rewards):
+        self.W = tf.Variable(np.zeros((2, 3)), dtype=tf.float32, name="W")
+        logits = tf.tensordot(obs, self.W, axes=1)
+        self.probs = tf.nn.softmax(logits)
+        self.log_probs = tf.nn.log_softmax(logits)
+        self.expected_reward = tf.reduce_sum(self.probs * rewards, axis=-1, keepdims=True)
+
+    def trainable_variables(self, for_opt):
+        return [self.W]
+
+    def generate_signal(self, key, context, **kwargs):
+        assert key == 'kl'
+        prev_probs = tf.stop_gradient(self.probs)
+        prev_log_probs = tf.stop_gradient(self.log_probs)
+        return tf.reduce_sum(prev_probs * (prev_log_probs - self.log_probs), axis=-1, keepdims=True)
+
+
+# With delta=100 the full step is rejected and the line search accepts the first backtrack.
+@pytest.mark.parametrize("delta", [0.01, 100.0])
+def test_trust_region_in_graph_matches_numpy(delta):
+    rng = np.random.RandomState(0)
+    T, batch_size = 3, 5
+    obs_value = rng.randn(T, batch_size, 2).astype('f')
+    mask_value = np.ones((T, batch_size, 1), dtype='f')
+    mask_value[2, :2] = 0.0
+    W_value = rng.randn(2, 3).astype('f')
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+        with RLContext(1.0) as context:
+            context.stage_batches = True
+            obs = context.batch_placeholder(tf.float32, (T, None, 2), "_obs")
+            mask = context.batch_placeholder(tf.float32, (T, None, 1), "_mask")
+            context._signals['mask'] = mask
+
+            policy = _SoftmaxPolicy(obs, tf.constant([1.0, -1.0, 0.5]))
+            context.objective = masked_mean(policy.expected_reward, mask)
+
+            optimizers = {}
+            for in_graph in [False, True]:
+                optimizers[in_graph] = TrustRegionOptimizer(
+                    [policy], policy, delta, max_cg_steps=4, max_line_search_steps=5, in_graph=in_graph)
+                optimizers[in_graph].build_update(context)
+
+        sess.run(tf.global_variables_initializer())
+
+        results = {}
+        for in_graph, optimizer in optimizers.items():
+            policy.W.load(W_value, sess)
+            norms = optimizer.update(
+                batch_size, {obs: obs_value, mask: mask_value},
+                [optimizer.grad_norm_pure, optimizer.grad_norm_natural, optimizer.step_norm])
+            results[in_graph] = sess.run(policy.W), norms
+
+    numpy_params, numpy_norms = results[False]
+    in_graph_params, in_graph_norms = results[True]
+
+    assert np.allclose(in_graph_params, numpy_params, atol=1e-4)
+    assert np.allclose(in_graph_norms, numpy_norms, rtol=1e-3, atol=1e-5)
+    assert numpy_norms[2] > 0
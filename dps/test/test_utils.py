@@ -1,11 +1,17 @@
+import json
+import os
+import time
 import numpy as np
 import tensorflow as tf
 import matplotlib.pyplot as plt
 
 from dps.utils.tf import (
-    Polynomial, Poly, Exponential, Exp, Reciprocal, Constant, RepeatSchedule
+    Polynomial, Poly, Exponential, Exp, Reciprocal, Constant, RepeatSchedule,
+    SessionRunTracer, unrolled_while_loop
     # MixtureSchedule, ChainSchedule,
 )
+from dps.utils import ResourceMonitor, ExperimentDirectory, Config
+import dps.utils.base as utils_base
 
 
 def test_schedule(show_plots):
@@ -22,6 +28,7 @@ def test_schedule(show_plots):
         "Exp(2.0, 1.0, 100, 0.9)",
         "Poly(2.0, 1.0, 5000)",
         "Reciprocal(2.0, 1.0, 5000)",
+        "Constant(2.0)",
     ]
     t = tf.constant(np.arange(10000), dtype=tf.int32)
     sess = tf.Session()
@@ -29,9 +36,127 @@ def test_schedule(show_plots):
         s = eval(schedule)
         signal = s.build(t)
         result = sess.run(signal)
+
+        # Computing the schedule on the host should agree with the graph.
+        assert np.allclose(s.value(np.arange(10000)), result, rtol=1e-5)
         if show_plots:
             plt.plot(result, label=schedule)
 
     if show_plots:
         plt.legend()
         plt.show()
+
+
+def test_session_run_tracer():
+    graph = tf.Graph()
+    with graph.as_default(), graph.device("/cpu:0"):
+        a = tf.constant(np.random.randn(100, 100), dtype=tf.float32)
+        b = tf.matmul(a, a, name="big_matmul")
+        c = tf.reduce_sum(b)
+
+        sess = tf.Session(graph=graph)
+
+        with sess.as_default():
+            with SessionRunTracer() as tracer:
+                tf.get_default_session().run(c)
+                sess.run(b)
+
+            # No longer traced
+            sess.run(c)
+
+    assert len(tracer.run_metadata) == 2
+
+    traces = tracer.chrome_traces()
+    assert len(traces) == 2
+    for trace in traces:
+        assert "traceEvents" in json.loads(trace)
+
+    op_times = tracer.op_times()
+    assert "big_matmul" in [name for name, *_ in op_times]
+    assert [r[2] for r in op_times] == sorted([r[2] for r in op_times], reverse=True)
+    assert "big_matmul" in tracer.summarize(top_k=5)
+
+
+def test_unrolled_while_loop():
+    n = tf.placeholder(tf.int32, ())
+
+    def cond(i, total, ta):
+        return i < n
+
+    def body(i, total, ta):
+        return i + 1, total + i, ta.write(i, total)
+
+    loop_vars = [tf.constant(0), tf.constant(0), tf.TensorArray(tf.int32, size=0, dynamic_size=True)]
+
+    results = []
+    for unroll in [1, 3, 4]:
+        i, total, ta = unrolled_while_loop(cond, body, loop_vars, unroll=unroll, parallel_iterations=10)
+        results.append((i, total, ta.stack()))
+
+    sess = tf.Session()
+    for _n in [1, 7, 12]:
+        expected = np.cumsum([0] + list(range(_n)))
+        for i, total, stacked in sess.run(results, feed_dict={n: _n}):
+            assert i == _n
+            assert total == expected[-1]
+            assert np.array_equal(stacked, expected[:-1])
+
+
+def test_resource_monitor():
+    with ResourceMonitor(interval=0.01) as monitor:
+        data = np.ones((1000, 1000))
+        time.sleep(0.1)
+
+    assert monitor.n_samples > 2
+    assert not monitor.ceiling_reached.is_set()
+    assert monitor.latest["memory_physical_mb"] > 0
+    assert monitor.latest["n_threads"] >= 1
+
+    peaks = monitor.reset_peaks()
+    assert peaks["memory_physical_mb"] >= monitor.latest["memory_physical_mb"]
+    del data
+
+    with ResourceMonitor(interval=0.01, memory_ceiling_mb=1) as monitor:
+        assert monitor.ceiling_reached.wait(1.0)
+
+
+def test_environment_context_cache(tmpdir, monkeypatch):
+    calls = []
+
+    def pip_freeze():
+        calls.append(None)
+        return "numpy==1.0"
+
+    monkeypatch.setattr(utils_base, "pip_freeze", pip_freeze)
+    monkeypatch.setattr(utils_base, "summarize_git_repos", lambda **kwargs: "git summary")
+
+    cache_dir = str(tmpdir.join("cache"))
+    key = "test_environment_context_cache_{}".format(time.time())
+
+    context, context_hash = utils_base.environment_context(key=key, cache_dir=cache_dir)
+    assert context["pip_freeze.txt"] == "numpy==1.0"
+    assert len(calls) == 1
+
+    # Cached in-process
+    assert utils_base.environment_context(key=key, cache_dir=cache_dir) == (context, context_hash)
+    assert len(calls) == 1
+
+    # Cached on disk
+    monkeypatch.setattr(utils_base, "_environment_context_cache", {})
+    assert utils_base.environment_context(key=key, cache_dir=cache_dir) == (context, context_hash)
+    assert len(calls) == 1
+
+    exp_dir = ExperimentDirectory(str(tmpdir.join("exp")))
+    config = Config(a=1)
+    thread = exp_dir.record_environment(config=config, environment_key=key, cache_dir=cache_dir, background=True)
+    config.a = 2  # Not recorded, config is snapshotted before returning.
+    thread.join()
+    assert len(calls) == 1
+
+    with open(exp_dir.path_for("context/pip_freeze.txt"), "r") as f:
+        assert f.read() == "numpy==1.0"
+    with open(exp_dir.path_for("context/environment_hash.txt"), "r") as f:
+        assert f.read() == context_hash
+    with open(exp_dir.path_for("config.json"), "r") as f:
+        assert json.load(f)["a"] == 1
+    assert os.path.exists(exp_dir.path_for("config.pkl"))
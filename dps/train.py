@@ -10,7 +10,7 @@ import shutil
 import os
 import pandas as pd
 import dill
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import traceback
 import json
 import subprocess
@@ -18,12 +18,12 @@ from tabulate import tabulate
 
 from dps import cfg
 from dps.utils import (
-    gen_seed, time_limit, Alarm, memory_usage, gpu_memory_usage, ExperimentStore,
+    gen_seed, time_limit, Alarm, memory_usage, ExperimentStore, ResourceMonitor,
     ExperimentDirectory, nvidia_smi, memory_limit, Config, ClearConfig, redirect_stream,
     NumpySeed, restart_tensorboard, pdb_postmortem
 )
 from dps.utils.tf import (
-    uninitialized_variables_initializer, trainable_variables, walk_variable_scopes
+    uninitialized_variables_initializer, trainable_variables, walk_variable_scopes, SessionRunTracer
 )
 from dps.mpi_train import MPI_MasterContext
 
@@ -157,6 +157,19 @@ class TrainingLoop(object):
 
         self.curriculum_remaining[idx].update(stage_config)
 
+    def trace_step(self, local_step):
+        """ Whether the update on step `local_step` should be run with full tensorflow tracing. """
+        start = cfg.get('trace_start', -1)
+        if start is None or start < 0 or local_step < start:
+            return False
+
+        offset = local_step - start
+        every = cfg.get('trace_every', 0)
+        if every:
+            offset %= every
+
+        return offset < cfg.get('trace_n_steps', 1)
+
     def timestamp(self, message):
         print("{} ({}, {:.2f}s elapsed, {:.2f}s remaining)".format(
             message,
@@ -245,6 +258,7 @@ class TrainingLoop(object):
                     self._run()
 
             finally:
+                self.data.environment_thread.join()
                 self.data.summarize()
 
                 self.timestamp("Done training run (name={})".format(self.exp_name))
@@ -451,14 +465,23 @@ class TrainingLoop(object):
                 threshold_reached = False
                 reason = None
 
+                self.resource_monitor = ResourceMonitor(
+                    interval=cfg.get('resource_monitor_interval', 1.0),
+                    memory_ceiling_mb=cfg.get('memory_ceiling_mb', None),
+                    gpu=cfg.use_gpu)
+                memory_before = {}
+
                 try:
                     # --------------- Run stage -------------------
 
                     start = time.time()
-                    phys_memory_before = memory_usage(physical=True)
-                    gpu_memory_before = gpu_memory_usage()
+                    self.resource_monitor.start()
+                    memory_before = dict(self.resource_monitor.latest)
 
-                    threshold_reached, reason = self._run_stage(stage_idx, updater)
+                    try:
+                        threshold_reached, reason = self._run_stage(stage_idx, updater)
+                    finally:
+                        updater.stop_workers()
 
                 except KeyboardInterrupt:
                     reason = "User interrupt"
@@ -484,16 +507,22 @@ class TrainingLoop(object):
                     raise
 
                 finally:
-                    phys_memory_after = memory_usage(physical=True)
-                    gpu_memory_after = gpu_memory_usage()
+                    self.resource_monitor.stop()
+                    memory_after = self.resource_monitor.latest
+                    peaks = self.resource_monitor.reset_peaks()
+
+                    phys_memory_before = memory_before.get("memory_physical_mb", 0.0)
+                    gpu_memory_before = memory_before.get("memory_gpu_mb", 0.0)
 
                     self.data.record_values_for_stage(
                         stage_duration=time.time()-start,
                         phys_memory_before_mb=phys_memory_before,
-                        phys_memory_delta_mb=phys_memory_after - phys_memory_before,
+                        phys_memory_delta_mb=memory_after.get("memory_physical_mb", 0.0) - phys_memory_before,
                         gpu_memory_before_mb=gpu_memory_before,
-                        gpu_memory_delta_mb=gpu_memory_after - gpu_memory_before
+                        gpu_memory_delta_mb=memory_after.get("memory_gpu_mb", 0.0) - gpu_memory_before,
+                        n_resource_samples=self.resource_monitor.n_samples,
                     )
+                    self.data.record_values_for_stage(**{"peak_" + k: v for k, v in peaks.items()})
 
                     self.data.record_values_for_stage(reason=reason)
 
@@ -510,6 +539,7 @@ class TrainingLoop(object):
                     do_final_testing = (
                         "Exception occurred" not in reason
                         and reason != "Time limit exceeded"
+                        and reason != "Memory ceiling exceeded"
                         and 'best_path' in self.data.current_stage_record)
 
                     if do_final_testing:
@@ -567,6 +597,11 @@ class TrainingLoop(object):
                     stage_idx += 1
                     self.curriculum_complete.append(stage_config)
 
+                if reason == "Memory ceiling exceeded":
+                    print("Memory ceiling of {}mb exceeded on stage {} of the curriculum, "
+                          "terminating.".format(cfg.memory_ceiling_mb, stage_idx))
+                    break
+
                 if not (threshold_reached or cfg.power_through):
                     print("Failed to reach stopping criteria threshold on stage {} "
                           "of the curriculum, terminating.".format(stage_idx))
@@ -623,6 +658,10 @@ class TrainingLoop(object):
                 reason = "Maximum number of experiences-per-stage reached"
                 break
 
+            if self.resource_monitor.ceiling_reached.is_set():
+                reason = "Memory ceiling exceeded"
+                break
+
             local_step = updater.n_updates
             global_step = self.global_step
 
@@ -666,6 +705,7 @@ class TrainingLoop(object):
                 print("\nMy PID: {}\n".format(os.getpid()))
                 print("Physical memory use: {}mb".format(memory_usage(physical=True)))
                 print("Virtual memory use: {}mb".format(memory_usage(physical=False)))
+                print("Resource usage (latest sample): {}".format(pformat(self.resource_monitor.latest)))
 
                 print("Avg time per update: {}s".format(time_per_update))
                 print("Avg time per eval: {}s".format(time_per_eval))
@@ -744,23 +784,29 @@ class TrainingLoop(object):
 
                 _old_n_experiences = updater.n_experiences
 
-                update_record = updater.update(cfg.batch_size)
+                if self.trace_step(local_step):
+                    with SessionRunTracer() as tracer:
+                        update_record = updater.update(cfg.batch_size)
+                else:
+                    tracer = None
+                    update_record = updater.update(cfg.batch_size)
 
                 update_duration = time.time() - update_start_time
                 update_record["train"]["duration"] = update_duration
 
-                if local_step % 100 == 0:
-                    print("Done update step.")
+                if tracer is not None:
+                    self.data.store_trace(stage_idx, local_step, tracer, cfg.get('trace_top_k', 20))
 
                 if local_step % 100 == 0:
-                    start = time.time()
-                    update_record["train"]["memory_physical_mb"] = memory_usage(physical=True)
-                    update_record["train"]["memory_virtual_mb"] = memory_usage(physical=False)
-                    update_record["train"]["memory_gpu_mb"] = gpu_memory_usage()
-                    print("Memory check duration: {}".format(time.time() - start))
+                    print("Done update step.")
 
                 data_to_store.extend(dict(update_record).items())
 
+                if local_step % 100 == 0:
+                    # Sampled in the background by `self.resource_monitor`, so this doesn't block. Stored as a
+                    # separate record since its keys vary by machine and it is only present on some steps.
+                    data_to_store.append(("resources", dict(self.resource_monitor.latest)))
+
                 n_experiences_delta = updater.n_experiences - _old_n_experiences
                 self.n_global_experiences += n_experiences_delta
 
@@ -929,8 +975,11 @@ class _TrainingLoopData(FrozenTrainingLoopData):
 
     """
     def setup(self):
-        # Record training session environment for later diagnostic purposes
-        self.record_environment(config=cfg)
+        # Record training session environment for later diagnostic purposes. Done in the background
+        # so as not to delay the start of training; joined in `TrainingLoop.run` before returning.
+        self.environment_thread = self.record_environment(
+            config=cfg, environment_key=cfg.get('environment_key', None),
+            cache_dir=cfg.get('environment_cache_dir', None), background=True)
         self.curriculum = []
 
         self.make_directory('weights')
@@ -942,6 +991,7 @@ class _TrainingLoopData(FrozenTrainingLoopData):
 
         self.data = defaultdict(list)
         self.summary_writers = {}
+        self.summary_buffers = {}
 
         self.stage_idx = -1
 
@@ -953,9 +1003,25 @@ class _TrainingLoopData(FrozenTrainingLoopData):
         self.history.append(dict(stage_idx=stage_idx, stage_config=stage_config))
         self.stage_idx = stage_idx
         self.summary_writers = {}
+        self.summary_buffers = {}
 
     def end_stage(self, local_step=None):
         self.dump_data(local_step)
+
+        for buf in self.summary_buffers.values():
+            buf.flush()
+
+        if self.summary_buffers:
+            n_steps = sum(buf.n_steps for buf in self.summary_buffers.values())
+            duration = sum(buf.duration for buf in self.summary_buffers.values())
+            self.record_values_for_stage(
+                summary_duration=duration,
+                summary_write_duration=sum(buf.write_duration for buf in self.summary_buffers.values()),
+                summary_time_per_step=duration / max(n_steps, 1),
+                n_summary_steps=n_steps,
+                n_summary_events=sum(buf.n_events for buf in self.summary_buffers.values()),
+            )
+
         for writer in self.summary_writers.values():
             writer.close()
 
@@ -998,13 +1064,29 @@ class _TrainingLoopData(FrozenTrainingLoopData):
 
             self.store_scalar_summaries(mode, record, n_global_experiences)
 
+    def store_trace(self, stage_idx, local_step, tracer, top_k):
+        """ Write Chrome-trace timelines (viewable at chrome://tracing) and a summary of the most
+            expensive ops for a traced step. """
+        for i, trace in enumerate(tracer.chrome_traces()):
+            path = self.path_for('traces/stage{}/localstep={}_run={}.json'.format(stage_idx, local_step, i))
+            with open(path, 'w') as f:
+                f.write(trace)
+
+        summary = tracer.summarize(top_k)
+        with open(self.path_for('traces/stage{}/localstep={}_top_ops.txt'.format(stage_idx, local_step)), 'w') as f:
+            f.write(summary)
+
+        print("Traced {} session runs on step {}, top {} ops by time:".format(
+            len(tracer.run_metadata), local_step, top_k))
+        print(summary)
+
     def store_scalar_summaries(self, mode, record, n_global_experiences):
-        # Build a summary using the Summary protocol buffer
-        # See https://stackoverflow.com/questions/37902705/how-to-manually-create-a-tf-summary
-        summary_values = [tf.Summary.Value(tag="all/"+k, simple_value=float(v)) for k, v in record.items()]
-        summary = tf.Summary(value=summary_values)
-        writer = self._get_summary_writer(mode)
-        writer.add_summary(summary, n_global_experiences)
+        if mode not in self.summary_buffers:
+            self.summary_buffers[mode] = ScalarSummaryBuffer(
+                self._get_summary_writer(mode),
+                flush_step=cfg.get('summary_flush_step', 1),
+                downsample=cfg.get('summary_downsample', False))
+        self.summary_buffers[mode].add(record, n_global_experiences)
 
     def _get_summary_writer(self, mode):
         if mode not in self.summary_writers:
@@ -1098,6 +1180,87 @@ class _TrainingLoopData(FrozenTrainingLoopData):
         print()
 
 
+class ScalarSummaryBuffer(object):
+    """ Buffers scalar summaries for a single summary writer, writing them out in batches.
+
+    Parameters
+    ----------
+    writer: tf.summary.FileWriter
+        Writer that buffered summaries are eventually passed to.
+    flush_step: int
+        Summaries are written to `writer` every `flush_step` calls to `add`.
+    downsample: bool
+        If True, each flush writes a single event containing the running mean of each scalar since
+        the previous flush, labelled with the most recent step. Otherwise, each flush merges all
+        buffered records that share a step into a single event, and writes one event per step.
+
+    """
+    def __init__(self, writer, flush_step=1, downsample=False):
+        self.writer = writer
+        self.flush_step = max(int(flush_step), 1)
+        self.downsample = downsample
+
+        self._records = []
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._last_step = None
+
+        # Profiling info: time spent in `add` and `flush`, time of that spent inside the
+        # writer, and how many events were actually written.
+        self.duration = 0.0
+        self.write_duration = 0.0
+        self.n_steps = 0
+        self.n_events = 0
+
+    def add(self, record, step):
+        start = time.time()
+
+        if self.downsample:
+            for k, v in record.items():
+                self._sums[k] += float(v)
+                self._counts[k] += 1
+            self._last_step = step
+        else:
+            self._records.append((step, record))
+
+        self.n_steps += 1
+        self.duration += time.time() - start
+
+        if self.n_steps % self.flush_step == 0:
+            self.flush()
+
+    def flush(self):
+        start = time.time()
+
+        if self.downsample:
+            if self._counts:
+                values = {k: self._sums[k] / self._counts[k] for k in self._counts}
+                self._write(values, self._last_step)
+                self._sums = defaultdict(float)
+                self._counts = defaultdict(int)
+        else:
+            merged = OrderedDict()
+            for step, record in self._records:
+                merged.setdefault(step, {}).update(record)
+            for step, record in merged.items():
+                self._write(record, step)
+            self._records = []
+
+        self.duration += time.time() - start
+
+    def _write(self, record, step):
+        # Build a summary using the Summary protocol buffer
+        # See https://stackoverflow.com/questions/37902705/how-to-manually-create-a-tf-summary
+        summary_values = [tf.Summary.Value(tag="all/"+k, simple_value=float(v)) for k, v in record.items()]
+        summary = tf.Summary(value=summary_values)
+
+        start = time.time()
+        self.writer.add_summary(summary, step)
+        self.write_duration += time.time() - start
+
+        self.n_events += 1
+
+
 class Hook(object):
     """ Hook called throughout training.
 
@@ -40,16 +40,55 @@ class Updater(with_metaclass(abc.ABCMeta, Parameterized)):
     def _build_graph(self):
         raise Exception("NotImplemented")
 
+    @property
+    def has_mpi_workers(self):
+        """ True if this updater is in the master process of a group of MPI processes. """
+        return self.mpi_context is not None and self.mpi_context.n_procs > 1 and self.mpi_context.rank == 0
+
+    @property
+    def data_parallel(self):
+        """ True if every process in the MPI context must run `update` in lockstep with the master process,
+            e.g. because gradients are averaged across processes. """
+        return False
+
+    def worker_code(self):
+        """ Run by MPI worker processes (see `dps.mpi_train`). If the updater is data-parallel, performs updates
+            in lockstep with the master process, which broadcasts a command before each update. Returns once the
+            master process says to stop. """
+        comm = self.mpi_context.merged_comm
+
+        while True:
+            command, batch_size = comm.bcast(None, root=0)
+
+            if command == "stop":
+                break
+            elif command == "update":
+                self.update(batch_size)
+            else:
+                raise Exception("Unknown command from master process: {}".format(command))
+
+    def stop_workers(self):
+        """ Called by the master process at the end of a stage, to end `worker_code` in the worker processes. """
+        if self.has_mpi_workers:
+            self.mpi_context.merged_comm.bcast(("stop", None), root=0)
+
     def update(self, batch_size):
+        if self.has_mpi_workers and self.data_parallel:
+            self.mpi_context.merged_comm.bcast(("update", batch_size), root=0)
+
         update_result = self._update(batch_size)
 
         sess = tf.get_default_session()
         sess.run(self.inc_global_step_op)
-        self._n_experiences += batch_size
+        self._n_experiences += self._n_experiences_in_update(batch_size)
         self._n_updates += 1
 
         return update_result
 
+    def _n_experiences_in_update(self, batch_size):
+        """ Number of experiences learned from by the most recent call to `_update`. """
+        return batch_size
+
     @abc.abstractmethod
     def _update(self, batch_size):
         raise Exception("NotImplemented")
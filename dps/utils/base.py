@@ -8,6 +8,7 @@ import os
 import traceback
 import pdb
 from collections.abc import MutableMapping
+from collections import defaultdict
 import subprocess
 import copy
 import datetime
@@ -25,6 +26,8 @@ from zipfile import ZipFile
 import importlib
 import json
 import gc
+import threading
+import platform
 import matplotlib.pyplot as plt
 from matplotlib import animation
 import imageio
@@ -589,6 +592,79 @@ def pip_freeze(**kwargs):
     return _run_cmd('pip freeze')
 
 
+_environment_context_cache = {}
+_environment_context_lock = threading.Lock()
+
+
+def environment_context(git_diff=True, key=None, cache_dir=None):
+    """ Get a description of the host environment, suitable for storing alongside experimental results.
+
+    Computing the description requires shelling out to git, uname, lscpu and pip, so it is computed at most
+    once per process for each value of (`git_diff`, `key`). If `key` and `cache_dir` are both supplied,
+    the description is additionally cached on disk in `cache_dir`, so that other processes on the same host
+    using the same `key` (e.g. all runs in a hyper-parameter search) can reuse it. `key` should change
+    whenever the environment might have changed (e.g. one key per search); without a key, nothing is
+    cached on disk, since the code being run may have been modified between processes.
+
+    Returns
+    -------
+    context: dict (str -> str)
+        Maps from file names to contents.
+    context_hash: str
+        sha256 hash of the contents of `context`.
+
+    """
+    fingerprint = hashlib.sha256(
+        repr((platform.node(), sys.executable, bool(git_diff), key)).encode()).hexdigest()
+
+    with _environment_context_lock:
+        if fingerprint in _environment_context_cache:
+            return _environment_context_cache[fingerprint]
+
+        cache_path = None
+        if key is not None and cache_dir is not None:
+            cache_path = os.path.join(cache_dir, fingerprint + ".json")
+
+        result = None
+
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    result = tuple(json.load(f))
+            except Exception:
+                result = None
+
+        if result is None:
+            context = {
+                "git_summary.txt": summarize_git_repos(diff=git_diff),
+                "uname.txt": _run_shell("uname -a"),
+                "lscpu.txt": _run_shell("lscpu"),
+                "pip_freeze.txt": pip_freeze(),
+            }
+
+            context_hash = hashlib.sha256()
+            for filename in sorted(context):
+                context_hash.update(filename.encode())
+                context_hash.update(context[filename].encode())
+            result = (context, context_hash.hexdigest())
+
+            if cache_path is not None:
+                # Write to a temporary file and then move, so that concurrent readers never see partial files.
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+                with open(tmp_path, 'w') as f:
+                    json.dump(result, f)
+                os.replace(tmp_path, cache_path)
+
+        _environment_context_cache[fingerprint] = result
+        return result
+
+
+def _run_shell(cmd):
+    p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return p.stdout.decode()
+
+
 def one_hot(indices, depth):
     array = np.zeros(indices.shape + (depth,))
     batch_indices = np.unravel_index(range(indices.size), indices.shape)
@@ -758,24 +834,56 @@ class ExperimentDirectory(object):
         os.makedirs(full_path, exist_ok=exist_ok)
         return full_path
 
-    def record_environment(self, config=None, dill_recurse=False, git_diff=True):
-        with open(self.path_for('context/git_summary.txt'), 'w') as f:
-            f.write(summarize_git_repos(diff=git_diff))
+    def record_environment(
+            self, config=None, dill_recurse=False, git_diff=True,
+            environment_key=None, cache_dir=None, background=False):
+        """ Record information about the environment the experiment is run in.
+
+        Host-level context (git summary, uname, lscpu, pip freeze) is obtained from
+        `environment_context`, so it is computed at most once per process and `environment_key`.
+
+        Parameters
+        ----------
+        config: Config or None
+            If supplied, stored as both config.pkl and config.json.
+        environment_key: hashable or None
+            Passed to `environment_context`.
+        cache_dir: str or None
+            Passed to `environment_context`.
+        background: bool
+            If True, the work is done in a background thread, which is returned; the caller is responsible
+            for joining it before the process exits. A snapshot of `config` is taken before returning,
+            so later modifications to `config` are not recorded.
+
+        """
+        environ = {k.decode(): v.decode() for k, v in os.environ._data.items()}
 
-        uname_path = self.path_for("context/uname.txt")
-        subprocess.run("uname -a > {}".format(uname_path), shell=True)
+        if background:
+            if config is not None:
+                config = config.freeze()
 
-        lscpu_path = self.path_for("context/lscpu.txt")
-        subprocess.run("lscpu > {}".format(lscpu_path), shell=True)
+            thread = threading.Thread(
+                target=self._record_environment,
+                args=(environ, config, dill_recurse, git_diff, environment_key, cache_dir),
+                name="dps-record-environment")
+            thread.start()
+            return thread
+        else:
+            self._record_environment(environ, config, dill_recurse, git_diff, environment_key, cache_dir)
+
+    def _record_environment(self, environ, config, dill_recurse, git_diff, environment_key, cache_dir):
+        context, context_hash = environment_context(git_diff=git_diff, key=environment_key, cache_dir=cache_dir)
+
+        for filename, contents in context.items():
+            with open(self.path_for('context', filename), 'w') as f:
+                f.write(contents)
+
+        with open(self.path_for('context/environment_hash.txt'), 'w') as f:
+            f.write(context_hash)
 
-        environ = {k.decode(): v.decode() for k, v in os.environ._data.items()}
         with open(self.path_for('context/os_environ.txt'), 'w') as f:
             f.write(pformat(environ))
 
-        pip = pip_freeze()
-        with open(self.path_for('context/pip_freeze.txt'), 'w') as f:
-            f.write(pip)
-
         if config is not None:
             with open(self.path_for('config.pkl'), 'wb') as f:
                 dill.dump(config, f, protocol=dill.HIGHEST_PROTOCOL, recurse=dill_recurse)
@@ -976,6 +1084,180 @@ def memory_usage(physical=False):
         return info.vms / float(2 ** 20)
 
 
+class ResourceMonitor(object):
+    """ Samples resource usage of the current process from a background thread.
+
+    Samples physical memory (RSS), per-thread-pool CPU utilization, number of open file descriptors
+    and, if requested and available, GPU memory. The step loop never blocks on sampling; it only reads
+    the most recent sample (`latest`) and the running peaks (`peaks`), and can cheaply poll
+    `ceiling_reached` to find out whether RSS has exceeded `memory_ceiling_mb`.
+
+    Threads are grouped into pools by their name with any trailing digits removed (e.g. tensorflow names
+    the threads in each of its pools identically), and CPU utilization is reported in units of cores.
+
+    Parameters
+    ----------
+    interval: float
+        Seconds between samples.
+    memory_ceiling_mb: float or None
+        If RSS exceeds this value, the `ceiling_reached` event is set.
+    gpu: bool
+        Whether to sample GPU memory. GPU memory is queried via nvidia-smi, which is
+        comparatively expensive, so it is sampled only every `gpu_interval` seconds, and
+        is disabled entirely the first time that nvidia-smi cannot be run.
+    gpu_interval: float
+        Seconds between GPU memory samples.
+
+    """
+    def __init__(self, interval=1.0, memory_ceiling_mb=None, gpu=False, gpu_interval=10.0):
+        self.interval = interval
+        self.memory_ceiling_mb = memory_ceiling_mb
+        self.gpu = gpu and shutil.which("nvidia-smi") is not None
+        self.gpu_interval = gpu_interval
+
+        self.process = psutil.Process(os.getpid())
+        self.ceiling_reached = threading.Event()
+
+        self.latest = {}
+        self.peaks = {}
+        self.n_samples = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._last_thread_times = None
+        self._last_sample_time = None
+        self._last_gpu_time = -np.inf
+        self._gpu_memory_mb = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self.sample()
+            self._thread = threading.Thread(target=self._run, name="dps-resource-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.sample()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, tb):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                traceback.print_exc()
+
+    def reset_peaks(self):
+        """ Return peak values observed since the previous call, and start tracking new peaks. """
+        with self._lock:
+            peaks = self.peaks
+            self.peaks = dict(self.latest)
+        return peaks
+
+    def sample(self):
+        """ Take a single sample; called periodically from the monitoring thread. """
+        now = time.time()
+
+        record = {}
+        memory_info = self.process.memory_info()
+        record["memory_physical_mb"] = memory_info.rss / float(2 ** 20)
+        record["memory_virtual_mb"] = memory_info.vms / float(2 ** 20)
+
+        try:
+            record["n_open_fds"] = self.process.num_fds()
+        except AttributeError:
+            # num_fds is not available on Windows.
+            pass
+
+        thread_times = self._thread_cpu_times()
+        record["n_threads"] = len(thread_times)
+
+        if self._last_thread_times is not None:
+            elapsed = max(now - self._last_sample_time, 1e-6)
+
+            utilization = defaultdict(float)
+            for tid, (pool, cpu_time) in thread_times.items():
+                prev = self._last_thread_times.get(tid, (pool, 0.0))[1]
+                utilization[pool] += max(cpu_time - prev, 0.0) / elapsed
+
+            record["cpu_cores"] = sum(utilization.values())
+            for pool, u in utilization.items():
+                record["cpu_cores/" + pool] = u
+
+        self._last_thread_times = thread_times
+        self._last_sample_time = now
+
+        if self.gpu and now - self._last_gpu_time >= self.gpu_interval:
+            self._last_gpu_time = now
+            self._gpu_memory_mb = self._sample_gpu_memory()
+
+        if self.gpu:
+            record["memory_gpu_mb"] = self._gpu_memory_mb
+
+        with self._lock:
+            self.latest = record
+            for k, v in record.items():
+                self.peaks[k] = max(self.peaks.get(k, v), v)
+            self.n_samples += 1
+
+        if self.memory_ceiling_mb is not None and record["memory_physical_mb"] > self.memory_ceiling_mb:
+            self.ceiling_reached.set()
+
+        return record
+
+    def _thread_cpu_times(self):
+        """ Return a dict mapping from thread id to (pool name, cpu seconds used). """
+        task_dir = "/proc/{}/task".format(self.process.pid)
+        if os.path.isdir(task_dir):
+            ticks = os.sysconf("SC_CLK_TCK")
+            times = {}
+            for tid in os.listdir(task_dir):
+                try:
+                    with open(os.path.join(task_dir, tid, "stat"), "r") as f:
+                        stat = f.read()
+                except IOError:
+                    continue  # Thread exited
+
+                # Thread name is surrounded by parentheses and may itself contain spaces.
+                name = stat[stat.index("(")+1:stat.rindex(")")]
+                fields = stat[stat.rindex(")")+2:].split()
+                utime, stime = int(fields[11]), int(fields[12])
+                times[int(tid)] = (name.rstrip("0123456789_-") or name, (utime + stime) / ticks)
+            return times
+
+        return {t.id: ("all", t.user_time + t.system_time) for t in self.process.threads()}
+
+    def _sample_gpu_memory(self):
+        command = "nvidia-smi --query-compute-apps=pid,used_memory --format=csv,noheader,nounits".split()
+        try:
+            p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=10, check=True)
+        except Exception:
+            self.gpu = False
+            return 0.0
+
+        total = 0.0
+        for line in p.stdout.decode().split('\n'):
+            tokens = [t.strip() for t in line.split(',')]
+            if len(tokens) == 2 and tokens[0] == str(self.process.pid):
+                try:
+                    total += float(tokens[1])
+                except ValueError:
+                    pass
+        return total
+
+
 # Character used for ascii art, sorted in order of increasing sparsity
 ascii_art_chars = \
     "$@B%8&WM#*oahkbdpqwmZO0QLCJUYXzcvunxrjft/|()1{}[]?-_+~<>i!lI;:,\"^`'. "
@@ -1638,6 +1920,7 @@ def update_scratch_dir(config, new_scratch_dir):
     fixup_dir("local_experiments")
     fixup_dir("parallel_experiments_build")
     fixup_dir("parallel_experiments_run")
+    fixup_dir("environment_cache")
 
 
 config_template = """
@@ -1711,6 +1994,7 @@ def _load_system_config(key=None):
     fixup_dir("local_experiments")
     fixup_dir("parallel_experiments_build")
     fixup_dir("parallel_experiments_run")
+    fixup_dir("environment_cache")
 
     return config
 
@@ -1632,7 +1632,18 @@ def eval_schedule(schedule):
 
 
 class Schedule(object):
-    pass
+    """ A value that changes as a function of the global step.
+
+    `build` creates a tensor giving the value as a function of a step tensor, while `value`
+    computes the same thing in numpy, for when the step is known on the host and a session
+    round trip is not wanted.
+
+    """
+    def build(self, t):
+        raise Exception("NotImplemented")
+
+    def value(self, t):
+        raise Exception("NotImplemented")
 
 
 class RepeatSchedule(Schedule):
@@ -1643,6 +1654,9 @@ class RepeatSchedule(Schedule):
     def build(self, t):
         return self.schedule.build(t % self.period)
 
+    def value(self, t):
+        return self.schedule.value(t % self.period)
+
 
 class Exponential(Schedule):
     def __init__(self, start, end, decay_steps, decay_rate, staircase=False, log=False):
@@ -1669,6 +1683,18 @@ class Exponential(Schedule):
 
         return value
 
+    def value(self, t):
+        if self.staircase:
+            t = np.floor_divide(t, self.decay_steps).astype('f')
+        else:
+            t = np.true_divide(t, self.decay_steps)
+        value = (self.start - self.end) * (self.decay_rate ** t) + self.end
+
+        if self.log:
+            value = np.log(value + 1e-6)
+
+        return value
+
 
 class Exp(Exponential):
     pass
@@ -1689,6 +1715,10 @@ class Polynomial(Schedule):
         t = tf.minimum(tf.cast(self.decay_steps, tf.int64), t)
         return (self.start - self.end) * ((1 - t / self.decay_steps) ** self.power) + self.end
 
+    def value(self, t):
+        t = np.minimum(self.decay_steps, t)
+        return (self.start - self.end) * ((1 - t / self.decay_steps) ** self.power) + self.end
+
 
 class Poly(Polynomial):
     pass
@@ -1713,13 +1743,23 @@ class Reciprocal(Schedule):
             t = t / self.decay_steps
         return ((self.start - self.end) / (1 + t))**self.gamma + self.end
 
+    def value(self, t):
+        if self.staircase:
+            t = np.floor_divide(t, self.decay_steps).astype('f')
+        else:
+            t = np.true_divide(t, self.decay_steps)
+        return ((self.start - self.end) / (1 + t))**self.gamma + self.end
+
 
 class Constant(Schedule):
     def __init__(self, value):
-        self.value = value
+        self._value = value
 
     def build(self, t):
-        return tf.constant(self.value)
+        return tf.constant(self._value)
+
+    def value(self, t):
+        return self._value + np.zeros_like(t, dtype='f')
 
 
 # class MixtureSchedule(Schedule):
@@ -1839,13 +1879,56 @@ def masked_mean(array, mask, axis=None, keepdims=False):
     return tf.reduce_sum(array * mask, axis=axis) / denom
 
 
+def mpi_allreduce_mean(tensor, comm):
+    """ Average a 1-D tensor over all processes in MPI communicator `comm`.
+
+    The reduction is performed by a `py_func`, so every process must run the returned
+    tensor the same number of times, or the processes will deadlock.
+
+    """
+    from mpi4py import MPI
+
+    n_procs = comm.Get_size()
+
+    def _allreduce_mean(local):
+        total = np.zeros_like(local)
+        comm.Allreduce(local, total, op=MPI.SUM)
+        return total / n_procs
+
+    reduced = tf.py_func(_allreduce_mean, [tensor], tensor.dtype, stateful=True, name="mpi_allreduce_mean")
+    reduced.set_shape(tensor.shape)
+    return reduced
+
+
+def mpi_broadcast_variables(variables, comm, root=0):
+    """ Set `variables` in every process in MPI communicator `comm` to their values in process `root`.
+        Builds ops, so should only be called a small number of times per graph. """
+    sess = tf.get_default_session()
+
+    flat = sess.run(lst_to_vec(variables))
+    comm.Bcast(flat, root=root)
+
+    flat_input = tf.placeholder(flat.dtype, flat.shape)
+    assign = tf.group(*[v.assign(p) for v, p in zip(variables, vec_to_lst(flat_input, variables))])
+    sess.run(assign, feed_dict={flat_input: flat})
+
+
 def build_gradient_train_op(
         loss, tvars, optimizer_spec, lr_schedule, max_grad_norm=None,
-        noise_schedule=None, global_step=None, record_prefix=None):
-    """ By default, `global_step` is None, so the global step is not incremented. """
+        noise_schedule=None, global_step=None, record_prefix=None, mpi_comm=None):
+    """ By default, `global_step` is None, so the global step is not incremented.
 
+    If `mpi_comm` is an MPI communicator with more than one process, the gradients computed by each process
+    are flattened into a single vector and averaged over all processes before being processed and applied,
+    so every process in `mpi_comm` must run the returned train op in lockstep.
+
+    """
     pure_gradients = tf.gradients(loss, tvars)
 
+    if mpi_comm is not None and mpi_comm.Get_size() > 1:
+        pure_gradients = [tf.zeros_like(v) if g is None else g for g, v in zip(pure_gradients, tvars)]
+        pure_gradients = vec_to_lst(mpi_allreduce_mean(lst_to_vec(pure_gradients), mpi_comm), tvars)
+
     clipped_gradients = pure_gradients
     if max_grad_norm is not None and max_grad_norm > 0.0:
         clipped_gradients, _ = tf.clip_by_global_norm(pure_gradients, max_grad_norm)
@@ -1919,6 +2002,35 @@ def tf_roll(a, n, axis=0, fill=None, reverse=False):
     return r
 
 
+def unrolled_while_loop(cond, body, loop_vars, unroll=1, guard=True, **kwargs):
+    """ A tf.while_loop in which each iteration applies `body` up to `unroll` times.
+
+    Fewer iterations means less per-iteration control-flow overhead. If `guard` is True, every application
+    of `body` after the first in an iteration is wrapped in a tf.cond on `cond`, so the result is the same
+    as for a plain tf.while_loop. If False, `body` is applied exactly `unroll` times per iteration, which is
+    only correct when the number of iterations is known to be a multiple of `unroll`.
+
+    Extra keyword arguments (e.g. `parallel_iterations`, `shape_invariants`) are passed on to tf.while_loop.
+
+    """
+    if unroll < 1:
+        raise Exception("`unroll` must be at least 1, got {}.".format(unroll))
+
+    def unrolled_body(*loop_vars):
+        loop_vars = body(*loop_vars)
+        for k in range(1, unroll):
+            if guard:
+                loop_vars = tf.cond(
+                    cond(*loop_vars),
+                    lambda loop_vars=loop_vars: tuple(body(*loop_vars)),
+                    lambda loop_vars=loop_vars: tuple(loop_vars))
+            else:
+                loop_vars = body(*loop_vars)
+        return tuple(loop_vars)
+
+    return tf.while_loop(cond, unrolled_body, loop_vars, **kwargs)
+
+
 def tf_discount_matrix(base, T, n=None):
     x = tf.cast(tf.range(T), tf.float32)
     r = (x - x[:, None])
@@ -1928,6 +2040,100 @@ def tf_discount_matrix(base, T, n=None):
     return tf.matrix_band_part(r, 0, -1)
 
 
+class SessionRunTracer(object):
+    """ Context manager that runs every `session.run` call made inside the block with full tracing.
+
+    Works by temporarily shadowing the `run` method of the session, so code that does not know about
+    tracing (e.g. updaters, which just call `tf.get_default_session().run`) gets traced as well.
+    One `RunMetadata` is stored for each `run` call.
+
+    Parameters
+    ----------
+    session: tf.Session
+        Session to trace. Defaults to the default session.
+
+    """
+    def __init__(self, session=None):
+        self.session = session
+        self.run_metadata = []
+
+    def __enter__(self):
+        if self.session is None:
+            self.session = tf.get_default_session()
+
+        session = self.session
+        self._shadowed = session.__dict__.get('run', None)
+        original_run = session.run
+
+        def run(fetches, feed_dict=None, options=None, run_metadata=None):
+            if options is None:
+                options = tf.RunOptions()
+            else:
+                _options = tf.RunOptions()
+                _options.CopyFrom(options)
+                options = _options
+            options.trace_level = tf.RunOptions.FULL_TRACE
+
+            if run_metadata is None:
+                run_metadata = tf.RunMetadata()
+
+            result = original_run(fetches, feed_dict=feed_dict, options=options, run_metadata=run_metadata)
+            self.run_metadata.append(run_metadata)
+            return result
+
+        session.run = run
+        return self
+
+    def __exit__(self, type_, value, tb):
+        if self._shadowed is None:
+            del self.session.run
+        else:
+            self.session.run = self._shadowed
+
+    def chrome_traces(self):
+        """ Return one Chrome-trace timeline (a json string) per traced `run` call. """
+        from tensorflow.python.client import timeline
+        return [
+            timeline.Timeline(md.step_stats).generate_chrome_trace_format()
+            for md in self.run_metadata]
+
+    def op_times(self):
+        """ Total time (in ms) spent in each op, summed over all traced `run` calls.
+
+        Returns a list of tuples (op_name, op_type, total_ms, n_calls), sorted by decreasing time.
+
+        """
+        totals = defaultdict(float)
+        counts = defaultdict(int)
+        op_types = {}
+
+        for md in self.run_metadata:
+            for dev_stats in md.step_stats.dev_stats:
+                for node_stats in dev_stats.node_stats:
+                    name = node_stats.node_name
+                    totals[name] += node_stats.all_end_rel_micros / 1000.
+                    counts[name] += 1
+
+                    # Labels have the form "name = OpType(inputs)".
+                    label = node_stats.timeline_label
+                    if ' = ' in label:
+                        op_types[name] = label.split(' = ')[1].split('(')[0]
+                    else:
+                        op_types.setdefault(name, name)
+
+        records = [(name, op_types[name], totals[name], counts[name]) for name in totals]
+        return sorted(records, key=lambda r: r[2], reverse=True)
+
+    def summarize(self, top_k=20):
+        """ Return a string giving a table of the `top_k` ops that took the most time. """
+        records = self.op_times()
+        total_ms = sum(r[2] for r in records)
+        table = [
+            [name, op_type, ms, 100 * ms / max(total_ms, 1e-6), n]
+            for name, op_type, ms, n in records[:top_k]]
+        return tabulate(table, headers=["op", "type", "ms", "%", "n_calls"], tablefmt="psql")
+
+
 class RenderHook(object):
     N = 16
 
@@ -19,6 +19,7 @@ setup(
     entry_points={
         'console_scripts': ['dps-hyper=dps.hyper.command_line:dps_hyper_cl',
                             'dps-run=dps.run:run',
+                            'dps-benchmark=dps.benchmark:benchmark_cl',
                             'readme=dps.utils.base:view_readme_cl',
                             'tf-inspect=dps.utils.tf:tf_inspect_cl',
                             'report-to-videos=dps.utils.html_report:report_to_videos_cl']